@@ -1,33 +1,78 @@
 import os
-import redis
-from flask import Flask
+import threading
+import time
+from flask import Flask, current_app, g, request
 from flask_cors import CORS
 from flask_session import Session
 from dotenv import load_dotenv
-from authlib.integrations.flask_client import OAuth
+
+from app.utils.metrics import REDIS_ROUND_TRIPS, REQUEST_SECONDS
+from app.utils.redis_client import get_redis, round_trips
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OAuth
-oauth = OAuth()
-google = oauth.register(
-    name="google",
-    client_id=os.getenv("GOOGLE_CLIENT_ID"),
-    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile", "prompt": "select_account"}
-)
+_oauth_lock = threading.Lock()
+
+
+def get_google():
+    """The Google OAuth client for the current app, registered on first login.
+
+    authlib (and the requests stack under it) is only needed by the login
+    routes, so it is imported here rather than when the app boots.
+    """
+    app = current_app._get_current_object()
+    oauth = app.extensions.get("authlib.integrations.flask_client")
+    if oauth is None:
+        with _oauth_lock:
+            oauth = app.extensions.get("authlib.integrations.flask_client")
+            if oauth is None:
+                from authlib.integrations.flask_client import OAuth
+
+                oauth = OAuth(app)
+                oauth.register(
+                    name="google",
+                    client_id=os.getenv("GOOGLE_CLIENT_ID"),
+                    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+                    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+                    client_kwargs={"scope": "openid email profile", "prompt": "select_account"}
+                )
+    return oauth.create_client("google")
+
+
+def after_fork():
+    """Forget connections, threads and child processes inherited from the parent.
+
+    With gunicorn's preload_app the master imports the app before forking;
+    everything below is created lazily, so normally none of it exists yet,
+    but a worker must never share a socket or a dead thread pool with it.
+    """
+    from app.utils import (
+        cache, generation, http_client, image_scrapper, jobs, llm, metrics, redis_client, renderer, subscriptions
+    )
+
+    redis_client.after_fork()
+    metrics.after_fork()
+    cache.after_fork()
+    subscriptions.after_fork()
+    http_client._client = http_client._async_client = http_client._fanout_executor = None
+    llm._client = None
+    renderer._pool = None
+    jobs._executor = None
+    generation._batch_executor = None
+    image_scrapper._executor = None
+    image_scrapper._inflight.clear()
+    image_scrapper._inflight_async.clear()
 
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.getenv("SECRET_KEY")
 
-    # Redis session setup
-    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+    # Redis session setup; Flask-Session stores binary payloads, so it gets the
+    # binary client from the shared pool manager.
     app.config.update(
         SESSION_TYPE="redis",
-        SESSION_REDIS=redis.from_url(redis_url),
+        SESSION_REDIS=get_redis(decode_responses=False),
         SESSION_PERMANENT=False,
         SESSION_USE_SIGNER=True,
         SESSION_COOKIE_SAMESITE="None",   
@@ -35,20 +80,41 @@ def create_app():
     )
     Session(app)
 
-    # CORS for API routes — explicitly allow your frontend origin
-    CORS(app, supports_credentials=True, origins=[os.getenv("FRONTEND_URL")])
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        # Excludes the session save, which Flask-Session performs after this hook,
+        # and the body of streamed responses.
+        endpoint = request.endpoint or "unmatched"
+        trips = round_trips()
+        response.headers["X-Redis-Round-Trips"] = str(trips)
+        REDIS_ROUND_TRIPS.observe(trips, endpoint=endpoint)
+        if "request_started" in g:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - g.request_started,
+                endpoint=endpoint, method=request.method, status=response.status_code
+            )
+        return response
 
+    # CORS for API routes — explicitly allow your frontend origin
+    # Paged listings return their next cursor in X-Next-Cursor.
+    CORS(app, supports_credentials=True, origins=[os.getenv("FRONTEND_URL")], expose_headers=["X-Next-Cursor"])
 
-    # ✅ OAuth must be initialized BEFORE blueprints are imported
-    oauth.init_app(app)
 
     # Route blueprints
     from app.routes.auth import bp as auth_bp
     from app.routes.mindmap import bp as mindmap_bp
     from app.routes.admin import bp as admin_bp
+    from app.routes.jobs import bp as jobs_bp
+    from app.routes.metrics import bp as metrics_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(mindmap_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(metrics_bp)
 
     return app
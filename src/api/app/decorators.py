@@ -5,7 +5,8 @@ import os
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
 
 def is_admin():
-    return session.get("user") == ADMIN_EMAIL
+    # With ADMIN_EMAIL unset nobody is an admin, not every visitor without a session.
+    return bool(ADMIN_EMAIL) and session.get("user") == ADMIN_EMAIL
 
 def admin_required(f):
     @wraps(f)
@@ -1,43 +1,61 @@
-from flask import Blueprint, request, jsonify, current_app as app
+from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 import logging
 
 from app.decorators import admin_required
-from app.utils.session import get_user_limit, update_last_active
-from app.utils.cache import clear_cached_map, list_all_cached_maps
+from app.utils.redis_client import get_redis, pool_stats
+from app.utils.session import (
+    users_page, user_counts, reset_mind_maps, unregister_user, rebuild_user_index, history_memory
+)
+from app.utils.cache import clear_cached_map, list_all_cached_maps, svg_cache_stats, topic_cache_stats, text_cache_stats
+from app.utils.singleflight import single_flight_stats
 
 bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 logger = logging.getLogger(__name__)
+r = get_redis()
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def _page_args():
+    cursor = request.args.get("cursor") or None
+    limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    return cursor, limit
+
+def _paged(items, next_cursor):
+    # Lists stay plain JSON arrays for existing clients; the cursor rides in a header.
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return response
 
 @bp.route("/sessions")
 @admin_required
 def admin_sessions():
-    keys = app.config["SESSION_REDIS"].keys("user:*")
+    rows, next_cursor = users_page(*_page_args())
     sessions = []
 
-    for key in keys:
-        email = key.decode().split("user:")[1]
-        data = app.config["SESSION_REDIS"].hgetall(key)
-        if b"google" not in data:
+    for email, data, maps_used in rows:
+        if "google" not in data:
             continue
 
-        last_active_str = data.get(b"last_active", b"").decode()
+        last_active_str = data.get("last_active", "")
         last_active = datetime.fromisoformat(last_active_str) if last_active_str else None
         online = last_active and datetime.utcnow() - last_active < timedelta(minutes=5)
 
         sessions.append({
             "email": email,
-            "name": data.get(b"name", b"").decode(),
-            "ip": data.get(b"ip", b"").decode(),
-            "agent": data.get(b"agent", b"").decode(),
-            "login_time": data.get(b"login_time", b"").decode(),
+            "name": data.get("name", ""),
+            "ip": data.get("ip", ""),
+            "agent": data.get("agent", ""),
+            "login_time": data.get("login_time", ""),
             "last_active": last_active_str,
             "status": "online" if online else "offline",
-            "mindMapsUsed": app.config["SESSION_REDIS"].hlen(f"user:{email}:mindmaps"),
-            "mindMapLimit": get_user_limit(email)
+            "mindMapsUsed": maps_used,
+            "mindMapLimit": int(data.get("limit", "5"))
         })
 
-    return jsonify(sessions)
+    return _paged(sessions, next_cursor)
 
 @bp.route("/terminate-session", methods=["POST"])
 @admin_required
@@ -46,55 +64,49 @@ def admin_terminate():
     if not email:
         return jsonify({"error": "Missing email"}), 400
 
-    session_id = app.config["SESSION_REDIS"].hget(f"user:{email}", "session_id")
-    app.config["SESSION_REDIS"].delete(f"user:{email}")
+    session_id = r.hget(f"user:{email}", "session_id")
+    r.delete(f"user:{email}")
+    unregister_user(email)
     if session_id:
-        app.config["SESSION_REDIS"].delete(f"session:{session_id.decode()}")
+        r.delete(f"session:{session_id}")
 
     return jsonify({"message": "Session terminated"})
 
 @bp.route("/stats")
 @admin_required
 def admin_stats():
-    keys = app.config["SESSION_REDIS"].keys("user:*")
-    total_users = 0
-    online_users = 0
-    total_maps = 0
-
-    for key in keys:
-        email = key.decode().split("user:")[1]
-        data = app.config["SESSION_REDIS"].hgetall(key)
-
-        if b"google" not in data:
-            continue
+    return jsonify(user_counts())
 
-        total_users += 1
-        last_active_str = data.get(b"last_active", b"").decode()
-        last_active = datetime.fromisoformat(last_active_str) if last_active_str else None
-        if last_active and datetime.utcnow() - last_active < timedelta(minutes=5):
-            online_users += 1
-
-        mindmaps_key = f"user:{email}:mindmaps"
-        total_maps += app.config["SESSION_REDIS"].hlen(mindmaps_key)
+@bp.route("/rebuild-user-index", methods=["POST"])
+@admin_required
+def admin_rebuild_user_index():
+    """Rebuild the user registry and map counter from the user keys.
 
-    return jsonify({
-        "totalUsers": total_users,
-        "onlineUsers": online_users,
-        "totalMindMaps": total_maps
-    })
+    Not needed after an upgrade (the first read backfills them); this is for
+    when they drift, e.g. after user keys were restored from a backup.
+    """
+    return jsonify(rebuild_user_index())
 
 @bp.route("/reset-mindmaps", methods=["POST"])
 @admin_required
 def reset_mindmaps():
     email = request.json.get("email")
-    app.config["SESSION_REDIS"].delete(f"user:{email}:mindmaps")
+    reset_mind_maps(email)
     return jsonify({"message": f"Mind maps for {email} reset."})
 
+@bp.route("/history-memory")
+@admin_required
+def admin_history_memory():
+    email = request.args.get("email")
+    if not email:
+        return jsonify({"error": "Missing email"}), 400
+    return jsonify(history_memory(email))
+
 @bp.route("/set-limit", methods=["POST"])
 @admin_required
 def admin_set_limit():
     email, limit = request.json.get("email"), request.json.get("limit")
-    app.config["SESSION_REDIS"].hset(f"user:{email}", "limit", limit)
+    r.hset(f"user:{email}", "limit", limit)
     return jsonify({"message": f"Limit set to {limit} for {email}."})
 
 @bp.route("/cached-maps", methods=["GET"])
@@ -113,6 +125,21 @@ def list_cache():
     maps = list_all_cached_maps()
     return jsonify({"maps": maps})
 
+@bp.route("/cache-stats", methods=["GET"])
+@admin_required
+def cache_stats():
+    return jsonify({
+        "topics": topic_cache_stats(),
+        "textMaps": text_cache_stats(),
+        "svg": svg_cache_stats(),
+        "singleFlight": single_flight_stats()
+    })
+
+@bp.route("/redis-pool", methods=["GET"])
+@admin_required
+def redis_pool():
+    return jsonify(pool_stats())
+
 @bp.route("/clear-cache", methods=["POST"])
 @admin_required
 def clear_cache():
@@ -154,25 +181,19 @@ def clear_cached_map_route():
 @admin_required
 def get_all_users():
     try:
-        keys = app.config["SESSION_REDIS"].keys("user:*")
+        rows, next_cursor = users_page(*_page_args())
         users = []
 
-        for key in keys:
-            key_str = key.decode()
-            if ":mindmaps" in key_str:
-                continue
-
-            email = key_str.replace("user:", "")
-            user_data = app.config["SESSION_REDIS"].hgetall(key)
+        for email, user_data, _ in rows:
             user = {
                 "email": email,
-                "name": user_data.get(b"name", b"").decode(),
-                "picture": user_data.get(b"picture", b"").decode(),
-                "limit": int(user_data.get(b"limit", b"5").decode())
+                "name": user_data.get("name", ""),
+                "picture": user_data.get("picture", ""),
+                "limit": int(user_data.get("limit", "5"))
             }
             users.append(user)
 
-        return jsonify(users)
+        return _paged(users, next_cursor)
     except Exception as e:
         logger.error(f"[ERROR] Failed to fetch all users: {e}")
         return jsonify({"error": "Failed to fetch users"}), 500
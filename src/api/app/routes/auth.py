@@ -1,5 +1,7 @@
 from flask import Blueprint, request, redirect, jsonify, session, current_app as app
-from app import oauth, google
+from app import get_google
+from app.utils.redis_client import get_redis
+from app.utils.session import register_user, update_last_active, get_user_profile, DEFAULT_LIMIT
 from datetime import datetime
 import os
 
@@ -9,35 +11,28 @@ REDIRECT_URI = os.getenv("REDIRECT_URI")
 bp = Blueprint("auth", __name__, url_prefix="/api")
 
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
-
-def update_last_active(email: str):
-    now = datetime.utcnow().isoformat()
-    app.config["SESSION_REDIS"].hset(f"user:{email}", "last_active", now)
-
-def get_user_limit(email: str) -> int:
-    key = f"user:{email}"
-    val = app.config["SESSION_REDIS"].hget(key, "limit")
-    return int(val.decode()) if val else 5
+r = get_redis()
 
 @bp.route("/google-login")
 def google_login():
-    return google.authorize_redirect(REDIRECT_URI)
+    return get_google().authorize_redirect(REDIRECT_URI)
 
 @bp.route("/google-callback")
 def google_callback():
+    google = get_google()
     token = google.authorize_access_token()
     user_info = google.get("https://openidconnect.googleapis.com/v1/userinfo").json()
     email = user_info["email"]
     redis_key = f"user:{email}"
 
-    if app.config["SESSION_REDIS"].hget(redis_key, "banned") == b"true":
+    if r.hget(redis_key, "banned") == "true":
         return redirect(f"{FRONTEND_URL}/?banned=true")
 
     session["user"] = email
     print(f"User {email} logged in, session set: {session.get('user')}")
     session_id = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
 
-    app.config["SESSION_REDIS"].hset(redis_key, mapping={
+    register_user(email, {
         "name": user_info.get("name", ""),
         "google": "true",
         "picture": user_info.get("picture", ""),
@@ -56,16 +51,15 @@ def get_user():
     if not email:
         return jsonify({"error": "Not logged in"}), 401
 
-    update_last_active(email)
-    data = app.config["SESSION_REDIS"].hgetall(f"user:{email}")
+    data = get_user_profile(email)
     return jsonify({
         "user": {
-            "name": data.get(b"name", b"").decode(),
+            "name": data.get("name", ""),
             "email": email,
-            "picture": data.get(b"picture", b"").decode()
+            "picture": data.get("picture", "")
         },
         "isAdmin": email == ADMIN_EMAIL,
-        "limit": get_user_limit(email)
+        "limit": int(data.get("limit", DEFAULT_LIMIT))
     })
 
 @bp.route("/logout", methods=["POST"])
@@ -0,0 +1,43 @@
+from flask import Blueprint, Response, jsonify, session, stream_with_context
+import json
+
+from app.utils.jobs import get_job, iter_job_states
+
+bp = Blueprint("jobs", __name__, url_prefix="/api/jobs")
+
+def _owned_job(job_id):
+    job = get_job(job_id)
+    if not job or job["owner"] != session.get("user"):
+        return None
+    job.pop("owner")
+    return job
+
+@bp.route("/<job_id>")
+def job_status(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    job = _owned_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@bp.route("/<job_id>/events")
+def job_events(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    if not _owned_job(job_id):
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        for job in iter_job_states(job_id):
+            if job is None:
+                yield ": keepalive\n\n"
+                continue
+            job.pop("owner", None)
+            yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
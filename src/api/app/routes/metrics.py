@@ -0,0 +1,24 @@
+from flask import Blueprint, Response, request, jsonify
+import hmac
+import os
+
+from app.decorators import is_admin
+from app.utils.metrics import render
+
+bp = Blueprint("metrics", __name__)
+
+# Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>"; admins can use their session.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+def _authorized():
+    if is_admin():
+        return True
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token, METRICS_TOKEN)
+
+@bp.route("/metrics")
+def metrics():
+    """Metrics totalled over every worker (see app.utils.metrics), whichever one answers."""
+    if not _authorized():
+        return jsonify({"error": "Unauthorized"}), 403
+    return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -1,59 +1,223 @@
-from flask import Blueprint, request, jsonify, session, current_app as app
-from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context, current_app as app
+import json
 import logging
+import os
+import re
 
-from app.utils.cache import get_cached_mind_map, cache_mind_map
-from app.utils.gemini import query_gemini, extract_mermaid_code, get_gemini_response
-from app.utils.svg import convert_mermaid_to_svg
-from app.utils.image_scrapper import scrape_images
-from app.utils.session import update_last_active, store_mind_map
+from app.utils.cache import get_svg_encodings
+from app.utils.generation import generate_mind_map, generate_mind_maps, rerender_svg, stream_mind_map
+from app.utils.image_scrapper import scrape_images, scrape_images_many
+from app.utils.jobs import submit_job, JobQueueFull
+from app.utils.llm import LLMUnavailable
+from app.utils.metrics import SVG_RESPONSE_BYTES, SVG_RESPONSES
+from app.utils.precompress import negotiate
+from app.utils.session import update_last_active, history_page, HISTORY_PAGE_SIZE
 
 bp = Blueprint("mindmap", __name__, url_prefix="/api")
 logger = logging.getLogger(__name__)
 
+# A cold image lookup keeps running in the background past this; the next view hits the cache.
+IMAGE_MISS_WAIT_SECONDS = float(os.getenv("IMAGE_MISS_WAIT_SECONDS", "4"))
+MAX_BATCH_TOPICS = 20
+MAX_BATCH_MAPS = int(os.getenv("MAX_BATCH_MAPS", "25"))
+MAX_HISTORY_PAGE_SIZE = 100
+# An svgId names one rendering of one map forever, so browsers may keep it as long as they like.
+SVG_CACHE_CONTROL = os.getenv("SVG_CACHE_CONTROL", "private, max-age=31536000, immutable")
+_SVG_ID = re.compile(r"[0-9a-f]{64}")
+
+def shape_result(result: dict, data: dict) -> dict:
+    # Clients that load the map from /api/svg/<svgId> can leave the inline copy out.
+    if data.get("inlineSvg") is False:
+        result.pop("svg", None)
+    return result
+
+def _generate_shaped(options: dict, *fields, on_progress=None) -> dict:
+    # Job entry point: the job result honours the same options as the sync response.
+    return shape_result(generate_mind_map(*fields, on_progress=on_progress), options)
+
+def _json_object():
+    # The routes read fields with .get, so a list, string or number body is a bad request.
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else None
+
+def _read_generate_request(data: dict):
+    topic, map_type, text = data.get("topic"), data.get("type"), data.get("text")
+    if not topic or not map_type:
+        return None
+    return topic, map_type, text
+
 @bp.route("/generate-mindmap", methods=["POST"])
 def generate_mindmap():
     if "user" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
     update_last_active(session["user"])
-    data = request.json
-    topic, map_type, text = data.get("topic"), data.get("type"), data.get("text")
-
-    if not topic or not map_type:
+    data = _json_object()
+    if data is None:
+        return jsonify({"error": "Expected a JSON object"}), 400
+    fields = _read_generate_request(data)
+    if not fields:
         return jsonify({"error": "Missing fields"}), 400
 
     try:
-        cached = get_cached_mind_map(topic, map_type)
-        if cached:
-            logger.info(f"[CACHE HIT] topic='{topic}' type='{map_type}'")
-            svg = convert_mermaid_to_svg(cached["mermaid"])
-            map_id = str(datetime.utcnow().timestamp())
-            store_mind_map(session["user"], map_id, topic, map_type, cached["mermaid"])
-            return jsonify({"mermaidCode": cached["mermaid"], "svg": svg, "mindMapId": map_id})
-
-        if map_type == "text":
-            prompt = f"Create a mind map in Mermaid syntax based on this paragraph:\n{text}"
-            logger.info(f"[TEXT MAP] Prompt sent to Gemini:\n{prompt}")
-            gemini_response = get_gemini_response(prompt)
-            logger.info(f"[TEXT MAP] Gemini response:\n{gemini_response}")
-            code = extract_mermaid_code(gemini_response)
-            if not code:
-                raise ValueError("Failed to extract Mermaid code from Gemini response.")
-        else:
-            code = query_gemini(topic, map_type, text)
-
-        svg = convert_mermaid_to_svg(code)
-        map_id = str(datetime.utcnow().timestamp())
-        store_mind_map(session["user"], map_id, topic, map_type, code)
-        cache_mind_map(topic, map_type, code)
-        logger.info(f"[CACHE STORE] topic='{topic}' type='{map_type}'")
-
-        return jsonify({"mermaidCode": code, "svg": svg, "mindMapId": map_id})
+        return jsonify(shape_result(generate_mind_map(session["user"], *fields), data))
+    except LLMUnavailable as e:
+        logger.warning(f"[BUSY] generate_mindmap: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         logger.error(f"[ERROR] generate_mindmap failed: {e}")
         return jsonify({"error": str(e)}), 500
 
+@bp.route("/generate-mindmap/async", methods=["POST"])
+def generate_mindmap_async():
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    update_last_active(session["user"])
+    data = _json_object()
+    if data is None:
+        return jsonify({"error": "Expected a JSON object"}), 400
+    fields = _read_generate_request(data)
+    if not fields:
+        return jsonify({"error": "Missing fields"}), 400
+
+    try:
+        options = {"inlineSvg": data.get("inlineSvg")}
+        job_id = submit_job(session["user"], _generate_shaped, options, session["user"], *fields)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/api/jobs/{job_id}",
+        "eventsUrl": f"/api/jobs/{job_id}/events"
+    }), 202
+
+@bp.route("/generate-mindmap/stream", methods=["POST"])
+def generate_mindmap_stream():
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    update_last_active(session["user"])
+    data = _json_object()
+    if data is None:
+        return jsonify({"error": "Expected a JSON object"}), 400
+    fields = _read_generate_request(data)
+    if not fields:
+        return jsonify({"error": "Missing fields"}), 400
+
+    email = session["user"]
+
+    def events():
+        try:
+            for event, payload in stream_mind_map(email, *fields):
+                data = {"mermaidCode": payload} if event == "partial" else payload
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logger.error(f"[ERROR] generate_mindmap_stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@bp.route("/generate-mindmap/batch", methods=["POST"])
+def generate_mindmap_batch():
+    """Many maps in one request: {"items": [{"topic", "type", "text"?}, ...], "inlineSvg"?}.
+
+    Streams an `item` event per map as it completes, in completion order and
+    tagged with its index in the request, then a `done` event once the maps
+    are in the user's history.
+    """
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    update_last_active(session["user"])
+    body = _json_object()
+    if body is None:
+        return jsonify({"error": "Expected a JSON object"}), 400
+    items = body.get("items") or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing items"}), 400
+    if len(items) > MAX_BATCH_MAPS:
+        return jsonify({"error": f"At most {MAX_BATCH_MAPS} maps per request"}), 400
+
+    email = session["user"]
+    fields = [_read_generate_request(item) if isinstance(item, dict) else None for item in items]
+    valid = [(index, item) for index, item in enumerate(fields) if item]
+
+    def events():
+        for index, item in enumerate(fields):
+            if not item:
+                yield f"event: item\ndata: {json.dumps({'index': index, 'error': 'Missing fields'})}\n\n"
+        try:
+            for position, payload in generate_mind_maps(email, [item for _, item in valid]):
+                if position is None:
+                    payload["failed"] = [valid[p][0] for p in payload["failed"]]
+                    yield f"event: done\ndata: {json.dumps(payload)}\n\n"
+                    continue
+                index, (topic, map_type, _) = valid[position]
+                data = shape_result({"index": index, "topic": topic, "type": map_type, **payload}, body)
+                yield f"event: item\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logger.error(f"[ERROR] generate_mindmap_batch failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@bp.route("/svg/<svg_id>", methods=["GET"])
+def get_svg(svg_id):
+    """A rendered map by the svgId its generation returned, pre-compressed.
+
+    The id hashes the map's source and render options, so an If-None-Match
+    naming it is answered with 304 without looking anything up. An evicted
+    SVG is re-rendered from its cached Mermaid source while that lasts, for
+    logged-in users only: a render is too costly to hand to anyone with an id.
+    """
+    if not _SVG_ID.fullmatch(svg_id):
+        return jsonify({"error": "Unknown SVG"}), 404
+    # Weak: gzip, brotli and identity bodies are the same SVG, as is a re-render after eviction.
+    headers = {"ETag": f'W/"{svg_id}"', "Cache-Control": SVG_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains_weak(svg_id):
+        SVG_RESPONSES.inc(result="not_modified", encoding="none")
+        return Response(status=304, headers=headers)
+
+    found, result = get_svg_encodings(svg_id), "ok"
+    if found is None:
+        svg = rerender_svg(svg_id) if "user" in session else None
+        if svg is None:
+            SVG_RESPONSES.inc(result="missing", encoding="none")
+            return jsonify({"error": "Unknown SVG"}), 404
+        # Served as rendered this once; the next request finds it cached and compressed.
+        found, result = {"identity": svg.encode("utf-8")}, "rerendered"
+    encoding, body = negotiate(found, request.accept_encodings)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    SVG_RESPONSES.inc(result=result, encoding=encoding or "identity")
+    SVG_RESPONSE_BYTES.inc(len(body), encoding=encoding or "identity")
+    return Response(body, mimetype="image/svg+xml", headers=headers)
+
+@bp.route("/mindmaps", methods=["GET"])
+def list_mind_maps():
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    update_last_active(session["user"])
+    cursor = max(request.args.get("cursor", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), MAX_HISTORY_PAGE_SIZE)
+    include_code = request.args.get("code", "1") != "0"
+
+    maps, next_cursor = history_page(session["user"], cursor, limit, include_code)
+    response = jsonify(maps)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return response
+
 @bp.route("/related-images", methods=["GET"])
 def related_images():
     if "user" in session:
@@ -64,6 +228,22 @@ def related_images():
         return jsonify({"error": "Missing topic"}), 400
 
     try:
-        return jsonify(scrape_images(topic))
+        return jsonify(scrape_images(topic, wait=IMAGE_MISS_WAIT_SECONDS))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@bp.route("/related-images/batch", methods=["POST"])
+def related_images_batch():
+    if "user" in session:
+        update_last_active(session["user"])
+
+    body = _json_object()
+    if body is None:
+        return jsonify({"error": "Expected a JSON object"}), 400
+    topics = body.get("topics") or []
+    if not isinstance(topics, list) or not topics:
+        return jsonify({"error": "Missing topics"}), 400
+    if len(topics) > MAX_BATCH_TOPICS:
+        return jsonify({"error": f"At most {MAX_BATCH_TOPICS} topics per request"}), 400
+
+    return jsonify(scrape_images_many([str(t) for t in topics], wait=IMAGE_MISS_WAIT_SECONDS))
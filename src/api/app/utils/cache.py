@@ -1,35 +1,597 @@
-import redis
+import asyncio
 import json
 import os
+import random
+import threading
+import time
+import zlib
+import hashlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from app.utils import precompress
+from app.utils.metrics import CACHE_LOOKUPS
+from app.utils.redis_client import LazyAsyncRedis, get_redis
+from app.utils.topics import normalize_topic, TopicIndex
+
 load_dotenv()
-redis_url = os.getenv("REDIS_URL")
-r = redis.StrictRedis.from_url(redis_url, decode_responses=True)
+r = get_redis()
+# Binary client for compressed blobs, which cannot go through decode_responses.
+rb = get_redis(decode_responses=False)
+# asyncio counterparts for the ASGI routes, created on first use.
+ra = LazyAsyncRedis()
+rab = LazyAsyncRedis(decode_responses=False)
+
+SVG_CACHE_MAX_BYTES = int(os.getenv("SVG_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SVG_CACHE_COMPRESS = os.getenv("SVG_CACHE_COMPRESS", "true").lower() == "true"
+# Where an evicted SVG can be re-rendered from: its Mermaid source, by svg_id().
+SVG_SOURCE_PREFIX = "svgsrc:"
+SVG_SOURCE_TTL = int(os.getenv("SVG_SOURCE_TTL", str(30 * 86400)))
+# Threads re-encoding SVGs cached at the inline levels, and how many may wait for one.
+PRECOMPRESS_WORKERS = int(os.getenv("PRECOMPRESS_WORKERS", "1"))
+PRECOMPRESS_MAX_PENDING = int(os.getenv("PRECOMPRESS_MAX_PENDING", "256"))
+TOPIC_STEMMING = os.getenv("TOPIC_STEMMING", "false").lower() == "true"
+# Serve a cached map for a misspelled topic ("photosynthesys" -> "photosynthesis", trigram
+# Jaccard 0.667). Only typos qualify (see topics.typo_of), so the threshold can sit below that.
+TOPIC_FUZZY_MATCH = os.getenv("TOPIC_FUZZY_MATCH", "false").lower() == "true"
+TOPIC_FUZZY_THRESHOLD = float(os.getenv("TOPIC_FUZZY_THRESHOLD", "0.5"))
+TOPIC_INDEX_REFRESH_SECONDS = int(os.getenv("TOPIC_INDEX_REFRESH_SECONDS", "60"))
+TOPIC_STATS_KEY = "topicstats"
+# Topic lookups per "<map type>:<normalized topic>", the source for cache pre-warming.
+TOPIC_POPULARITY_KEY = "topicstats:popular"
+# The topic as last typed for each popularity member, so pre-warming prompts with "C++", not "c plus plus".
+TOPIC_DISPLAY_KEY = "topicstats:display"
+TOPIC_POPULARITY_MAX = int(os.getenv("TOPIC_POPULARITY_MAX", "10000"))
+MIND_MAP_TTL = int(os.getenv("MIND_MAP_CACHE_TTL", "86400"))
+# Free-text maps are cached by a hash of their input text, not their title.
+TEXT_MAP_TYPES = ("text", "text-to-mindmap")
+# Bump when the prompts in gemini.py / generation.py change so old maps stop matching.
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TEXT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("TEXT_CACHE_MAX_ENTRY_BYTES", str(256 * 1024)))
+
+# Stores the blob, refreshes its LRU position and evicts the least recently
+# used blobs until the tier is back under its byte budget, in one round-trip.
+_PUT_BLOB = """
+local old = redis.call('HGET', KEYS[3], ARGV[1])
+redis.call('HSET', KEYS[5], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[4])
+local total = redis.call('INCRBY', KEYS[1], tonumber(ARGV[4]) - tonumber(old or 0))
+local evicted = 0
+while total > tonumber(ARGV[5]) do
+    local oldest = redis.call('ZRANGE', KEYS[2], 0, 0)
+    if #oldest == 0 or oldest[1] == ARGV[1] then break end
+    local size = redis.call('HGET', KEYS[3], oldest[1])
+    redis.call('HDEL', KEYS[5], oldest[1])
+    redis.call('ZREM', KEYS[2], oldest[1])
+    redis.call('HDEL', KEYS[3], oldest[1])
+    total = redis.call('DECRBY', KEYS[1], tonumber(size or 0))
+    evicted = evicted + 1
+end
+if evicted > 0 then
+    redis.call('HINCRBY', KEYS[4], 'evictions', evicted)
+end
+return total
+"""
+
+# Swaps a stored blob for a re-encoding of the same data, keeping its LRU
+# position; a blob evicted in the meantime stays evicted.
+_REPLACE_BLOB = """
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if not old or redis.call('HEXISTS', KEYS[3], ARGV[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('INCRBY', KEYS[1], tonumber(ARGV[3]) - tonumber(old))
+return 1
+"""
+
+# Drops the least looked-up topics beyond ARGV[1], with their display forms.
+_TRIM_POPULARITY = """
+local stale = redis.call('ZRANGE', KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+for i = 1, #stale, 1000 do
+    redis.call('HDEL', KEYS[2], unpack(stale, i, math.min(i + 999, #stale)))
+end
+if #stale > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, #stale - 1)
+end
+return #stale
+"""
+
+# Reads the blob and records the hit (refreshing its LRU position) or the miss.
+_GET_BLOB = """
+local blob = redis.call('HGET', KEYS[3], ARGV[1])
+if blob then
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[2], ARGV[1])
+    redis.call('HINCRBY', KEYS[2], 'hits', 1)
+else
+    redis.call('HINCRBY', KEYS[2], 'misses', 1)
+end
+return blob
+"""
+
+class _BlobTier:
+    """Content-addressed blob store with a byte budget, LRU eviction and hit/miss counters."""
+
+    def __init__(self, prefix: str, max_bytes: int, compress: bool = True, precompress: bool = False):
+        # One hash of digest -> blob, so the scripts name every key they touch in KEYS.
+        self.blobs_key = f"{prefix}:blobs"
+        self.bytes_key = f"{prefix}:bytes"
+        self.lru_key = f"{prefix}:lru"
+        self.sizes_key = f"{prefix}:sizes"
+        self.stats_key = f"{prefix}:stats"
+        self.max_bytes = max_bytes
+        self.compress = compress
+        # Store ready-to-serve gzip (and brotli) encodings instead of zlib.
+        self.precompress = precompress
+        self._get = rb.register_script(_GET_BLOB)
+        self._put = rb.register_script(_PUT_BLOB)
+        self._get_async = rab.register_script(_GET_BLOB)
+        self._put_async = rab.register_script(_PUT_BLOB)
+        self._replace = rb.register_script(_REPLACE_BLOB)
+
+    def _get_call(self, digest: str) -> dict:
+        return {"keys": [self.lru_key, self.stats_key, self.blobs_key], "args": [digest, time.time()]}
+
+    def _put_call(self, digest: str, data: bytes, max_entry_bytes: int, inline: bool = False):
+        if self.precompress:
+            blob = b"e" + precompress.encode(data, inline)
+        else:
+            blob = b"z" + zlib.compress(data) if self.compress else b"r" + data
+        if max_entry_bytes is not None and len(blob) > max_entry_bytes:
+            return None
+        keys = [self.bytes_key, self.lru_key, self.sizes_key, self.stats_key, self.blobs_key]
+        return {"keys": keys, "args": [digest, blob, time.time(), len(blob), self.max_bytes]}
+
+    @staticmethod
+    def _unpack(blob):
+        if blob is None:
+            return None
+        # Blobs carry a one-byte marker so the compress setting can change safely.
+        if blob[:1] == b"e":
+            return precompress.decode(blob[1:])
+        return zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+
+    def get_encodings(self, digest: str):
+        """precompress.encodings() of the blob, {"identity": data} if it was stored otherwise, or None."""
+        blob = self._get(**self._get_call(digest))
+        if blob is None:
+            return None
+        if blob[:1] == b"e":
+            return precompress.encodings(blob[1:])
+        return {"identity": self._unpack(blob)}
+
+    def get(self, digest: str, client=None):
+        """The blob, or None. With client (a pipeline) the read is only queued; unpack its reply with _unpack."""
+        if client is not None:
+            self._get(**self._get_call(digest), client=client)
+            return None
+        return self._unpack(self._get(**self._get_call(digest)))
+
+    async def get_async(self, digest: str):
+        return self._unpack(await self._get_async(**self._get_call(digest)))
+
+    def put(self, digest: str, data: bytes, max_entry_bytes: int = None, client=None, inline: bool = False) -> bool:
+        """Store data under digest. inline encodes at the cheap levels; follow it with recompress_later."""
+        call = self._put_call(digest, data, max_entry_bytes, inline)
+        if call is None:
+            return False
+        self._put(**call, client=client)
+        return True
+
+    async def put_async(self, digest: str, data: bytes, max_entry_bytes: int = None, client=None,
+                        inline: bool = False) -> bool:
+        call = self._put_call(digest, data, max_entry_bytes, inline)
+        if call is None:
+            return False
+        await self._put_async(**call, client=client)
+        return True
+
+    def recompress_later(self, digest: str, data: bytes):
+        """Re-encode a blob put with inline=True at full quality, off the request path."""
+        global _recompress_pending
+        if not self.precompress or precompress.inline_is_final():
+            return
+        with _recompress_lock:
+            if _recompress_pending >= PRECOMPRESS_MAX_PENDING:
+                return
+            _recompress_pending += 1
+        _get_recompress_executor().submit(self._recompress, digest, data)
+
+    def _recompress(self, digest: str, data: bytes):
+        global _recompress_pending
+        try:
+            blob = b"e" + precompress.encode(data)
+            self._replace(keys=[self.bytes_key, self.sizes_key, self.blobs_key], args=[digest, blob, len(blob)])
+        except Exception as e:
+            print(f"[!] Failed to recompress {self.blobs_key} {digest}: {e}")
+        finally:
+            with _recompress_lock:
+                _recompress_pending -= 1
+
+    def stats(self) -> dict:
+        pipe = r.pipeline(transaction=False)
+        pipe.hgetall(self.stats_key)
+        pipe.get(self.bytes_key)
+        pipe.zcard(self.lru_key)
+        counters, used, entries = pipe.execute()
+        hits, misses = int(counters.get("hits", 0)), int(counters.get("misses", 0))
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hitRatio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "evictions": int(counters.get("evictions", 0)),
+            "entries": entries,
+            "bytes": int(used or 0),
+            "maxBytes": self.max_bytes,
+        }
+
+_recompress_executor = None
+_recompress_lock = threading.Lock()
+_recompress_pending = 0
+
+def _get_recompress_executor() -> ThreadPoolExecutor:
+    global _recompress_executor
+    with _recompress_lock:
+        if _recompress_executor is None:
+            _recompress_executor = ThreadPoolExecutor(max_workers=PRECOMPRESS_WORKERS, thread_name_prefix="precompress")
+    return _recompress_executor
+
+def after_fork():
+    """Forget the parent's re-encoding threads and the work queued on them."""
+    global _recompress_executor, _recompress_lock, _recompress_pending
+    _recompress_executor, _recompress_lock, _recompress_pending = None, threading.Lock(), 0
+
+svg_tier = _BlobTier("svgcache", SVG_CACHE_MAX_BYTES, SVG_CACHE_COMPRESS, precompress=SVG_CACHE_COMPRESS)
+text_tier = _BlobTier("textmap", TEXT_CACHE_MAX_BYTES)
+_trim_popularity_script = r.register_script(_TRIM_POPULARITY)
+_trim_popularity_script_async = ra.register_script(_TRIM_POPULARITY)
+
+def _canonical(topic, map_type):
+    return normalize_topic(topic, stem=TOPIC_STEMMING), map_type.strip().lower()
 
 def _get_cache_key(topic, map_type):
+    topic, map_type = _canonical(topic, map_type)
     return f"mindmap:{topic}:{map_type}"
 
-def cache_mind_map(topic, map_type, code):
+class _FuzzyTopics:
+    """Per-process MinHash indexes of cached topics, rebuilt periodically from Redis."""
+
+    def __init__(self):
+        self.indexes = {}
+        self.loaded_at = {}
+
+    def _index(self, map_type):
+        if time.monotonic() - self.loaded_at.get(map_type, -TOPIC_INDEX_REFRESH_SECONDS) >= TOPIC_INDEX_REFRESH_SECONDS:
+            index = TopicIndex()
+            for topic in r.smembers(f"topicindex:{map_type}"):
+                index.add(topic)
+            self.indexes[map_type] = index
+            self.loaded_at[map_type] = time.monotonic()
+        return self.indexes[map_type]
+
+    def add(self, topic, map_type):
+        r.sadd(f"topicindex:{map_type}", topic)
+        if map_type in self.indexes:
+            self.indexes[map_type].add(topic)
+
+    def discard(self, topic, map_type):
+        r.srem(f"topicindex:{map_type}", topic)
+        if map_type in self.indexes:
+            self.indexes[map_type].discard(topic)
+
+    def closest(self, topic, map_type):
+        return self._index(map_type).closest(topic, TOPIC_FUZZY_THRESHOLD)
+
+_fuzzy_topics = _FuzzyTopics()
+
+def _get_text_digest(text, map_type):
+    # Re-wrapped or re-indented pastes of the same notes produce the same map.
+    normalized = " ".join(unicodedata.normalize("NFC", text or "").split())
+    payload = json.dumps({"text": normalized, "type": map_type.strip().lower(), "prompt": PROMPT_VERSION})
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def mind_map_key(topic, map_type, text=None):
+    if map_type in TEXT_MAP_TYPES:
+        return f"textmap:{_get_text_digest(text, map_type)}"
+    return _get_cache_key(topic, map_type)
+
+def _get_svg_digest(mermaid_code, render_options):
+    # Whitespace-only differences in the Mermaid source render identically.
+    lines = mermaid_code.replace("\r\n", "\n").strip("\n").split("\n")
+    normalized = "\n".join(line.rstrip() for line in lines)
+    payload = json.dumps({"code": normalized, "options": render_options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def cache_mind_map(topic, map_type, code, text=None):
+    data = {"mermaid": code, "topic": topic}
+    if map_type in TEXT_MAP_TYPES:
+        digest = _get_text_digest(text, map_type)
+        if not text_tier.put(digest, json.dumps(data).encode("utf-8"), TEXT_CACHE_MAX_ENTRY_BYTES):
+            print(f"[!] Text map too large to cache: {digest}")
+        return
+
     key = _get_cache_key(topic, map_type)
-    data = {"mermaid": code}
-    r.set(key, json.dumps(data), ex=86400)  # Optional: expires in 1 day
+    r.set(key, json.dumps(data), ex=MIND_MAP_TTL)
+    if TOPIC_FUZZY_MATCH:
+        _fuzzy_topics.add(*_canonical(topic, map_type))
+
+async def cache_mind_map_async(topic, map_type, code, text=None):
+    data = {"mermaid": code, "topic": topic}
+    if map_type in TEXT_MAP_TYPES:
+        digest = _get_text_digest(text, map_type)
+        if not await text_tier.put_async(digest, json.dumps(data).encode("utf-8"), TEXT_CACHE_MAX_ENTRY_BYTES):
+            print(f"[!] Text map too large to cache: {digest}")
+        return
+
+    await ra.set(_get_cache_key(topic, map_type), json.dumps(data), ex=MIND_MAP_TTL)
+    if TOPIC_FUZZY_MATCH:
+        await asyncio.to_thread(_fuzzy_topics.add, *_canonical(topic, map_type))
+
+def _record_lookup(pipe, topic, map_type, kind):
+    pipe.hincrby(TOPIC_STATS_KEY, kind, 1)
+    canonical_topic, canonical_type = _canonical(topic, map_type)
+    member = f"{canonical_type}:{canonical_topic}"
+    pipe.zincrby(TOPIC_POPULARITY_KEY, 1, member)
+    pipe.hset(TOPIC_DISPLAY_KEY, member, topic.strip())
+    return pipe
+
+def _trim_due():
+    # Trimmed now and then rather than on every lookup; the tail is never pre-warmed anyway.
+    return random.random() < 0.01
+
+def _trim_popularity():
+    if _trim_due():
+        _trim_popularity_script(keys=[TOPIC_POPULARITY_KEY, TOPIC_DISPLAY_KEY], args=[TOPIC_POPULARITY_MAX])
+
+async def _trim_popularity_async():
+    if _trim_due():
+        await _trim_popularity_script_async(keys=[TOPIC_POPULARITY_KEY, TOPIC_DISPLAY_KEY], args=[TOPIC_POPULARITY_MAX])
+
+def popular_topics(limit):
+    """The most looked-up (topic, map_type) pairs, most popular first, with their counts.
+
+    Each topic is the form it was last looked up as, falling back to the
+    normalized key for counts recorded before display forms were kept.
+    """
+    ranked = r.zrevrange(TOPIC_POPULARITY_KEY, 0, limit - 1, withscores=True)
+    if not ranked:
+        return []
+    shown = r.hmget(TOPIC_DISPLAY_KEY, [member for member, _ in ranked])
+    topics = []
+    for (member, count), display in zip(ranked, shown):
+        map_type, _, topic = member.partition(":")
+        topics.append((display or topic, map_type, int(count)))
+    return topics
+
+def cached_topics(pairs):
+    """Which of the (topic, map_type) pairs already have a cached map, in one round-trip."""
+    pipe = r.pipeline(transaction=False)
+    for topic, map_type in pairs:
+        pipe.exists(_get_cache_key(topic, map_type))
+    return [bool(found) for found in pipe.execute()]
+
+def bulk_cache_mind_maps(entries, render_options=None, ttls=None):
+    """Cache [(topic, map_type, code, svg)] in one pipelined round-trip.
 
-def get_cached_mind_map(topic, map_type):
+    ttls gives each map its own expiry (default MIND_MAP_TTL), so a batch
+    loaded together does not also expire together.
+    """
+    pipe = rb.pipeline(transaction=False)
+    for i, (topic, map_type, code, svg) in enumerate(entries):
+        ttl = ttls[i] if ttls else MIND_MAP_TTL
+        pipe.set(_get_cache_key(topic, map_type), json.dumps({"mermaid": code, "topic": topic}), ex=ttl)
+        if svg is not None:
+            digest = _get_svg_digest(code, render_options)
+            svg_tier.put(digest, svg.encode("utf-8"), client=pipe)
+            pipe.set(_svg_source_key(digest), zlib.compress(code.encode("utf-8")), ex=SVG_SOURCE_TTL)
+        if TOPIC_FUZZY_MATCH:
+            canonical_topic, canonical_type = _canonical(topic, map_type)
+            pipe.sadd(f"topicindex:{canonical_type}", canonical_topic)
+    pipe.execute()
+
+def _hit_kind(value, topic):
+    # "raw" hits are the ones the old un-normalized keys would also have served.
+    return "raw" if json.loads(value).get("topic") == topic else "normalized"
+
+def _lookup(topic, map_type):
+    """Return (raw cached value, hit kind) where kind is raw/normalized/fuzzy/miss."""
     key = _get_cache_key(topic, map_type)
     value = r.get(key)
     if value:
+        return value, _hit_kind(value, topic)
+    return _fuzzy_lookup(topic, map_type)
+
+async def _lookup_async(topic, map_type):
+    value = await ra.get(_get_cache_key(topic, map_type))
+    if value:
+        return value, _hit_kind(value, topic)
+    if TOPIC_FUZZY_MATCH:
+        # The MinHash index is per-process CPU work plus the occasional reload.
+        return await asyncio.to_thread(_fuzzy_lookup, topic, map_type)
+    return None, "miss"
+
+def _fuzzy_lookup(topic, map_type):
+    if TOPIC_FUZZY_MATCH:
+        canonical_topic, canonical_type = _canonical(topic, map_type)
+        match = _fuzzy_topics.closest(canonical_topic, canonical_type)
+        if match:
+            value = r.get(f"mindmap:{match}:{canonical_type}")
+            if value:
+                return value, "fuzzy"
+            _fuzzy_topics.discard(match, canonical_type)
+    return None, "miss"
+
+def get_cached_mind_map(topic, map_type, render_options=None, text=None):
+    """Return the cached map; with render_options, also attach its cached SVG (or None).
+
+    Text maps are looked up by their input text; everything else by topic.
+    """
+    if map_type in TEXT_MAP_TYPES:
+        value = text_tier.get(_get_text_digest(text, map_type))
+        CACHE_LOOKUPS.inc(cache="textmap", result="hit" if value else "miss")
+    else:
         try:
-            return json.loads(value)
+            value, kind = _lookup(topic, map_type)
         except json.JSONDecodeError:
-            print(f"[!] Failed to decode cached map for key: {key}")
+            print(f"[!] Failed to decode cached map for key: {_get_cache_key(topic, map_type)}")
             return None
-    return None
+        _record_lookup(r.pipeline(transaction=False), topic, map_type, kind).execute()
+        _trim_popularity()
+        CACHE_LOOKUPS.inc(cache="mindmap", result=kind)
+    if not value:
+        return None
+
+    cached = json.loads(value)
+    if render_options is not None:
+        cached["svg"] = get_cached_svg(cached["mermaid"], render_options)
+    return cached
+
+async def get_cached_mind_map_async(topic, map_type, render_options=None, text=None):
+    """get_cached_mind_map on the asyncio clients."""
+    if map_type in TEXT_MAP_TYPES:
+        value = await text_tier.get_async(_get_text_digest(text, map_type))
+        CACHE_LOOKUPS.inc(cache="textmap", result="hit" if value else "miss")
+    else:
+        try:
+            value, kind = await _lookup_async(topic, map_type)
+        except json.JSONDecodeError:
+            print(f"[!] Failed to decode cached map for key: {_get_cache_key(topic, map_type)}")
+            return None
+        await _record_lookup(ra.pipeline(transaction=False), topic, map_type, kind).execute()
+        await _trim_popularity_async()
+        CACHE_LOOKUPS.inc(cache="mindmap", result=kind)
+    if not value:
+        return None
+
+    cached = json.loads(value)
+    if render_options is not None:
+        cached["svg"] = await get_cached_svg_async(cached["mermaid"], render_options)
+    return cached
+
+def get_cached_mind_maps(items, render_options=None):
+    """get_cached_mind_map for a list of (topic, map_type, text), in two round-trips.
+
+    Topic maps come from one MGET, pipelined with the text-map reads; the
+    SVGs of the hits and the lookup counters go out together afterwards.
+    With TOPIC_FUZZY_MATCH on, each topic miss still costs a fuzzy lookup.
+    """
+    topic_keys = [_get_cache_key(topic, map_type) for topic, map_type, _ in items if map_type not in TEXT_MAP_TYPES]
+    pipe = rb.pipeline(transaction=False)
+    if topic_keys:
+        pipe.mget(topic_keys)
+    for _, map_type, text in items:
+        if map_type in TEXT_MAP_TYPES:
+            text_tier.get(_get_text_digest(text, map_type), client=pipe)
+    replies = pipe.execute()
+    topic_values = iter(replies.pop(0) if topic_keys else [])
+    text_values = iter(replies)
+
+    results, lookups = [], []
+    for topic, map_type, text in items:
+        if map_type in TEXT_MAP_TYPES:
+            value = text_tier._unpack(next(text_values))
+            CACHE_LOOKUPS.inc(cache="textmap", result="hit" if value else "miss")
+        else:
+            value = next(topic_values)
+            try:
+                value, kind = (value, _hit_kind(value, topic)) if value else _fuzzy_lookup(topic, map_type)
+            except json.JSONDecodeError:
+                print(f"[!] Failed to decode cached map for key: {_get_cache_key(topic, map_type)}")
+                results.append(None)
+                continue
+            lookups.append((topic, map_type, kind))
+            CACHE_LOOKUPS.inc(cache="mindmap", result=kind)
+        results.append(json.loads(value) if value else None)
+
+    pipe = rb.pipeline(transaction=False)
+    hits = [cached for cached in results if cached is not None]
+    if render_options is not None:
+        for cached in hits:
+            svg_tier.get(_get_svg_digest(cached["mermaid"], render_options), client=pipe)
+    for lookup in lookups:
+        _record_lookup(pipe, *lookup)
+    replies = pipe.execute()
+    if lookups:
+        _trim_popularity()
+    if render_options is not None:
+        for cached, blob in zip(hits, replies):
+            data = svg_tier._unpack(blob)
+            CACHE_LOOKUPS.inc(cache="svg", result="hit" if data is not None else "miss")
+            cached["svg"] = data.decode("utf-8") if data is not None else None
+    return results
+
+def topic_cache_stats():
+    counters = r.hgetall(TOPIC_STATS_KEY)
+    counts = {kind: int(counters.get(kind, 0)) for kind in ("raw", "normalized", "fuzzy", "miss")}
+    lookups = sum(counts.values())
+    ratio = lambda hits: round(hits / lookups, 4) if lookups else 0.0
+    return {
+        **counts,
+        "lookups": lookups,
+        # Estimated hit ratio under the old raw-topic keys vs. what is served now.
+        "hitRatioRawKeys": ratio(counts["raw"]),
+        "hitRatio": ratio(counts["raw"] + counts["normalized"] + counts["fuzzy"]),
+    }
+
+def _svg_source_key(digest):
+    return f"{SVG_SOURCE_PREFIX}{digest}"
+
+def cache_svg(mermaid_code, svg, render_options=None):
+    """Cache a rendering, quickly encoded, plus the source it can be re-rendered from once evicted."""
+    digest, data = _get_svg_digest(mermaid_code, render_options), svg.encode("utf-8")
+    pipe = rb.pipeline(transaction=False)
+    svg_tier.put(digest, data, client=pipe, inline=True)
+    pipe.set(_svg_source_key(digest), zlib.compress(mermaid_code.encode("utf-8")), ex=SVG_SOURCE_TTL)
+    pipe.execute()
+    svg_tier.recompress_later(digest, data)
+
+async def cache_svg_async(mermaid_code, svg, render_options=None):
+    digest, data = _get_svg_digest(mermaid_code, render_options), svg.encode("utf-8")
+    pipe = rab.pipeline(transaction=False)
+    await svg_tier.put_async(digest, data, client=pipe, inline=True)
+    pipe.set(_svg_source_key(digest), zlib.compress(mermaid_code.encode("utf-8")), ex=SVG_SOURCE_TTL)
+    await pipe.execute()
+    svg_tier.recompress_later(digest, data)
+
+def get_svg_source(digest):
+    """The Mermaid source of the SVG with that svg_id(), or None once it has expired too."""
+    blob = rb.get(_svg_source_key(digest))
+    return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+
+def svg_id(mermaid_code, render_options=None):
+    """Stable id of a map's SVG: a hash of its source and the render options, so it never changes."""
+    return _get_svg_digest(mermaid_code, render_options)
+
+def get_svg_encodings(digest):
+    """The cached SVG with that svg_id(), as precompress encodings, or None."""
+    found = svg_tier.get_encodings(digest)
+    CACHE_LOOKUPS.inc(cache="svg", result="hit" if found is not None else "miss")
+    return found
+
+def get_cached_svg(mermaid_code, render_options=None):
+    data = svg_tier.get(_get_svg_digest(mermaid_code, render_options))
+    CACHE_LOOKUPS.inc(cache="svg", result="hit" if data is not None else "miss")
+    return data.decode("utf-8") if data is not None else None
+
+async def get_cached_svg_async(mermaid_code, render_options=None):
+    data = await svg_tier.get_async(_get_svg_digest(mermaid_code, render_options))
+    CACHE_LOOKUPS.inc(cache="svg", result="hit" if data is not None else "miss")
+    return data.decode("utf-8") if data is not None else None
+
+def svg_cache_stats():
+    return svg_tier.stats()
+
+def text_cache_stats():
+    return {**text_tier.stats(), "maxEntryBytes": TEXT_CACHE_MAX_ENTRY_BYTES}
 
 def clear_cached_map(topic, map_type):
     key = _get_cache_key(topic, map_type)
     if r.exists(key):
         r.delete(key)
+        if TOPIC_FUZZY_MATCH:
+            _fuzzy_topics.discard(*_canonical(topic, map_type))
         return True
     else:
         print(f"[!] Cache key not found: {key}")
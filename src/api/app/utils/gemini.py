@@ -1,15 +1,30 @@
-import os
-import google.generativeai as genai
 import re
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.0-flash")
+from app.utils.llm import get_llm
+from app.utils.mermaid import MERMAID_NORMALIZE, normalize_mermaid
+from app.utils.metrics import stage
 
 def get_gemini_response(prompt: str) -> str:
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    with stage("llm"):
+        return get_llm().generate(prompt)
+
+async def get_gemini_response_async(prompt: str) -> str:
+    with stage("llm"):
+        return await get_llm().agenerate(prompt)
 
 def extract_mermaid_code(response: str) -> str:
+    """The Mermaid code in a completion, validated and normalized; None if there is none.
+
+    Raises MermaidSyntaxError (a ValueError) for a mind map that cannot be repaired.
+    """
+    with stage("extract"):
+        code = _extract_mermaid_code(response)
+    if code and MERMAID_NORMALIZE:
+        with stage("validate"):
+            code = normalize_mermaid(code)
+    return code
+
+def _extract_mermaid_code(response: str) -> str:
     if "```mermaid" in response:
         match = re.search(r"```mermaid\s*(.*?)```", response, re.DOTALL)
         return match.group(1).strip() if match else None
@@ -17,7 +32,45 @@ def extract_mermaid_code(response: str) -> str:
         return response.replace("```", "").replace("mermaid", "").strip()
     return None
 
-def query_gemini(topic: str, map_type: str, text: str = "") -> str:
+class MermaidStreamExtractor:
+    """Incrementally pulls the mermaid block out of a streamed completion.
+
+    feed() returns the code seen so far whenever a new complete line has
+    arrived and the prefix is already a usable mind map (the "mindmap" header
+    plus a root node); otherwise it returns None.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.emitted_lines = 0
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk
+        lines = self._complete_lines()
+        if len(lines) < 2 or lines[0].strip() != "mindmap" or len(lines) <= self.emitted_lines:
+            return None
+        self.emitted_lines = len(lines)
+        return "\n".join(lines)
+
+    def finish(self) -> str:
+        return extract_mermaid_code(self.text.strip())
+
+    def _complete_lines(self) -> list:
+        start = self.text.find("```mermaid")
+        if start >= 0:
+            body = self.text[start + len("```mermaid"):]
+        elif self.text.lstrip().startswith("mindmap"):
+            body = self.text.lstrip()
+        else:
+            return []
+        end = body.find("```")
+        if end >= 0:
+            body = body[:end] + "\n"
+        # Only whole lines: a half-streamed node label could be unbalanced.
+        complete = body[:body.rfind("\n") + 1] if "\n" in body else ""
+        return [line.rstrip() for line in complete.split("\n") if line.strip()]
+
+def build_prompt(topic: str, map_type: str, text: str = "") -> str:
     if map_type == "text-to-mindmap":
         prompt = f"""
 Given the following input text, generate a mermaid mind map code using the mindmap syntax.
@@ -51,8 +104,17 @@ Create a simple mermaid mind map for the topic: "{topic}".
 - Keep nodes simple and categorized properly.
 - No explanation or text, only mermaid code in triple backticks.
 """
+    return prompt
+
+def query_gemini(topic: str, map_type: str, text: str = "") -> str:
+    response = get_gemini_response(build_prompt(topic, map_type, text))
+    code = extract_mermaid_code(response)
+    if not code:
+        raise ValueError("Failed to extract mermaid code from Gemini response.")
+    return code
 
-    response = get_gemini_response(prompt)
+async def query_gemini_async(topic: str, map_type: str, text: str = "") -> str:
+    response = await get_gemini_response_async(build_prompt(topic, map_type, text))
     code = extract_mermaid_code(response)
     if not code:
         raise ValueError("Failed to extract mermaid code from Gemini response.")
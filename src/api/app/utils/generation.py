@@ -0,0 +1,267 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from app.utils.cache import (
+    get_cached_mind_map, get_cached_mind_maps, cache_mind_map, cache_svg, mind_map_key, svg_id,
+    get_cached_mind_map_async, cache_mind_map_async, cache_svg_async, get_svg_source
+)
+from app.utils.gemini import (
+    query_gemini, extract_mermaid_code, get_gemini_response, build_prompt, MermaidStreamExtractor,
+    query_gemini_async, get_gemini_response_async
+)
+from app.utils.llm import LLMUnavailable, get_llm
+from app.utils.metrics import STAGE_SECONDS, stage
+from app.utils.svg import convert_mermaid_to_svg, RENDER_OPTIONS
+from app.utils.session import maps_remaining, store_mind_map, store_mind_maps, store_mind_map_async
+from app.utils.singleflight import single_flight, single_flight_async
+
+logger = logging.getLogger(__name__)
+
+# Threads shared by all batch requests in this process, and how many of them one batch may use.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", "4"))
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def _noop_progress(status: str):
+    pass
+
+def _text_prompt(text: str) -> str:
+    return f"Create a mind map in Mermaid syntax based on this paragraph:\n{text}"
+
+def _result(code: str, svg: str, map_id: str) -> dict:
+    # svgId names the same SVG at GET /api/svg/<svgId>, where repeat views can be revalidated.
+    return {"mermaidCode": code, "svg": svg, "mindMapId": map_id, "svgId": svg_id(code, RENDER_OPTIONS)}
+
+def _render_and_cache(code: str) -> str:
+    svg = convert_mermaid_to_svg(code)
+    cache_svg(code, svg, RENDER_OPTIONS)
+    return svg
+
+def rerender_svg(digest: str):
+    """The SVG for an svgId whose rendering was evicted, re-rendered from its cached source.
+
+    None when the source has expired too, or when it was rendered with other
+    options than the current ones (the id names that rendering, not this one).
+    """
+    code = get_svg_source(digest)
+    if code is None or svg_id(code, RENDER_OPTIONS) != digest:
+        return None
+    # Every client still holding the id asks at once after an eviction; one of them renders.
+    return single_flight(f"svg:{digest}", lambda: _render_and_cache(code))
+
+def _serve_cached(email: str, topic: str, map_type: str, cached: dict, progress) -> dict:
+    logger.info(f"[CACHE HIT] topic='{topic}' type='{map_type}' svg={'hit' if cached['svg'] else 'miss'}")
+    if not cached["svg"]:
+        progress("rendering")
+    svg = cached["svg"] or _render_and_cache(cached["mermaid"])
+    map_id = str(datetime.utcnow().timestamp())
+    with stage("store"):
+        store_mind_map(email, map_id, topic, map_type, cached["mermaid"])
+    return _result(cached["mermaid"], svg, map_id)
+
+def _generate(topic: str, map_type: str, text: str, progress) -> dict:
+    progress("generating")
+    if map_type == "text":
+        prompt = _text_prompt(text)
+        gemini_response = get_gemini_response(prompt)
+        # Sizes only: user text and completions stay out of the logs.
+        logger.info(f"[TEXT MAP] prompt={len(prompt)} chars, response={len(gemini_response)} chars")
+        code = extract_mermaid_code(gemini_response)
+        if not code:
+            raise ValueError("Failed to extract Mermaid code from Gemini response.")
+    else:
+        code = query_gemini(topic, map_type, text)
+
+    progress("rendering")
+    svg = _render_and_cache(code)
+    with stage("store"):
+        cache_mind_map(topic, map_type, code, text)
+    logger.info(f"[CACHE STORE] topic='{topic}' type='{map_type}'")
+    return {"mermaid": code, "svg": svg}
+
+def generate_mind_map(email: str, topic: str, map_type: str, text: str = None, on_progress=None) -> dict:
+    """Generate (or reuse) a mind map for a user and store it in their history.
+
+    on_progress is called with "generating" and "rendering" as the work moves along.
+    """
+    progress = on_progress or _noop_progress
+
+    with stage("cache_lookup"):
+        cached = get_cached_mind_map(topic, map_type, render_options=RENDER_OPTIONS, text=text)
+    if cached:
+        return _serve_cached(email, topic, map_type, cached, progress)
+
+    # Concurrent requests for the same map wait on a single generation.
+    result = single_flight(mind_map_key(topic, map_type, text), lambda: _generate(topic, map_type, text, progress))
+    code, svg = result["mermaid"], result["svg"]
+    map_id = str(datetime.utcnow().timestamp())
+    with stage("store"):
+        store_mind_map(email, map_id, topic, map_type, code)
+    return _result(code, svg, map_id)
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="mindmap-batch")
+    return _batch_executor
+
+def _batch_item(topic: str, map_type: str, text: str, cached: dict) -> dict:
+    if cached:
+        return {"mermaid": cached["mermaid"], "svg": _render_and_cache(cached["mermaid"])}
+    return single_flight(mind_map_key(topic, map_type, text), lambda: _generate(topic, map_type, text, _noop_progress))
+
+def generate_mind_maps(email: str, items: list):
+    """generate_mind_map for a list of (topic, map_type, text), yielding (position, result) as each is ready.
+
+    A result is generate_mind_map's dict plus "cached", or {"error": ...}.
+    Items past the user's remaining quota are refused without generating.
+    Cache hits come from one multi-get; the misses (and hits without an SVG)
+    run BATCH_PARALLELISM at a time, and repeats of a map share one run.
+    The history entries are written together in one round-trip once all
+    items are done, so the last thing yielded is (None, {"stored": count,
+    "failed": [positions]}), listing the maps that did not make it into
+    the history.
+    """
+    allowed = min(maps_remaining(email), len(items))
+    for position in range(allowed, len(items)):
+        yield position, {"error": "Limit reached."}
+
+    with stage("cache_lookup"):
+        cached = get_cached_mind_maps(items[:allowed], render_options=RENDER_OPTIONS)
+    # key -> (topic, map_type, text, cached map or None, positions asking for it)
+    pending = {}
+    for position, ((topic, map_type, text), hit) in enumerate(zip(items[:allowed], cached)):
+        pending.setdefault(mind_map_key(topic, map_type, text), (topic, map_type, text, hit, []))[4].append(position)
+
+    to_store, last_id = [], 0.0
+
+    def finished(positions, topic, map_type, result, was_cached):
+        nonlocal last_id
+        for position in positions:
+            # Ids are timestamps; a batch can finish several maps within one clock tick.
+            last_id = max(datetime.utcnow().timestamp(), last_id + 0.000001)
+            map_id = str(last_id)
+            to_store.append((position, (map_id, topic, map_type, result["mermaid"])))
+            yield position, {**_result(result["mermaid"], result["svg"], map_id), "cached": was_cached}
+
+    work = []
+    for topic, map_type, text, hit, positions in pending.values():
+        if hit and hit["svg"]:
+            yield from finished(positions, topic, map_type, hit, True)
+        else:
+            work.append((topic, map_type, text, hit, positions))
+
+    executor = _get_batch_executor()
+    running = {}
+    while work or running:
+        while work and len(running) < BATCH_PARALLELISM:
+            topic, map_type, text, hit, positions = job = work.pop(0)
+            running[executor.submit(_batch_item, topic, map_type, text, hit)] = job
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            topic, map_type, text, hit, positions = running.pop(future)
+            try:
+                result = future.result()
+            except LLMUnavailable as e:
+                logger.warning(f"[BUSY] batch item '{topic}': {e}")
+                error = {"error": str(e), "retryAfter": 5}
+            except Exception as e:
+                logger.error(f"[ERROR] batch item '{topic}' failed: {e}")
+                error = {"error": str(e)}
+            else:
+                yield from finished(positions, topic, map_type, result, hit is not None)
+                continue
+            for position in positions:
+                yield position, error
+
+    with stage("store"):
+        stored = store_mind_maps(email, [entry for _, entry in to_store]) if to_store else []
+    failed = sorted(position for (position, _), ok in zip(to_store, stored) if not ok)
+    yield None, {"stored": len(to_store) - len(failed), "failed": failed}
+
+async def _render_and_cache_async(code: str) -> str:
+    # The renderer pool is thread-based; a worker thread waits on it instead of the loop.
+    svg = await asyncio.to_thread(convert_mermaid_to_svg, code)
+    await cache_svg_async(code, svg, RENDER_OPTIONS)
+    return svg
+
+async def _store_async(email: str, topic: str, map_type: str, code: str) -> str:
+    map_id = str(datetime.utcnow().timestamp())
+    with stage("store"):
+        await store_mind_map_async(email, map_id, topic, map_type, code)
+    return map_id
+
+async def generate_mind_map_async(email: str, topic: str, map_type: str, text: str = None) -> dict:
+    """generate_mind_map for the event loop: same caching, coalescing and result shape."""
+    with stage("cache_lookup"):
+        cached = await get_cached_mind_map_async(topic, map_type, render_options=RENDER_OPTIONS, text=text)
+    if cached:
+        logger.info(f"[CACHE HIT] topic='{topic}' type='{map_type}' svg={'hit' if cached['svg'] else 'miss'}")
+        svg = cached["svg"] or await _render_and_cache_async(cached["mermaid"])
+        map_id = await _store_async(email, topic, map_type, cached["mermaid"])
+        return _result(cached["mermaid"], svg, map_id)
+
+    async def generate():
+        if map_type == "text":
+            prompt = _text_prompt(text)
+            gemini_response = await get_gemini_response_async(prompt)
+            logger.info(f"[TEXT MAP] prompt={len(prompt)} chars, response={len(gemini_response)} chars")
+            code = extract_mermaid_code(gemini_response)
+            if not code:
+                raise ValueError("Failed to extract Mermaid code from Gemini response.")
+        else:
+            code = await query_gemini_async(topic, map_type, text)
+
+        svg = await _render_and_cache_async(code)
+        with stage("store"):
+            await cache_mind_map_async(topic, map_type, code, text)
+        logger.info(f"[CACHE STORE] topic='{topic}' type='{map_type}'")
+        return {"mermaid": code, "svg": svg}
+
+    result = await single_flight_async(mind_map_key(topic, map_type, text), generate)
+    map_id = await _store_async(email, topic, map_type, result["mermaid"])
+    return _result(result["mermaid"], result["svg"], map_id)
+
+def stream_mind_map(email: str, topic: str, map_type: str, text: str = None):
+    """Like generate_mind_map, but yields ("partial", code) as the model streams
+    and finishes with ("done", result).
+
+    Streamed generations bypass single-flight: partial output cannot be shared
+    with waiting followers. The finished map is cached as usual.
+    """
+    with stage("cache_lookup"):
+        cached = get_cached_mind_map(topic, map_type, render_options=RENDER_OPTIONS, text=text)
+    if cached:
+        yield "done", _serve_cached(email, topic, map_type, cached, _noop_progress)
+        return
+
+    prompt = _text_prompt(text) if map_type == "text" else build_prompt(topic, map_type, text)
+    extractor = MermaidStreamExtractor()
+    started = time.perf_counter()
+    for chunk in get_llm().stream(prompt):
+        partial = extractor.feed(chunk)
+        if partial:
+            yield "partial", partial
+    # Measured around the loop rather than with stage(): this generator is suspended at each yield.
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_stream")
+
+    code = extractor.finish()
+    if not code:
+        raise ValueError("Failed to extract Mermaid code from Gemini response.")
+
+    svg = _render_and_cache(code)
+    map_id = str(datetime.utcnow().timestamp())
+    with stage("store"):
+        cache_mind_map(topic, map_type, code, text)
+        store_mind_map(email, map_id, topic, map_type, code)
+    logger.info(f"[CACHE STORE] topic='{topic}' type='{map_type}' (streamed)")
+    yield "done", _result(code, svg, map_id)
@@ -0,0 +1,106 @@
+import codecs
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List
+
+# "stream" is the stdlib incremental parser, "lxml" an optional faster pull
+# parser and "bs4" the original full-document BeautifulSoup parse.
+BACKENDS = ("stream", "lxml", "bs4")
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _ImgCollector(HTMLParser):
+    def __init__(self, limit: int):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.images = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "img":
+            return
+        # Valueless attributes come through as None; BeautifulSoup reports "".
+        self.images.append({name: value or "" for name, value in attrs})
+        if len(self.images) >= self.limit:
+            raise _StopParsing()
+
+
+class ImgExtractor:
+    """Push-style form of the "stream" backend, for callers that receive chunks themselves.
+
+    feed() returns True once `limit` tags have been seen and the rest of the
+    page can be skipped; close() flushes the parser at the end of the body.
+    """
+
+    def __init__(self, limit: int, encoding: str = None):
+        self.decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        self.collector = _ImgCollector(limit)
+        self.done = False
+
+    @property
+    def images(self) -> List[Dict[str, str]]:
+        return self.collector.images
+
+    def feed(self, chunk: bytes) -> bool:
+        self._parse(self.decoder.decode(chunk), close=False)
+        return self.done
+
+    def close(self) -> List[Dict[str, str]]:
+        self._parse(self.decoder.decode(b"", final=True), close=True)
+        return self.images
+
+    def _parse(self, text: str, close: bool):
+        if self.done:
+            return
+        try:
+            if text:
+                self.collector.feed(text)
+            if close:
+                self.collector.close()
+        except _StopParsing:
+            self.done = True
+
+
+def _extract_stream(chunks, limit, encoding):
+    extractor = ImgExtractor(limit, encoding)
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            return extractor.images
+    return extractor.close()
+
+
+def _extract_lxml(chunks, limit, encoding):
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=("start",), tag="img", encoding=encoding or "utf-8")
+    images = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            images.append(dict(element.attrib))
+            if len(images) >= limit:
+                return images
+    parser.close()
+    for _, element in parser.read_events():
+        images.append(dict(element.attrib))
+        if len(images) >= limit:
+            break
+    return images
+
+
+def _extract_bs4(chunks, limit, encoding):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(b"".join(chunks), "html.parser", from_encoding=encoding)
+    return [dict(img.attrs) for img in soup.find_all("img", limit=limit)]
+
+
+def extract_img_attrs(chunks: Iterable[bytes], limit: int, encoding: str = None,
+                      backend: str = "stream") -> List[Dict[str, str]]:
+    """Attributes of the first `limit` <img> tags, consuming chunks only as far as needed."""
+    if backend == "lxml":
+        return _extract_lxml(chunks, limit, encoding)
+    if backend == "bs4":
+        return _extract_bs4(chunks, limit, encoding)
+    return _extract_stream(chunks, limit, encoding)
@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "8"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+# Retries may add at most this fraction of extra load on top of first attempts.
+HTTP_RETRY_BUDGET_RATIO = float(os.getenv("HTTP_RETRY_BUDGET_RATIO", "0.2"))
+HTTP_BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+HTTP_BREAKER_RESET_SECONDS = float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "30"))
+HTTP_FANOUT_WORKERS = int(os.getenv("HTTP_FANOUT_WORKERS", "8"))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Unread bodies up to this size are read to the end so their connection goes back
+# to the pool; closing a half-read response drops the socket instead.
+HTTP_DRAIN_MAX_BYTES = int(os.getenv("HTTP_DRAIN_MAX_BYTES", str(64 * 1024)))
+
+_draining = set()
+
+
+def _too_long_to_drain(length, received: int, max_bytes: int) -> bool:
+    return length is not None and int(length) - received > max_bytes
+
+
+def release_response(response, max_bytes: int = HTTP_DRAIN_MAX_BYTES, background: bool = False):
+    """Hand a requests response's connection back to the pool, keeping it alive when that is cheap.
+
+    background=True drains on the fan-out pool, so the caller does not wait
+    for the rest of a body it has no use for.
+    """
+    if background:
+        _get_fanout_executor().submit(release_response, response, max_bytes)
+        return
+    try:
+        received = response.raw.tell() if hasattr(response.raw, "tell") else 0
+        length = response.headers.get("Content-Length")
+        if not _too_long_to_drain(length if length and length.isdigit() else None, received, max_bytes):
+            drained = 0
+            for chunk in response.iter_content(16 * 1024):
+                drained += len(chunk)
+                if drained > max_bytes:
+                    break
+    except Exception:
+        pass
+    finally:
+        response.close()
+
+
+async def release_async_response(response, max_bytes: int = HTTP_DRAIN_MAX_BYTES, background: bool = False):
+    """release_response for aiohttp: release() alone closes a connection whose body is unread."""
+    if background:
+        task = asyncio.create_task(release_async_response(response, max_bytes))
+        # The loop only keeps weak references to tasks.
+        _draining.add(task)
+        task.add_done_callback(_draining.discard)
+        return
+    try:
+        if not _too_long_to_drain(response.content_length, response.content.total_bytes, max_bytes):
+            drained = 0
+            while drained <= max_bytes:
+                chunk = await response.content.read(16 * 1024)
+                if not chunk:
+                    break
+                drained += len(chunk)
+    except Exception:
+        pass
+    finally:
+        response.release()
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through after the reset timeout."""
+
+    def __init__(self, failures: int = HTTP_BREAKER_FAILURES, reset_seconds: float = HTTP_BREAKER_RESET_SECONDS):
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self):
+        """End a trial call that told nothing about the host, such as a caller error."""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket fed by first attempts, so retries cannot amplify an outage."""
+
+    def __init__(self, ratio: float = HTTP_RETRY_BUDGET_RATIO, cap: float = 10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class _Guarded:
+    """Retry budget and per-host circuit breakers shared by the sync and async clients."""
+
+    def __init__(self, max_retries: int):
+        self.max_retries = max_retries
+        self.budget = RetryBudget()
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        with self.breakers_lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker()
+            return breaker
+
+    def _retry_delay(self, attempt: int):
+        """Seconds to wait before the next attempt, or None when out of retries or budget."""
+        if attempt >= self.max_retries or not self.budget.withdraw():
+            return None
+        # Full jitter keeps retries from synchronising across workers.
+        return random.uniform(0, 0.2 * 2 ** (attempt + 1))
+
+
+class HttpClient(_Guarded):
+    """Pooled keep-alive HTTP client with strict timeouts, a retry budget and per-host breakers."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_retries: int = HTTP_MAX_RETRIES,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        super().__init__(max_retries)
+        # Imported here so that importing the app does not load requests and urllib3.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.transient_errors = (requests.ConnectionError, requests.Timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.timeout = timeout
+
+    def get(self, url: str, **kwargs) -> "requests.Response":
+        breaker = self._breaker(url)
+        kwargs.setdefault("timeout", self.timeout)
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+            recorded = False
+            try:
+                response = self.session.get(url, **kwargs)
+            except self.transient_errors as e:
+                breaker.record_failure()
+                recorded = True
+                error, response = e, None
+            else:
+                recorded = True
+                if response.status_code not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                error = None
+            finally:
+                if not recorded:
+                    breaker.release()
+
+            delay = self._retry_delay(attempt)
+            if delay is None:
+                if response is not None:
+                    return response
+                raise error
+            if response is not None:
+                release_response(response)
+            attempt += 1
+            time.sleep(delay)
+
+    def map(self, fn, items) -> list:
+        """Run fn over items concurrently, preserving order; exceptions are returned in place.
+
+        Calls share one pool of HTTP_FANOUT_WORKERS threads per process, so fn
+        must not call map() itself.
+        """
+        def call(item):
+            try:
+                return fn(item)
+            except Exception as e:
+                return e
+
+        items = list(items)
+        if not items:
+            return []
+        return list(_get_fanout_executor().map(call, items))
+
+
+class AsyncHttpClient(_Guarded):
+    """aiohttp counterpart of HttpClient for the ASGI routes, with the same guards."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_retries: int = HTTP_MAX_RETRIES):
+        super().__init__(max_retries)
+        self.pool_size = pool_size
+        self.session = None
+
+    def _session(self):
+        import aiohttp
+
+        # Created on first use so it binds to the running event loop.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT),
+            )
+        return self.session
+
+    async def get(self, url: str, **kwargs):
+        """The response is returned unread; the caller must release it, with release_async_response()
+        when the body may not have been read to the end."""
+        import aiohttp
+
+        breaker = self._breaker(url)
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+            recorded = False
+            try:
+                response = await self._session().get(url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                breaker.record_failure()
+                recorded = True
+                error, response = e, None
+            else:
+                recorded = True
+                if response.status not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                error = None
+            finally:
+                if not recorded:
+                    breaker.release()
+
+            delay = self._retry_delay(attempt)
+            if delay is None:
+                if response is not None:
+                    return response
+                raise error
+            if response is not None:
+                await release_async_response(response)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+_fanout_executor = None
+
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _client_lock:
+            if _fanout_executor is None:
+                _fanout_executor = ThreadPoolExecutor(max_workers=HTTP_FANOUT_WORKERS, thread_name_prefix="http-fanout")
+    return _fanout_executor
+
+
+def get_http_client() -> HttpClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+
+def get_async_http_client() -> AsyncHttpClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncHttpClient()
+    return _async_client
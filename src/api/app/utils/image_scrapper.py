@@ -1,29 +1,261 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from cachetools import TTLCache
 from typing import List, Dict
 
-SEARCH_URL = "https://www.google.com/search?q={}&tbm=isch"
+from app.utils.html_images import ImgExtractor, extract_img_attrs
+from app.utils.http_client import get_async_http_client, get_http_client, release_async_response, release_response
+from app.utils.metrics import CACHE_LOOKUPS, stage
+from app.utils.redis_client import LazyAsyncRedis, get_redis
+
+logger = logging.getLogger(__name__)
+
+# Overridable so the scraper can be pointed at a local stub server.
+SEARCH_URL = os.getenv("IMAGE_SEARCH_URL", "https://www.google.com/search?q={}&tbm=isch")
 HEADERS = {'User-Agent': 'Mozilla/5.0'}
-image_cache = {}
 
-def scrape_images(query: str, max_images: int = 5, size: str = "large") -> List[Dict[str, str]]:
-    search_query = f"{query} high resolution" if size == "large" else query
-    cache_key = f"{search_query}_{max_images}_{size}"
+# Results younger than IMAGE_FRESH_SECONDS are served as-is; older ones (up to
+# IMAGE_STALE_SECONDS) are still served while a background refresh runs.
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "1024"))
+IMAGE_FRESH_SECONDS = int(os.getenv("IMAGE_FRESH_SECONDS", str(6 * 3600)))
+IMAGE_STALE_SECONDS = int(os.getenv("IMAGE_STALE_SECONDS", str(7 * 86400)))
+IMAGE_NEGATIVE_SECONDS = int(os.getenv("IMAGE_NEGATIVE_SECONDS", "600"))
+IMAGE_REFRESH_WORKERS = int(os.getenv("IMAGE_REFRESH_WORKERS", "4"))
+IMAGE_HTML_PARSER = os.getenv("IMAGE_HTML_PARSER", "stream")
+# The rest of a search page, after the tags we need, is read in the background
+# up to this size so its connection stays alive for the next search; a TLS
+# handshake costs more than the few hundred KiB left of a typical page.
+IMAGE_DRAIN_MAX_BYTES = int(os.getenv("IMAGE_DRAIN_MAX_BYTES", str(1024 * 1024)))
+
+r = get_redis()
+ra = LazyAsyncRedis()
+image_cache = TTLCache(maxsize=IMAGE_CACHE_SIZE, ttl=IMAGE_STALE_SECONDS)
+_cache_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+# Event-loop fetches, deduplicated like _inflight; only touched from the loop thread.
+_inflight_async = {}
+
 
-    # Check in-memory cache
-    if cache_key in image_cache:
-        return image_cache[cache_key]
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_REFRESH_WORKERS, thread_name_prefix="image-refresh")
+    return _executor
 
+
+def _fetch_images(query: str, search_query: str, max_images: int, size: str) -> List[Dict[str, str]]:
+    size_param = "&tbs=isz:l" if size == "large" else "&tbs=isz:m"
+    response = get_http_client().get(SEARCH_URL.format(search_query) + size_param, headers=HEADERS, stream=True)
+    try:
+        response.raise_for_status()
+        # requests assumes ISO-8859-1 when no charset is sent; let the parser default to UTF-8 instead.
+        has_charset = "charset" in response.headers.get("Content-Type", "").lower()
+        # Parsing stops once enough <img> tags have been seen.
+        tags = extract_img_attrs(
+            response.iter_content(chunk_size=16384), max_images + 1,
+            encoding=response.encoding if has_charset else None, backend=IMAGE_HTML_PARSER
+        )
+    finally:
+        release_response(response, IMAGE_DRAIN_MAX_BYTES, background=True)
+    return _to_images(query, tags)
+
+
+async def _fetch_images_async(query: str, search_query: str, max_images: int, size: str) -> List[Dict[str, str]]:
+    # Always the streaming html.parser extractor: it is the one that can be fed chunk by chunk.
     size_param = "&tbs=isz:l" if size == "large" else "&tbs=isz:m"
-    response = requests.get(SEARCH_URL.format(search_query) + size_param, headers=HEADERS)
-    soup = BeautifulSoup(response.content, "html.parser")
+    response = await get_async_http_client().get(SEARCH_URL.format(search_query) + size_param, headers=HEADERS)
+    try:
+        response.raise_for_status()
+        extractor = ImgExtractor(max_images + 1, encoding=response.charset)
+        async for chunk in response.content.iter_chunked(16384):
+            if extractor.feed(chunk):
+                break
+        else:
+            extractor.close()
+    finally:
+        await release_async_response(response, IMAGE_DRAIN_MAX_BYTES, background=True)
+    return _to_images(query, extractor.images)
+
 
+def _to_images(query: str, tags) -> List[Dict[str, str]]:
     images = []
-    for img in soup.find_all("img", limit=max_images + 1):
+    for img in tags:
         src = img.get("src")
         if src and src.startswith("http"):
             images.append({"url": src, "alt": img.get("alt", f"{query} image")})
 
-    final_images = images[1:] if len(images) > 1 else images
-    image_cache[cache_key] = final_images
-    return final_images
+    return images[1:] if len(images) > 1 else images
+
+
+def _max_age(entry: dict) -> int:
+    # Empty results are cached briefly so a dead topic does not hit upstream on every view.
+    return IMAGE_FRESH_SECONDS if entry["images"] else IMAGE_NEGATIVE_SECONDS
+
+
+def _load(cache_key: str):
+    with _cache_lock:
+        entry = image_cache.get(cache_key)
+    if entry is None:
+        entry = _load_shared(cache_key, r.get(f"images:{cache_key}"))
+    else:
+        CACHE_LOOKUPS.inc(cache="images", result="local")
+    return _usable(entry)
+
+
+async def _load_async(cache_key: str):
+    with _cache_lock:
+        entry = image_cache.get(cache_key)
+    if entry is None:
+        entry = _load_shared(cache_key, await ra.get(f"images:{cache_key}"))
+    else:
+        CACHE_LOOKUPS.inc(cache="images", result="local")
+    return _usable(entry)
+
+
+def _load_shared(cache_key: str, raw):
+    if raw is None:
+        CACHE_LOOKUPS.inc(cache="images", result="miss")
+        return None
+    entry = json.loads(raw)
+    with _cache_lock:
+        image_cache[cache_key] = entry
+    CACHE_LOOKUPS.inc(cache="images", result="redis")
+    return entry
+
+
+def _usable(entry):
+    if entry is None:
+        return None
+    age = time.time() - entry["fetchedAt"]
+    if not entry["images"] and age >= IMAGE_NEGATIVE_SECONDS:
+        return None
+    return entry
+
+
+def _new_entry(cache_key: str, images: List[Dict[str, str]]):
+    entry = {"images": images, "fetchedAt": time.time()}
+    with _cache_lock:
+        image_cache[cache_key] = entry
+    return json.dumps(entry), IMAGE_STALE_SECONDS if images else IMAGE_NEGATIVE_SECONDS
+
+
+def _store(cache_key: str, images: List[Dict[str, str]]):
+    value, ttl = _new_entry(cache_key, images)
+    r.set(f"images:{cache_key}", value, ex=ttl)
+
+
+async def _store_async(cache_key: str, images: List[Dict[str, str]]):
+    value, ttl = _new_entry(cache_key, images)
+    await ra.set(f"images:{cache_key}", value, ex=ttl)
+
+
+def _refresh(cache_key: str, query: str, search_query: str, max_images: int, size: str):
+    """Start (or join) the single in-process fetch for cache_key."""
+    def run():
+        try:
+            images = _fetch_images(query, search_query, max_images, size)
+            _store(cache_key, images)
+            return images
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cache_key, None)
+
+    with _inflight_lock:
+        future = _inflight.get(cache_key)
+        if future is None:
+            future = _inflight[cache_key] = _get_executor().submit(run)
+            future.add_done_callback(_log_refresh_failure)
+    return future
+
+
+def scrape_images(query: str, max_images: int = 5, size: str = "large", wait: float = None) -> List[Dict[str, str]]:
+    """Related images for query, served from cache whenever possible.
+
+    On a cold miss the fetch runs in the background; wait bounds how long to
+    block for it (None waits for the result, and a timeout returns []).
+    """
+    with stage("image_scrape"):
+        return _scrape_images(query, max_images, size, wait)
+
+def _scrape_images(query: str, max_images: int, size: str, wait: float) -> List[Dict[str, str]]:
+    search_query = f"{query} high resolution" if size == "large" else query
+    cache_key = f"{search_query}_{max_images}_{size}"
+
+    entry = _load(cache_key)
+    if entry is not None:
+        if time.time() - entry["fetchedAt"] >= _max_age(entry):
+            _refresh(cache_key, query, search_query, max_images, size)
+        return entry["images"]
+
+    future = _refresh(cache_key, query, search_query, max_images, size)
+    try:
+        return future.result(timeout=wait)
+    except FutureTimeout:
+        logger.info(f"[IMAGES] cold fetch for '{query}' still running, answering empty")
+        return []
+
+
+def _refresh_async(cache_key: str, query: str, search_query: str, max_images: int, size: str) -> asyncio.Task:
+    async def run():
+        try:
+            images = await _fetch_images_async(query, search_query, max_images, size)
+            await _store_async(cache_key, images)
+            return images
+        finally:
+            _inflight_async.pop(cache_key, None)
+
+    task = _inflight_async.get(cache_key)
+    if task is None:
+        task = _inflight_async[cache_key] = asyncio.create_task(run())
+        task.add_done_callback(_log_refresh_failure)
+    return task
+
+
+async def scrape_images_async(query: str, max_images: int = 5, size: str = "large",
+                              wait: float = None) -> List[Dict[str, str]]:
+    """scrape_images for the event loop, on the async Redis and HTTP clients."""
+    with stage("image_scrape"):
+        search_query = f"{query} high resolution" if size == "large" else query
+        cache_key = f"{search_query}_{max_images}_{size}"
+
+        entry = await _load_async(cache_key)
+        if entry is not None:
+            if time.time() - entry["fetchedAt"] >= _max_age(entry):
+                _refresh_async(cache_key, query, search_query, max_images, size)
+            return entry["images"]
+
+        task = _refresh_async(cache_key, query, search_query, max_images, size)
+        try:
+            # Shielded: a timed-out caller must not cancel the fetch other callers share.
+            return await asyncio.wait_for(asyncio.shield(task), wait)
+        except asyncio.TimeoutError:
+            logger.info(f"[IMAGES] cold fetch for '{query}' still running, answering empty")
+            return []
+
+
+def scrape_images_many(queries: List[str], max_images: int = 5, size: str = "large",
+                       wait: float = None) -> Dict[str, List[Dict[str, str]]]:
+    """scrape_images for several queries at once; cold misses are fetched concurrently."""
+    results = get_http_client().map(lambda q: scrape_images(q, max_images, size, wait), queries)
+    images = {}
+    for query, result in zip(queries, results):
+        if isinstance(result, Exception):
+            logger.warning(f"[IMAGES] lookup for '{query}' failed: {result}")
+            result = []
+        images[query] = result
+    return images
+
+
+def _log_refresh_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"[IMAGES] background refresh failed: {future.exception()}")
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from app.utils.cache import r
+from app.utils.subscriptions import Subscription
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "64"))
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+FINAL_STATUSES = ("done", "error")
+
+_events = Subscription("job:*:events")
+
+_executor = None
+_executor_lock = threading.Lock()
+# Bounds queued + running jobs in this process so a burst cannot pile up unbounded work.
+_slots = threading.BoundedSemaphore(JOB_QUEUE_LIMIT)
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="mindmap-job")
+    return _executor
+
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _job_channel(job_id: str) -> str:
+    return f"job:{job_id}:events"
+
+
+def _set_state(job_id: str, **fields):
+    fields["updatedAt"] = datetime.utcnow().isoformat()
+    pipe = r.pipeline(transaction=False)
+    pipe.hset(_job_key(job_id), mapping=fields)
+    pipe.expire(_job_key(job_id), JOB_TTL)
+    pipe.publish(_job_channel(job_id), fields.get("status", ""))
+    pipe.execute()
+
+
+def submit_job(owner: str, fn, *args, **kwargs) -> str:
+    """Queue fn(*args, on_progress=..., **kwargs) on the local workers and return its job id."""
+    if not _slots.acquire(blocking=False):
+        raise JobQueueFull("Too many queued jobs, try again shortly.")
+
+    job_id = uuid.uuid4().hex
+    _set_state(job_id, status="queued", owner=owner, createdAt=datetime.utcnow().isoformat())
+    app = current_app._get_current_object()
+    try:
+        _get_executor().submit(_run, app, job_id, fn, args, kwargs)
+    except Exception:
+        _slots.release()
+        raise
+    return job_id
+
+
+def _run(app, job_id: str, fn, args, kwargs):
+    try:
+        with app.app_context():
+            def progress(status: str):
+                _set_state(job_id, status=status)
+
+            try:
+                result = fn(*args, on_progress=progress, **kwargs)
+            except Exception as e:
+                logger.error(f"[JOB] {job_id} failed: {e}")
+                _set_state(job_id, status="error", error=str(e))
+            else:
+                _set_state(job_id, status="done", result=json.dumps(result))
+    finally:
+        _slots.release()
+
+
+def get_job(job_id: str) -> dict:
+    data = r.hgetall(_job_key(job_id))
+    if not data:
+        return None
+    job = {
+        "id": job_id,
+        "status": data.get("status"),
+        "owner": data.get("owner"),
+        "createdAt": data.get("createdAt"),
+        "updatedAt": data.get("updatedAt"),
+    }
+    if "result" in data:
+        job["result"] = json.loads(data["result"])
+    if "error" in data:
+        job["error"] = data["error"]
+    return job
+
+
+def iter_job_states(job_id: str, timeout: float = 300, keepalive: float = 15):
+    """Yield the job state on every status change until it finishes; None marks a keepalive.
+
+    Waits on the process-wide job subscription, so an open event stream
+    does not hold a pool connection of its own.
+    """
+    deadline = time.monotonic() + timeout
+    with _events.wait_on(_job_channel(job_id)) as waiter:
+        last_status = None
+        while time.monotonic() < deadline:
+            job = get_job(job_id)
+            if job is None:
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield job
+            if last_status in FINAL_STATUSES:
+                return
+            if waiter.get(keepalive) is None:
+                yield None
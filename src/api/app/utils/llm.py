@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+# "gemini" talks to the Gemini API; "fake" is a deterministic offline stand-in
+# for load tests and local development.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_ACQUIRE_TIMEOUT = float(os.getenv("LLM_ACQUIRE_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class LLMUnavailable(LLMError):
+    """The model is throttled or over capacity; the caller should retry later."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self, deadline: float):
+        """Take a token and return 0, or return how long to wait for the next one (None: past deadline)."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            wait = (1 - self.tokens) / self.rate
+        return wait if now + wait <= deadline else None
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take(deadline)
+            if not wait:
+                return wait == 0
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take(deadline)
+            if not wait:
+                return wait == 0
+            await asyncio.sleep(wait)
+
+
+class LLMBackend:
+    name = "base"
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: float):
+        """Yield the completion in chunks; backends without streaming yield it whole."""
+        yield self.generate(prompt, timeout)
+
+    async def agenerate(self, prompt: str, timeout: float) -> str:
+        """Backends without a native async call run generate() in a thread."""
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    def is_transient(self, error: Exception) -> bool:
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        import google.generativeai as genai
+        from google.api_core import exceptions
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.model = genai.GenerativeModel(model_name)
+        # Room for calls that overran their deadline on top of the in-flight cap.
+        self.executor = ThreadPoolExecutor(max_workers=LLM_MAX_IN_FLIGHT * 2, thread_name_prefix="gemini")
+        self.transient_errors = (
+            exceptions.ResourceExhausted,
+            exceptions.TooManyRequests,
+            exceptions.ServiceUnavailable,
+            exceptions.DeadlineExceeded,
+            exceptions.InternalServerError,
+        )
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        response = self._call(self.model.generate_content, time.monotonic() + timeout, prompt)
+        return response.text.strip()
+
+    async def agenerate(self, prompt: str, timeout: float) -> str:
+        try:
+            response = await asyncio.wait_for(self.model.generate_content_async(prompt), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Gemini did not answer within {timeout:g}s")
+        return response.text.strip()
+
+    def stream(self, prompt: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        chunks = iter(self._call(self.model.generate_content, deadline, prompt, stream=True))
+        while True:
+            chunk = self._call(next, deadline, chunks, None)
+            if chunk is None:
+                return
+            yield chunk.text
+
+    def _call(self, fn, deadline: float, *args, **kwargs):
+        """Run fn in the backend's pool and give up at deadline.
+
+        The pinned SDK (google-generativeai 0.3.1) turns keyword arguments into
+        request fields and has no timeout option, so the deadline is enforced
+        here. A call that overruns keeps its pool thread until the SDK returns.
+        """
+        future = self.executor.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            raise TimeoutError("Gemini did not answer before the deadline")
+
+    def is_transient(self, error: Exception) -> bool:
+        return isinstance(error, self.transient_errors) or super().is_transient(error)
+
+
+class FakeBackend(LLMBackend):
+    """Returns a deterministic mind map for each prompt after a fixed delay."""
+
+    name = "fake"
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY):
+        self.latency = latency
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        return self._completion(prompt)
+
+    async def agenerate(self, prompt: str, timeout: float) -> str:
+        if self.latency:
+            await asyncio.sleep(min(self.latency, timeout))
+        return self._completion(prompt)
+
+    def stream(self, prompt: str, timeout: float):
+        text = self._completion(prompt)
+        lines = text.splitlines(keepends=True)
+        # Spread the latency over the stream, a line at a time.
+        for line in lines:
+            if self.latency:
+                time.sleep(min(self.latency, timeout) / len(lines))
+            yield line
+
+    def _completion(self, prompt: str) -> str:
+        match = re.search(r'topic:?\s*"([^"]+)"', prompt, re.IGNORECASE)
+        topic = match.group(1) if match else "Input text"
+        seed = hashlib.sha256(prompt.encode()).hexdigest()
+        lines = ["mindmap", f"  root(({topic}))"]
+        for i in range(3):
+            lines.append(f"    Branch {seed[i * 4:i * 4 + 4]}")
+            lines.extend(f"      Detail {seed[i * 4 + j * 8:i * 4 + j * 8 + 4]}" for j in range(1, 3))
+        return "```mermaid\n" + "\n".join(lines) + "\n```"
+
+
+BACKENDS = {"gemini": GeminiBackend, "fake": FakeBackend}
+
+
+class LLMClient:
+    """Rate-limited, concurrency-capped front for a backend, with jittered retries."""
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+        self.bucket = TokenBucket(LLM_RATE_PER_SECOND, LLM_BURST)
+        self.slots = threading.BoundedSemaphore(LLM_MAX_IN_FLIGHT)
+        # The async path has its own cap: an ASGI worker is a separate process
+        # from the threaded ones, and its waits must not block the event loop.
+        self.async_slots = None
+
+    def generate(self, prompt: str) -> str:
+        if not self.slots.acquire(timeout=LLM_ACQUIRE_TIMEOUT):
+            raise LLMUnavailable("Too many generations in flight, try again shortly.")
+        try:
+            attempt = 0
+            while True:
+                self._take_token()
+                try:
+                    return self.backend.generate(prompt, LLM_TIMEOUT)
+                except Exception as e:
+                    attempt = self._retry_or_raise(e, attempt)
+        finally:
+            self.slots.release()
+
+    async def agenerate(self, prompt: str) -> str:
+        """generate() for the event loop: waits for slots, tokens and retries without blocking it."""
+        if self.async_slots is None:
+            self.async_slots = asyncio.Semaphore(LLM_MAX_IN_FLIGHT)
+        try:
+            await asyncio.wait_for(self.async_slots.acquire(), LLM_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("Too many generations in flight, try again shortly.")
+        try:
+            attempt = 0
+            while True:
+                if not await self.bucket.acquire_async(LLM_ACQUIRE_TIMEOUT):
+                    raise LLMUnavailable("Generation rate limit reached, try again shortly.")
+                try:
+                    return await self.backend.agenerate(prompt, LLM_TIMEOUT)
+                except Exception as e:
+                    attempt, delay = self._next_attempt(e, attempt)
+                    await asyncio.sleep(delay)
+        finally:
+            self.async_slots.release()
+
+    def stream(self, prompt: str):
+        """Yield completion chunks; failures before the first chunk are retried like generate."""
+        if not self.slots.acquire(timeout=LLM_ACQUIRE_TIMEOUT):
+            raise LLMUnavailable("Too many generations in flight, try again shortly.")
+        try:
+            attempt = 0
+            while True:
+                self._take_token()
+                chunks = self.backend.stream(prompt, LLM_TIMEOUT)
+                try:
+                    first = next(chunks, None)
+                except Exception as e:
+                    attempt = self._retry_or_raise(e, attempt)
+                    continue
+                break
+            if first is not None:
+                yield first
+            # Once output has reached the caller a retry would duplicate it.
+            yield from chunks
+        finally:
+            self.slots.release()
+
+    def _take_token(self):
+        if not self.bucket.acquire(LLM_ACQUIRE_TIMEOUT):
+            raise LLMUnavailable("Generation rate limit reached, try again shortly.")
+
+    def _retry_or_raise(self, error: Exception, attempt: int) -> int:
+        attempt, delay = self._next_attempt(error, attempt)
+        time.sleep(delay)
+        return attempt
+
+    def _next_attempt(self, error: Exception, attempt: int):
+        """Return (attempt, delay) for a retryable error, or raise."""
+        if not self.backend.is_transient(error):
+            raise error
+        if attempt >= LLM_MAX_RETRIES:
+            raise LLMUnavailable(f"Model unavailable after {attempt + 1} attempts: {error}") from error
+        attempt += 1
+        delay = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+        logger.warning(f"[LLM] transient error ({error}), retry {attempt} in {delay:.2f}s")
+        return attempt, delay
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm() -> LLMClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(BACKENDS[LLM_BACKEND]())
+    return _client
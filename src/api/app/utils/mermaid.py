@@ -0,0 +1,218 @@
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Parse, repair and re-emit every extracted map before it is rendered or cached.
+MERMAID_NORMALIZE = os.getenv("MERMAID_NORMALIZE", "true").lower() == "true"
+# Diagrams outside these bounds are rejected before they reach a renderer.
+MERMAID_MAX_NODES = int(os.getenv("MERMAID_MAX_NODES", "500"))
+MERMAID_MAX_DEPTH = int(os.getenv("MERMAID_MAX_DEPTH", "12"))
+
+# Other diagram types pass through untouched; only mind maps are parsed.
+_OTHER_DIAGRAMS = re.compile(
+    r"^(graph|flowchart|sequenceDiagram|classDiagram|stateDiagram(-v2)?|erDiagram|journey|gantt|pie|"
+    r"quadrantChart|requirementDiagram|gitGraph|C4\w*|timeline|sankey(-beta)?|xychart(-beta)?|block(-beta)?)\b"
+)
+
+# Opening delimiter -> (shape, closing delimiter), longest first as Mermaid's lexer matches them.
+_SHAPES = (
+    ("((", "circle", "))"),
+    ("))", "bang", "(("),
+    ("{{", "hexagon", "}}"),
+    ("[", "square", "]"),
+    ("(", "rounded", ")"),
+    (")", "cloud", "("),
+)
+_DELIMITERS = {shape: (open_, close) for open_, shape, close in _SHAPES}
+# A node id runs up to the first shape delimiter, like Mermaid's NODE_ID token.
+_NODE_ID = re.compile(r"[^()\[\]{}]*")
+# Characters that end a bare label inside a shape; such labels are written quoted.
+_UNSAFE_LABEL = re.compile(r'[()\[\]{}"]|^\s|\s$')
+
+
+class MermaidSyntaxError(ValueError):
+    pass
+
+
+class MindmapNode:
+    def __init__(self, text: str, shape: str = "default", node_id: str = None, markdown: bool = False):
+        self.text = text
+        self.shape = shape
+        self.node_id = node_id
+        self.markdown = markdown
+        self.icon = None
+        self.classes = None
+        self.children = []
+
+    def walk(self, depth: int = 0):
+        """Yield (node, depth) for this node and its descendants, depth first."""
+        yield self, depth
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+
+class Mindmap:
+    """A parsed `mindmap` diagram plus the repairs that were needed to parse it."""
+
+    def __init__(self, root: MindmapNode, repairs: list):
+        self.root = root
+        self.repairs = repairs
+
+    def nodes(self):
+        return self.root.walk()
+
+    def to_code(self) -> str:
+        """Canonical Mermaid source: two-space indents, one node per line, labels quoted when needed."""
+        lines = ["mindmap"]
+        for node, depth in self.nodes():
+            indent = "  " * (depth + 1)
+            lines.append(indent + _format_node(node))
+            # Decorations belong to the node above them, indented past it.
+            if node.icon:
+                lines.append(f"{indent}  ::icon({node.icon})")
+            if node.classes:
+                lines.append(f"{indent}  :::{node.classes}")
+        return "\n".join(lines)
+
+
+def _format_node(node: MindmapNode) -> str:
+    if node.shape == "default":
+        return node.text
+    open_, close = _DELIMITERS[node.shape]
+    if node.markdown:
+        label = f'"`{node.text}`"'
+    elif _UNSAFE_LABEL.search(node.text):
+        label = '"' + node.text.replace('"', "'") + '"'
+    else:
+        label = node.text
+    return f"{node.node_id or ''}{open_}{label}{close}"
+
+
+def is_mindmap(code: str) -> bool:
+    """Whether code is (or, once repaired, would be) a mind map rather than another diagram type."""
+    for line in _body_lines(code):
+        return not _OTHER_DIAGRAMS.match(line.strip())
+    return False
+
+
+def _body_lines(code: str):
+    for line in code.replace("\r\n", "\n").split("\n"):
+        stripped = line.strip()
+        if stripped and not stripped.startswith("%%") and not stripped.startswith("```"):
+            yield line
+
+
+def parse_mindmap(code: str) -> Mindmap:
+    """Parse Mermaid mindmap source the way Mermaid's own grammar reads it.
+
+    Output that Mermaid would reject or misread, and that has one obvious
+    meaning, is repaired and the repair recorded: a missing header, tabs,
+    unterminated or overfull shapes, text after a shape and several roots.
+    Anything else raises MermaidSyntaxError.
+    """
+    repairs = []
+    lines = list(_body_lines(code))
+    if lines and lines[0].strip().lower() == "mindmap":
+        lines = lines[1:]
+    else:
+        repairs.append("added the mindmap header")
+
+    roots = []
+    # (indent, node) for the current node's ancestors, outermost first.
+    stack = []
+    last = None
+    for number, line in enumerate(lines, start=2):
+        if "\t" in line:
+            line = line.replace("\t", "    ")
+            if "expanded tabs" not in repairs:
+                repairs.append("expanded tabs")
+        content = line.strip()
+        indent = len(line) - len(line.lstrip())
+
+        if content.startswith("::icon(") or content.startswith(":::"):
+            if last is None:
+                raise MermaidSyntaxError(f"Line {number}: decoration before the first node.")
+            if content.startswith(":::"):
+                last.classes = content[3:].strip()
+            else:
+                last.icon = content[len("::icon("):].rstrip(")").strip()
+            continue
+
+        node = _parse_node(content, number, repairs)
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        if stack:
+            stack[-1][1].children.append(node)
+        else:
+            roots.append(node)
+        stack.append((indent, node))
+        last = node
+
+    if not roots:
+        raise MermaidSyntaxError("Mind map has no nodes.")
+    root = roots[0]
+    if len(roots) > 1:
+        # Mermaid allows a single root; keep the others as its branches.
+        root.children.extend(roots[1:])
+        repairs.append(f"moved {len(roots) - 1} extra root node(s) under the first root")
+
+    mindmap = Mindmap(root, repairs)
+    count = 0
+    for _, depth in mindmap.nodes():
+        count += 1
+        if depth >= MERMAID_MAX_DEPTH:
+            raise MermaidSyntaxError(f"Mind map is deeper than {MERMAID_MAX_DEPTH} levels.")
+    if count > MERMAID_MAX_NODES:
+        raise MermaidSyntaxError(f"Mind map has {count} nodes, more than {MERMAID_MAX_NODES}.")
+    return mindmap
+
+
+def _parse_node(content: str, number: int, repairs: list) -> MindmapNode:
+    node_id = _NODE_ID.match(content).group(0)
+    rest = content[len(node_id):]
+    if not rest:
+        return MindmapNode(content)
+
+    for open_, shape, close in _SHAPES:
+        if rest.startswith(open_):
+            break
+    else:
+        # A stray closing bracket where a shape should start: keep the text, drop the bracket.
+        repairs.append(f"line {number}: dropped stray '{rest[0]}'")
+        return _parse_node((node_id + rest[1:]).strip(), number, repairs)
+
+    body = rest[len(open_):]
+    node_id = node_id.strip() or None
+    end = body.rfind(close)
+    if end < 0:
+        repairs.append(f"line {number}: closed unterminated '{open_}'")
+        body, tail = body.rstrip(close[0] + " "), ""
+    else:
+        body, tail = body[:end], body[end + len(close):].strip()
+        if tail:
+            repairs.append(f"line {number}: moved text after the shape into its label")
+
+    markdown = False
+    if len(body) >= 4 and body.startswith('"`') and body.endswith('`"'):
+        body, markdown = body[2:-2], True
+    elif len(body) >= 2 and body.startswith('"') and body.endswith('"'):
+        body = body[1:-1]
+    text = " ".join(f"{body} {tail}".split())
+    if not text:
+        # Mermaid labels an empty shape with its id.
+        text = node_id or ""
+    if not text:
+        raise MermaidSyntaxError(f"Line {number}: node without a label.")
+    return MindmapNode(text, shape, node_id, markdown)
+
+
+def normalize_mermaid(code: str) -> str:
+    """Validate a mind map and return its canonical source; other diagram types pass through."""
+    if not is_mindmap(code):
+        return code
+    mindmap = parse_mindmap(code)
+    if mindmap.repairs:
+        logger.info(f"[MERMAID] repaired model output: {'; '.join(mindmap.repairs)}")
+    return mindmap.to_code()
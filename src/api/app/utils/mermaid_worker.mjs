@@ -0,0 +1,53 @@
+// Long-lived Mermaid renderer driven by app/utils/renderer.py.
+//
+// Launches one headless browser up front and keeps it warm. Jobs arrive as one
+// JSON object per line on stdin ({id, code, width, height, theme}) and every
+// result is written back as one JSON line on stdout ({id, svg} or {id, error}).
+import { createInterface } from "node:readline";
+import { createRequire } from "node:module";
+import { readFileSync } from "node:fs";
+import { execSync } from "node:child_process";
+import { join } from "node:path";
+import { pathToFileURL } from "node:url";
+
+// mmdc and puppeteer are installed globally (see Dockerfile / render-build.sh),
+// which ESM imports do not search, so resolve them against the global root.
+const globalRoot = process.env.NODE_GLOBAL_ROOT || execSync("npm root -g").toString().trim();
+const require = createRequire(join(globalRoot, "noop.js"));
+const load = async (name) => import(pathToFileURL(require.resolve(name)).href);
+
+const send = (message) => process.stdout.write(JSON.stringify(message) + "\n");
+
+const puppeteerConfigPath = process.argv[2];
+const puppeteerConfig = puppeteerConfigPath ? JSON.parse(readFileSync(puppeteerConfigPath, "utf-8")) : {};
+
+const { renderMermaid } = await load("@mermaid-js/mermaid-cli");
+const puppeteerModule = await load("puppeteer");
+const puppeteer = puppeteerModule.default?.launch ? puppeteerModule.default : puppeteerModule;
+
+const browser = await puppeteer.launch({ headless: "new", ...puppeteerConfig });
+browser.on("disconnected", () => process.exit(1));
+
+const decoder = new TextDecoder();
+
+// Jobs are handled strictly one at a time; the Python side never sends a new
+// job before it has read the previous result.
+const lines = createInterface({ input: process.stdin });
+send({ ready: true });
+
+for await (const line of lines) {
+  if (!line.trim()) continue;
+  let job;
+  try {
+    job = JSON.parse(line);
+    const { data } = await renderMermaid(browser, job.code, "svg", {
+      viewport: { width: job.width || 1200, height: job.height || 800, deviceScaleFactor: 1 },
+      mermaidConfig: job.theme ? { theme: job.theme } : {},
+    });
+    send({ id: job.id, svg: decoder.decode(data) });
+  } catch (err) {
+    send({ id: job?.id ?? null, error: String(err?.message || err) });
+  }
+}
+
+await browser.close();
@@ -0,0 +1,315 @@
+"""Counters, histograms and gauges in the Prometheus text format.
+
+Each process counts in memory and adds what it counted to shared totals in
+Redis every METRICS_FLUSH_SECONDS (and at exit), so a scrape that lands on
+any worker sees every worker's counts, including workers that have since
+been recycled. Gauges are kept per worker and summed over the workers that
+reported recently. METRICS_SHARED=false renders the answering process only.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a warm cache hit up to a slow model call.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_SHARED = os.getenv("METRICS_SHARED", "true").lower() == "true"
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_KEY_PREFIX = "metrics:"
+
+_registry = []
+_flush_lock = threading.Lock()
+_flusher = None
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        # What has already been added to the shared totals, as Redis hash fields.
+        self.flushed = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _fields(self, values: dict) -> dict:
+        """values as {Redis hash field: number}."""
+        raise NotImplementedError
+
+    def _from_fields(self, fields: dict) -> dict:
+        """The inverse of _fields, for totals read back from Redis."""
+        raise NotImplementedError
+
+    def collect(self, values: dict):
+        raise NotImplementedError
+
+    def render(self, values: dict = None) -> str:
+        if values is None:
+            with self.lock:
+                values = self._fields(self.values)
+            values = self._from_fields(values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.collect(values))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        if _flusher is None:
+            _start_flusher()
+
+    def _fields(self, values: dict) -> dict:
+        return {json.dumps(key): value for key, value in values.items()}
+
+    def _from_fields(self, fields: dict) -> dict:
+        return {tuple(json.loads(field)): _number(value) for field, value in fields.items()}
+
+    def collect(self, values: dict):
+        for key, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """A gauge read from a callback at scrape time, so nothing runs on the hot path."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, function):
+        super().__init__(name, help)
+        self.function = function
+
+    def _fields(self, values: dict) -> dict:
+        return {"": self.function()}
+
+    def _from_fields(self, fields: dict) -> dict:
+        return {(): sum(_number(value) for value in fields.values())}
+
+    def collect(self, values: dict):
+        yield f"{self.name} {values.get((), 0)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the running sum.
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+        if _flusher is None:
+            _start_flusher()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _fields(self, values: dict) -> dict:
+        # One field per bucket count and one for the sum: the last index.
+        return {json.dumps([*key, i]): value for key, series in values.items() for i, value in enumerate(series)}
+
+    def _from_fields(self, fields: dict) -> dict:
+        values = {}
+        for field, value in fields.items():
+            *key, index = json.loads(field)
+            series = values.setdefault(tuple(key), [0] * (len(self.buckets) + 1) + [0])
+            series[index] = _number(value)
+        return values
+
+    def collect(self, values: dict):
+        for key, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def flush():
+    """Add what this process counted since its last flush to the shared totals in Redis."""
+    from app.utils.redis_client import get_redis
+
+    with _flush_lock:
+        pending = []
+        pipe = get_redis().pipeline(transaction=False)
+        for metric in _registry:
+            key = METRICS_KEY_PREFIX + metric.name
+            if isinstance(metric, Gauge):
+                pipe.hset(key, _worker_id(), json.dumps([metric.function(), time.time()]))
+                continue
+            with metric.lock:
+                current = metric._fields(metric.values)
+            for field, value in current.items():
+                delta = value - metric.flushed.get(field, 0)
+                if delta:
+                    pipe.hincrbyfloat(key, field, delta)
+            pending.append((metric, current))
+        pipe.execute()
+        for metric, current in pending:
+            metric.flushed = current
+
+
+def _flush_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            logger.warning(f"[METRICS] flush failed, retrying with the next one: {e}")
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception as e:
+        logger.warning(f"[METRICS] final flush failed: {e}")
+
+
+def _start_flusher():
+    global _flusher
+    if not METRICS_SHARED:
+        _flusher = False
+        return
+    with _flush_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, daemon=True, name="metrics-flush")
+            _flusher.start()
+            atexit.register(_flush_at_exit)
+
+
+def _live_gauge_fields(key: str, fields: dict, pipe) -> dict:
+    """Per-worker gauge values from workers that reported within a few flushes; the rest are dropped."""
+    fresh_after = time.time() - 3 * METRICS_FLUSH_SECONDS
+    live = {}
+    for worker, reading in fields.items():
+        value, reported = json.loads(reading)
+        if reported >= fresh_after:
+            live[worker] = value
+        else:
+            pipe.hdel(key, worker)
+    return live
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format, totalled over every worker."""
+    if not METRICS_SHARED:
+        return "\n".join(metric.render() for metric in _registry) + "\n"
+    from app.utils.redis_client import get_redis
+
+    flush()
+    redis_client = get_redis()
+    pipe = redis_client.pipeline(transaction=False)
+    for metric in _registry:
+        pipe.hgetall(METRICS_KEY_PREFIX + metric.name)
+    totals = pipe.execute()
+
+    rendered, prune = [], redis_client.pipeline(transaction=False)
+    for metric, fields in zip(_registry, totals):
+        if isinstance(metric, Gauge):
+            fields = _live_gauge_fields(METRICS_KEY_PREFIX + metric.name, fields, prune)
+        rendered.append(metric.render(metric._from_fields(fields)))
+    prune.execute()
+    return "\n".join(rendered) + "\n"
+
+
+def after_fork():
+    """Start a forked worker from zero: the parent's counts are the parent's to flush."""
+    global _flush_lock, _flusher
+    _flush_lock = threading.Lock()
+    _flusher = None
+    for metric in _registry:
+        metric.lock = threading.Lock()
+        metric.values, metric.flushed = {}, {}
+
+
+REQUEST_SECONDS = Histogram(
+    "learnerai_http_request_duration_seconds", "Time spent handling a request.",
+    ("endpoint", "method", "status")
+)
+STAGE_SECONDS = Histogram(
+    "learnerai_stage_duration_seconds", "Time spent in each stage of mind map generation and image lookup.",
+    ("stage",)
+)
+CACHE_LOOKUPS = Counter(
+    "learnerai_cache_lookups_total", "Cache lookups by cache and outcome.", ("cache", "result")
+)
+RENDERS = Counter(
+    "learnerai_renders_total", "Mermaid renders by engine (native, or the browser fallback).", ("engine",)
+)
+SVG_BYTES = Counter(
+    "learnerai_svg_bytes_total", "Bytes of SVG rendered (raw) and kept after minification (minified).", ("form",)
+)
+SVG_RESPONSES = Counter(
+    "learnerai_svg_responses_total", "GET /api/svg responses by result and Content-Encoding.", ("result", "encoding")
+)
+SVG_RESPONSE_BYTES = Counter(
+    "learnerai_svg_response_bytes_total", "SVG body bytes sent by GET /api/svg, by Content-Encoding.", ("encoding",)
+)
+REDIS_ROUND_TRIPS = Histogram(
+    "learnerai_redis_round_trips_per_request", "Redis round-trips made while handling a request.",
+    ("endpoint",), buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+)
+
+
+def _renderer_queue_depth() -> int:
+    # Imported here: the renderer pool is optional and must not be started by a scrape.
+    from app.utils.renderer import current_queue_depth
+    return current_queue_depth()
+
+
+Gauge("learnerai_renderer_queue_depth", "Mermaid render jobs waiting for a worker.", _renderer_queue_depth)
+
+
+def stage(name: str):
+    """Time a block of hot-path work: `with stage("render"): ...`."""
+    return STAGE_SECONDS.time(stage=name)
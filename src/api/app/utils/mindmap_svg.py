@@ -0,0 +1,236 @@
+"""Native SVG rendering for plain Mermaid mind maps, without a browser.
+
+Lays the map out left and right of a centred root, one column per depth,
+and draws it in the look of Mermaid's default theme. Text is measured with
+a per-character width table instead of a real font engine, which is close
+enough for the short labels the prompts ask for. Maps using icons, classes
+or markdown labels are left to the Chrome renderer.
+"""
+from html import escape
+import logging
+import os
+
+from app.utils.mermaid import MermaidSyntaxError, is_mindmap, parse_mindmap
+
+logger = logging.getLogger(__name__)
+
+# Part of the SVG cache key: bump when the output changes.
+NATIVE_RENDER_VERSION = "1"
+NATIVE_MAX_NODES = int(os.getenv("MERMAID_NATIVE_MAX_NODES", "300"))
+
+FONT_SIZE = 16
+LINE_HEIGHT = 20
+PADDING = 10
+MAX_TEXT_WIDTH = 200  # Mermaid's default maxNodeWidth: longer labels wrap
+COLUMN_GAP = 60
+ROW_GAP = 14
+MARGIN = 10
+FONT_FAMILY = '"trebuchet ms", verdana, arial, sans-serif'
+
+# Section colours in the spirit of Mermaid's default theme; the root is darker.
+ROOT_FILL, ROOT_TEXT = "hsl(240, 100%, 46%)", "#ffffff"
+SECTION_FILLS = (
+    "hsl(60, 100%, 73%)", "hsl(80, 100%, 76%)", "hsl(270, 100%, 76%)", "hsl(300, 100%, 76%)",
+    "hsl(330, 100%, 76%)", "hsl(0, 100%, 76%)", "hsl(30, 100%, 76%)", "hsl(90, 100%, 76%)",
+    "hsl(150, 100%, 76%)", "hsl(180, 100%, 76%)", "hsl(210, 100%, 76%)", "hsl(240, 100%, 76%)",
+)
+SECTION_TEXT = "#333333"
+
+# Advance widths in ems for a sans-serif face; anything unlisted counts as 0.55.
+_WIDTHS = {}
+for _chars, _width in (("il.,:;'|!`", 0.28), ("fjrtI()[]{} -\"", 0.36), ("mwMW@%", 0.86),
+                       ("ABCDEFGHJKLNOPQRSTUVXYZ&", 0.66), ("0123456789", 0.56)):
+    _WIDTHS.update(dict.fromkeys(_chars, _width))
+
+
+def _text_width(text: str) -> float:
+    return sum(_WIDTHS.get(ch, 0.55) for ch in text) * FONT_SIZE
+
+
+def _wrap(text: str) -> list:
+    lines, current = [], ""
+    for word in text.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if current and _text_width(candidate) > MAX_TEXT_WIDTH:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    lines.append(current)
+    return lines
+
+
+class _Box:
+    """A node with its measured size and, once laid out, its centre."""
+
+    def __init__(self, node, depth: int, section: int):
+        self.node = node
+        self.depth = depth
+        self.section = section
+        self.lines = _wrap(node.text)
+        text_width = max(_text_width(line) for line in self.lines)
+        self.width = text_width + 2 * PADDING
+        self.height = len(self.lines) * LINE_HEIGHT + 2 * PADDING
+        if node.shape == "circle":
+            self.width = self.height = max(self.width, self.height)
+        elif node.shape in ("cloud", "bang", "hexagon"):
+            self.width += 2 * PADDING
+        self.children = []
+        self.x = self.y = 0.0
+        self.span = 0.0
+
+    def measure(self) -> float:
+        """Vertical space for this subtree (the node, or its children stacked)."""
+        stacked = sum(child.measure() for child in self.children) + ROW_GAP * (len(self.children) - 1)
+        self.span = max(self.height, stacked)
+        return self.span
+
+
+def unsupported(mindmap) -> str:
+    """Why the native renderer cannot draw this map, or None if it can."""
+    count = 0
+    for node, _ in mindmap.nodes():
+        count += 1
+        if node.icon or node.classes:
+            return "icons and classes need the browser renderer"
+        if node.markdown:
+            return "markdown labels need the browser renderer"
+    if count > NATIVE_MAX_NODES:
+        return f"more than {NATIVE_MAX_NODES} nodes"
+    return None
+
+
+def render_native(code: str):
+    """SVG for code, or None when it has to go to the browser renderer instead."""
+    if not is_mindmap(code):
+        return None
+    try:
+        mindmap = parse_mindmap(code)
+    except MermaidSyntaxError as e:
+        logger.info(f"[RENDER] native renderer skipped unparseable map: {e}")
+        return None
+    reason = unsupported(mindmap)
+    if reason:
+        logger.info(f"[RENDER] native renderer skipped map: {reason}")
+        return None
+    return render_mindmap_svg(mindmap)
+
+
+def _build(node, depth: int, section: int) -> _Box:
+    box = _Box(node, depth, section)
+    box.children = [_build(child, depth + 1, section) for child in node.children]
+    return box
+
+
+def _place(box: _Box, x: float, top: float, direction: int):
+    box.x = x
+    box.y = top + box.span / 2
+    stacked = sum(child.span for child in box.children) + ROW_GAP * (len(box.children) - 1)
+    child_top = box.y - stacked / 2
+    for child in box.children:
+        child_x = x + direction * (box.width / 2 + COLUMN_GAP + child.width / 2)
+        _place(child, child_x, child_top, direction)
+        child_top += child.span + ROW_GAP
+
+
+def _layout(mindmap) -> list:
+    root = _Box(mindmap.root, 0, -1)
+    branches = [_build(child, 1, i) for i, child in enumerate(mindmap.root.children)]
+    root.children = branches
+    spans = [branch.measure() for branch in branches]
+    root.span = root.height
+
+    # First branches go right until that side holds about half the height, the rest go left.
+    right, left, total, used = [], [], sum(spans), 0.0
+    for branch, span in zip(branches, spans):
+        if used < total / 2 or not right:
+            right.append(branch)
+            used += span
+        else:
+            left.append(branch)
+
+    for side, direction in ((right, 1), (left, -1)):
+        if not side:
+            continue
+        stacked = sum(b.span for b in side) + ROW_GAP * (len(side) - 1)
+        top = -stacked / 2
+        for branch in side:
+            branch_x = direction * (root.width / 2 + COLUMN_GAP + branch.width / 2)
+            _place(branch, branch_x, top, direction)
+            top += branch.span + ROW_GAP
+
+    boxes, pending = [], [root]
+    while pending:
+        box = pending.pop()
+        boxes.append(box)
+        pending.extend(box.children)
+    return boxes
+
+
+def _shape(box: _Box, fill: str) -> str:
+    x, y, w, h = box.x - box.width / 2, box.y - box.height / 2, box.width, box.height
+    shape = box.node.shape
+    if shape == "circle":
+        return f'<circle cx="{box.x:.1f}" cy="{box.y:.1f}" r="{w / 2:.1f}" fill="{fill}"/>'
+    if shape == "hexagon":
+        inset = h / 4
+        points = [(x, box.y), (x + inset, y), (x + w - inset, y), (x + w, box.y), (x + w - inset, y + h), (x + inset, y + h)]
+        return '<polygon points="' + " ".join(f"{px:.1f},{py:.1f}" for px, py in points) + f'" fill="{fill}"/>'
+    if shape in ("cloud", "bang"):
+        # Scalloped outline: arcs bulging out (cloud) or cut in (bang) along the box edge.
+        sweep = 1 if shape == "cloud" else 0
+        steps = max(int(w // 30), 2)
+        dx, r = w / steps, h / 4
+        d = [f"M{x:.1f},{y:.1f}"]
+        d += [f"a{dx / 2:.1f},{r:.1f} 0 0 {sweep} {dx:.1f},0" for _ in range(steps)]
+        d += [f"a{r:.1f},{h / 2:.1f} 0 0 {sweep} 0,{h:.1f}"]
+        d += [f"a{dx / 2:.1f},{r:.1f} 0 0 {sweep} {-dx:.1f},0" for _ in range(steps)]
+        d += [f"a{r:.1f},{h / 2:.1f} 0 0 {sweep} 0,{-h:.1f}", "Z"]
+        return f'<path d="{" ".join(d)}" fill="{fill}"/>'
+    radius = {"square": 0, "rounded": 10}.get(shape, 5)
+    rect = f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" rx="{radius}" fill="{fill}"/>'
+    if shape == "default":
+        # Mermaid's default node is an underlined label.
+        rect += (f'<line x1="{x:.1f}" y1="{y + h:.1f}" x2="{x + w:.1f}" y2="{y + h:.1f}" '
+                 f'stroke="{fill}" stroke-width="3"/>')
+    return rect
+
+
+def _edge(parent: _Box, child: _Box, colour: str) -> str:
+    direction = 1 if child.x > parent.x else -1
+    x1 = parent.x + direction * parent.width / 2
+    x2 = child.x - direction * child.width / 2
+    mid = (x1 + x2) / 2
+    width = max(8 - 2 * child.depth, 2)
+    return (f'<path d="M{x1:.1f},{parent.y:.1f} C{mid:.1f},{parent.y:.1f} {mid:.1f},{child.y:.1f} '
+            f'{x2:.1f},{child.y:.1f}" fill="none" stroke="{colour}" stroke-width="{width}"/>')
+
+
+def render_mindmap_svg(mindmap) -> str:
+    boxes = _layout(mindmap)
+    left = min(b.x - b.width / 2 for b in boxes) - MARGIN
+    top = min(b.y - b.height / 2 for b in boxes) - MARGIN
+    width = max(b.x + b.width / 2 for b in boxes) + MARGIN - left
+    height = max(b.y + b.height / 2 for b in boxes) + MARGIN - top
+
+    edges, nodes = [], []
+    for box in boxes:
+        fill = ROOT_FILL if box.depth == 0 else SECTION_FILLS[box.section % len(SECTION_FILLS)]
+        colour = ROOT_TEXT if box.depth == 0 else SECTION_TEXT
+        for child in box.children:
+            edges.append(_edge(box, child, SECTION_FILLS[child.section % len(SECTION_FILLS)]))
+        first = box.y - (len(box.lines) - 1) * LINE_HEIGHT / 2
+        spans = "".join(
+            f'<tspan x="{box.x:.1f}" y="{first + i * LINE_HEIGHT:.1f}">{escape(line)}</tspan>'
+            for i, line in enumerate(box.lines)
+        )
+        nodes.append(f'<g class="mindmap-node section-{box.section}">{_shape(box, fill)}'
+                     f'<text fill="{colour}" text-anchor="middle" dominant-baseline="central">{spans}</text></g>')
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="100%" style="max-width: {width:.1f}px;" '
+        f'viewBox="{left:.1f} {top:.1f} {width:.1f} {height:.1f}" role="graphics-document document" '
+        f'aria-roledescription="mindmap">'
+        f'<style>text{{font-family:{FONT_FAMILY};font-size:{FONT_SIZE}px}}</style>'
+        f'<g class="mindmap-edges">{"".join(edges)}</g><g class="mindmap-nodes">{"".join(nodes)}</g></svg>'
+    )
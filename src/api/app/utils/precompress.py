@@ -0,0 +1,73 @@
+"""Gzip and brotli encodings of a payload, produced once when it is cached.
+
+encode() packs both into one blob (brotli only when `pip install brotli` is
+available and PRECOMPRESS_BROTLI is on), so a response can be sent in
+whichever encoding the client accepts without compressing per request.
+Payloads cached while a request waits are encoded at the cheaper INLINE_
+levels first (inline=True) and re-encoded at full quality in the background.
+"""
+import gzip
+import os
+import struct
+
+PRECOMPRESS_BROTLI = os.getenv("PRECOMPRESS_BROTLI", "true").lower() == "true"
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "11"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "9"))
+# Brotli 11 costs tens of milliseconds on a large map; 5 is within a few percent of its size.
+INLINE_BROTLI_QUALITY = int(os.getenv("PRECOMPRESS_INLINE_BROTLI_QUALITY", "5"))
+INLINE_GZIP_LEVEL = int(os.getenv("PRECOMPRESS_INLINE_GZIP_LEVEL", "6"))
+
+_brotli = None
+
+
+def _brotli_module():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            brotli = False
+        _brotli = brotli
+    return _brotli or None
+
+
+def encode(data: bytes, inline: bool = False) -> bytes:
+    # mtime=0 keeps the gzip bytes a pure function of the input.
+    gzipped = gzip.compress(data, INLINE_GZIP_LEVEL if inline else GZIP_LEVEL, mtime=0)
+    brotli = _brotli_module() if PRECOMPRESS_BROTLI else None
+    quality = INLINE_BROTLI_QUALITY if inline else BROTLI_QUALITY
+    brotlied = brotli.compress(data, quality=quality) if brotli else b""
+    return struct.pack(">I", len(gzipped)) + gzipped + brotlied
+
+
+def inline_is_final() -> bool:
+    """Whether encode(inline=True) already gives the full-quality encoding."""
+    brotli_same = INLINE_BROTLI_QUALITY >= BROTLI_QUALITY or not (PRECOMPRESS_BROTLI and _brotli_module())
+    return INLINE_GZIP_LEVEL >= GZIP_LEVEL and brotli_same
+
+
+def encodings(blob: bytes) -> dict:
+    """{"gzip": bytes} plus "br" when a brotli encoding was stored."""
+    (size,) = struct.unpack(">I", blob[:4])
+    found = {"gzip": blob[4:4 + size]}
+    if len(blob) > 4 + size:
+        found["br"] = blob[4 + size:]
+    return found
+
+
+def decode(blob: bytes) -> bytes:
+    return gzip.decompress(encodings(blob)["gzip"])
+
+
+def negotiate(found: dict, accept_encodings) -> tuple:
+    """(Content-Encoding or None, body) for a werkzeug Accept-Encoding header.
+
+    found is what encodings() returns, or {"identity": bytes} for a payload
+    stored uncompressed.
+    """
+    for name in ("br", "gzip"):
+        if name in found and accept_encodings[name]:
+            return name, found[name]
+    if "identity" in found:
+        return None, found["identity"]
+    return None, gzip.decompress(found["gzip"])
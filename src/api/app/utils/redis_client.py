@@ -0,0 +1,303 @@
+import contextvars
+import os
+import threading
+import time
+
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
+from flask import g, has_app_context
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "fakeredis://" selects an in-process fake (needs the fakeredis package) for benchmarks.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# When set, connect over this unix socket instead of the host/port in REDIS_URL.
+REDIS_SOCKET_PATH = os.getenv("REDIS_SOCKET_PATH")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "3"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+# Every packed command sent to Redis is one network round-trip: a plain command,
+# a whole pipeline and an EVALSHA each go out through a single send_packed_command.
+ROUND_TRIPS_ATTR = "redis_round_trips"
+# The asyncio routes have no Flask g; their count lives in the request's context,
+# which the tasks and threads it starts inherit.
+_async_round_trips = contextvars.ContextVar(ROUND_TRIPS_ATTR, default=None)
+
+
+def _count_round_trip():
+    if has_app_context():
+        setattr(g, ROUND_TRIPS_ATTR, getattr(g, ROUND_TRIPS_ATTR, 0) + 1)
+        return
+    counter = _async_round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def count_round_trips():
+    """Start counting round-trips for the current asyncio request (Flask requests count on their own)."""
+    _async_round_trips.set([0])
+
+
+def round_trips() -> int:
+    """Redis round-trips made so far in the current request (or app context)."""
+    if has_app_context():
+        return getattr(g, ROUND_TRIPS_ATTR, 0)
+    counter = _async_round_trips.get()
+    return counter[0] if counter is not None else 0
+
+
+class _CountingMixin:
+    def send_packed_command(self, command, check_health=True):
+        _count_round_trip()
+        return super().send_packed_command(command, check_health)
+
+
+class CountingConnection(_CountingMixin, redis.Connection):
+    pass
+
+
+class CountingSSLConnection(_CountingMixin, redis.SSLConnection):
+    pass
+
+
+class CountingUnixDomainSocketConnection(_CountingMixin, redis.UnixDomainSocketConnection):
+    pass
+
+
+def _connection_class_for(url: str):
+    if url.startswith("rediss://"):
+        return CountingSSLConnection
+    if url.startswith("unix://"):
+        return CountingUnixDomainSocketConnection
+    return CountingConnection
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """Blocking pool that records how long callers wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.exhausted = 0
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().get_connection(*args, **kwargs)
+        except ConnectionError:
+            with self._stats_lock:
+                self.exhausted += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def stats(self) -> dict:
+        created = len(self._connections)
+        # The queue is pre-filled with None placeholders for not-yet-created connections.
+        idle = sum(1 for conn in list(self.pool.queue) if conn is not None)
+        with self._stats_lock:
+            return {
+                "maxConnections": self.max_connections,
+                "created": created,
+                "inUse": created - idle,
+                "idle": idle,
+                "utilization": round((created - idle) / self.max_connections, 4),
+                "checkouts": self.checkouts,
+                "exhausted": self.exhausted,
+                "waitSecondsAvg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "waitSecondsMax": round(self.wait_seconds_max, 6),
+            }
+
+
+def _build_pool(decode_responses: bool) -> InstrumentedConnectionPool:
+    options = dict(
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), REDIS_RETRIES),
+        retry_on_error=[ConnectionError, TimeoutError],
+        decode_responses=decode_responses,
+    )
+    if REDIS_SOCKET_PATH:
+        return InstrumentedConnectionPool(
+            connection_class=CountingUnixDomainSocketConnection, path=REDIS_SOCKET_PATH, **options
+        )
+    return InstrumentedConnectionPool.from_url(
+        REDIS_URL, connection_class=_connection_class_for(REDIS_URL), **options
+    )
+
+
+_pools = {}
+_clients = {}
+_lock = threading.Lock()
+_fake_server = None
+
+
+def require_fakeredis_lua():
+    """fakeredis runs EVAL/EVALSHA only with lupa installed, and the app's Lua scripts need them."""
+    try:
+        import fakeredis  # noqa: F401
+        import lupa  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            f"REDIS_URL=fakeredis:// needs `pip install 'fakeredis[lua]'` for the app's Lua scripts ({e})"
+        ) from e
+
+
+def _build_fake_client(decode_responses: bool) -> redis.Redis:
+    global _fake_server
+    require_fakeredis_lua()
+    import fakeredis
+
+    if _fake_server is None:
+        _fake_server = fakeredis.FakeServer()
+    return fakeredis.FakeRedis(server=_fake_server, decode_responses=decode_responses)
+
+
+def get_redis(decode_responses: bool = True) -> redis.Redis:
+    """Shared client drawing from the process-wide pool.
+
+    Application data uses the default text client. The binary client
+    (decode_responses=False) is for Flask-Session and compressed blobs.
+    """
+    client = _clients.get(decode_responses)
+    if client is None:
+        with _lock:
+            client = _clients.get(decode_responses)
+            if client is None and REDIS_URL.startswith("fakeredis://"):
+                client = _clients[decode_responses] = _build_fake_client(decode_responses)
+            elif client is None:
+                _pools[decode_responses] = _build_pool(decode_responses)
+                client = _clients[decode_responses] = redis.Redis(connection_pool=_pools[decode_responses])
+    return client
+
+
+_async_clients = {}
+
+
+def get_async_redis(decode_responses: bool = True):
+    """asyncio client with the same settings, for the ASGI routes.
+
+    Its connections bind to the event loop that first uses them, so this is
+    meant for the single loop of an ASGI worker process.
+    """
+    client = _async_clients.get(decode_responses)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(decode_responses)
+            if client is None:
+                client = _async_clients[decode_responses] = _build_async_client(decode_responses)
+    return client
+
+
+def _build_async_client(decode_responses: bool):
+    if REDIS_URL.startswith("fakeredis://"):
+        require_fakeredis_lua()
+        import fakeredis
+
+        _build_fake_client(decode_responses)  # creates the shared fake server
+        return fakeredis.FakeAsyncRedis(server=_fake_server, decode_responses=decode_responses)
+
+    import redis.asyncio as aioredis
+    from redis.asyncio.retry import Retry as AsyncRetry
+
+    class _AsyncCountingMixin:
+        async def send_packed_command(self, command, check_health=True):
+            _count_round_trip()
+            return await super().send_packed_command(command, check_health)
+
+    class CountingAsyncConnection(_AsyncCountingMixin, aioredis.Connection):
+        pass
+
+    class CountingAsyncSSLConnection(_AsyncCountingMixin, aioredis.SSLConnection):
+        pass
+
+    class CountingAsyncUnixDomainSocketConnection(_AsyncCountingMixin, aioredis.UnixDomainSocketConnection):
+        pass
+
+    options = dict(
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=AsyncRetry(ExponentialBackoff(cap=1.0, base=0.05), REDIS_RETRIES),
+        retry_on_error=[ConnectionError, TimeoutError],
+        decode_responses=decode_responses,
+    )
+    if REDIS_SOCKET_PATH:
+        pool = aioredis.BlockingConnectionPool(
+            connection_class=CountingAsyncUnixDomainSocketConnection, path=REDIS_SOCKET_PATH, **options
+        )
+    else:
+        connection_class = {"rediss": CountingAsyncSSLConnection, "unix": CountingAsyncUnixDomainSocketConnection}.get(
+            REDIS_URL.partition("://")[0], CountingAsyncConnection
+        )
+        pool = aioredis.BlockingConnectionPool.from_url(REDIS_URL, connection_class=connection_class, **options)
+    return aioredis.Redis(connection_pool=pool)
+
+
+class LazyAsyncRedis:
+    """Module-level stand-in for get_async_redis(decode_responses).
+
+    Resolves the client on every use, so importing a module that keeps one
+    does not load redis.asyncio, and a forked worker picks up its own
+    client after after_fork().
+    """
+
+    def __init__(self, decode_responses: bool = True):
+        self.decode_responses = decode_responses
+
+    def __getattr__(self, name):
+        return getattr(get_async_redis(self.decode_responses), name)
+
+    def register_script(self, script: str) -> "LazyAsyncScript":
+        return LazyAsyncScript(self.decode_responses, script)
+
+
+class LazyAsyncScript:
+    """A Lua script registered on the current async client at its first call."""
+
+    def __init__(self, decode_responses: bool, script: str):
+        self.decode_responses = decode_responses
+        self.script = script
+        self._registered = None
+
+    def __call__(self, keys=None, args=None, client=None):
+        redis_client = get_async_redis(self.decode_responses)
+        if self._registered is None or self._registered.registered_client is not redis_client:
+            self._registered = redis_client.register_script(self.script)
+        return self._registered(keys=keys, args=args, client=client)
+
+
+def after_fork():
+    """Drop connections inherited from the parent process; call first thing in a forked worker.
+
+    The sync pools would notice the new pid on their next checkout anyway;
+    the asyncio clients would not, and they must bind to the worker's loop.
+    """
+    global _lock
+    _lock = threading.Lock()
+    for pool in _pools.values():
+        pool.reset()
+    _async_clients.clear()
+
+
+def pool_stats() -> dict:
+    return {("text" if decode else "binary"): pool.stats() for decode, pool in _pools.items()}
@@ -0,0 +1,232 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("MERMAID_POOL_SIZE", "2"))
+QUEUE_SIZE = int(os.getenv("MERMAID_QUEUE_SIZE", "32"))
+QUEUE_TIMEOUT = float(os.getenv("MERMAID_QUEUE_TIMEOUT", "5"))
+RENDER_TIMEOUT = float(os.getenv("MERMAID_RENDER_TIMEOUT", "20"))
+STARTUP_TIMEOUT = float(os.getenv("MERMAID_STARTUP_TIMEOUT", "30"))
+MAX_JOBS_PER_WORKER = int(os.getenv("MERMAID_MAX_JOBS_PER_WORKER", "500"))
+PUPPETEER_CONFIG = os.getenv("PUPPETEER_CONFIG", "puppeteer-config.json")
+NODE_BIN = os.getenv("NODE_BIN", "node")
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "mermaid_worker.mjs")
+
+
+class RendererError(RuntimeError):
+    pass
+
+
+class RendererBusy(RendererError):
+    pass
+
+
+class RenderTimeout(RendererError):
+    pass
+
+
+class _Job:
+    def __init__(self, code: str, options: dict):
+        self.code = code
+        self.options = options
+        self.done = threading.Event()
+        self.cancelled = False
+        self.svg = None
+        self.error = None
+
+
+class _Worker(threading.Thread):
+    """Owns one Node process (one warm browser) and renders jobs from the pool queue."""
+
+    def __init__(self, pool: "RendererPool", index: int):
+        super().__init__(name=f"mermaid-renderer-{index}", daemon=True)
+        self.pool = pool
+        self.proc = None
+        self.lines = None
+        self.jobs_done = 0
+        self.restarts = 0
+        self.ids = itertools.count()
+
+    def run(self):
+        while True:
+            job = self.pool.jobs.get()
+            if job is None:
+                break
+            if job.cancelled:
+                continue
+            try:
+                job.svg = self._render(job)
+            except Exception as e:
+                job.error = e
+            finally:
+                job.done.set()
+        self.stop_process()
+
+    def _render(self, job: _Job) -> str:
+        if self.proc is None or self.proc.poll() is not None:
+            self._start_process()
+
+        job_id = next(self.ids)
+        try:
+            self.proc.stdin.write(json.dumps({"id": job_id, "code": job.code, **job.options}) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.stop_process()
+            raise RendererError(f"Renderer process died: {e}")
+
+        deadline = time.monotonic() + RENDER_TIMEOUT
+        while True:
+            message = self._read(deadline - time.monotonic())
+            if message is None:
+                self.stop_process()
+                raise RendererError("Renderer process exited while rendering.")
+            if message is TimeoutError:
+                # A wedged browser cannot be trusted with the next job.
+                logger.warning(f"[RENDERER] {self.name} timed out, restarting")
+                self.stop_process(kill=True)
+                raise RenderTimeout(f"Mermaid render exceeded {RENDER_TIMEOUT}s.")
+            if message.get("id") == job_id:
+                break
+
+        self.jobs_done += 1
+        if MAX_JOBS_PER_WORKER and self.jobs_done >= MAX_JOBS_PER_WORKER:
+            logger.info(f"[RENDERER] {self.name} recycled after {self.jobs_done} jobs")
+            self.stop_process()
+
+        if "error" in message:
+            raise RendererError(f"Mermaid render failed: {message['error']}")
+        return message["svg"]
+
+    def _start_process(self):
+        self.stop_process()
+        if self.restarts:
+            # Back off a little when the renderer keeps crashing on start.
+            time.sleep(min(2 ** min(self.restarts, 5), 30) / 10)
+        self.restarts += 1
+        self.jobs_done = 0
+
+        try:
+            self.proc = subprocess.Popen(
+                [NODE_BIN, WORKER_SCRIPT, PUPPETEER_CONFIG],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+        except OSError as e:
+            self.proc = None
+            raise RendererError(f"Could not start renderer process: {e}")
+
+        self.lines = queue.Queue()
+        threading.Thread(target=_pump, args=(self.proc.stdout, self.lines), daemon=True).start()
+
+        message = self._read(STARTUP_TIMEOUT)
+        if not isinstance(message, dict) or not message.get("ready"):
+            self.stop_process()
+            raise RendererError("Renderer process failed to start.")
+        self.restarts = 0
+        logger.info(f"[RENDERER] {self.name} started pid={self.proc.pid}")
+
+    def _read(self, timeout: float):
+        try:
+            return self.lines.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return TimeoutError
+
+    def stop_process(self, kill: bool = False):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        if kill:
+            proc.kill()
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def _pump(stream, lines: queue.Queue):
+    for line in stream:
+        try:
+            lines.put(json.loads(line))
+        except json.JSONDecodeError:
+            # Stray console output from puppeteer/mermaid, not a protocol message.
+            logger.debug(f"[RENDERER] {line.rstrip()}")
+    lines.put(None)
+
+
+class RendererPool:
+    def __init__(self, size: int = POOL_SIZE, queue_size: int = QUEUE_SIZE):
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.workers = [_Worker(self, i) for i in range(size)]
+        self.closed = False
+        for worker in self.workers:
+            worker.start()
+
+    def render(self, code: str, width: int = 1200, height: int = 800, theme: str = None) -> str:
+        if self.closed:
+            raise RendererError("Renderer pool is closed.")
+
+        job = _Job(code, {"width": width, "height": height, "theme": theme})
+        try:
+            self.jobs.put(job, timeout=QUEUE_TIMEOUT)
+        except queue.Full:
+            raise RendererBusy("Renderer queue is full, try again shortly.")
+
+        if not job.done.wait(QUEUE_TIMEOUT + RENDER_TIMEOUT + STARTUP_TIMEOUT):
+            job.cancelled = True
+            raise RenderTimeout("Timed out waiting for a renderer.")
+        if job.error:
+            raise job.error
+        return job.svg
+
+    def queue_depth(self) -> int:
+        return self.jobs.qsize()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_renderer_pool() -> RendererPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RendererPool()
+                atexit.register(_pool.close)
+    return _pool
+
+
+def close_renderer_pool():
+    """Stop the pool's Node processes, if the pool was ever started."""
+    if _pool is not None:
+        _pool.close()
+
+
+def current_queue_depth() -> int:
+    """Jobs waiting in the pool's queue; 0 if the pool has not been started."""
+    return _pool.queue_depth() if _pool is not None else 0
@@ -1,24 +1,390 @@
-from flask import current_app as app
-from datetime import datetime
+from datetime import datetime, timezone
+import hashlib
+import time
 import json
+import os
+import zlib
+
+from redis.exceptions import ResponseError
+
+from app.utils.redis_client import LazyAsyncRedis, get_redis
+
+# Registry of users who have logged in, scored by last activity (epoch seconds).
+USERS_INDEX = "users:by_last_active"
+# The same users scored by first login: a stable order for paging through them.
+USERS_BY_REGISTRATION = "users:by_registration"
+TOTAL_MAPS_KEY = "stats:total_maps"
+# Set once the keys above have been built from the user keys; an older
+# deployment gets them backfilled the first time they are read.
+USERS_INDEX_READY = "users:index_ready"
+USERS_INDEX_REBUILD_LOCK = "users:index_rebuild"
+ONLINE_WINDOW_SECONDS = 5 * 60
+DEFAULT_LIMIT = 5
+# last_active only drives the 5-minute "online" status, so per-process writes
+# are skipped if the same user was touched within this many seconds.
+LAST_ACTIVE_DEBOUNCE_SECONDS = int(os.getenv("LAST_ACTIVE_DEBOUNCE_SECONDS", "30"))
+_MAX_TRACKED_USERS = 10000
+_last_active_writes = {}
+_index_ready = False
+
+# Mermaid bodies are shared across users: MERMAID_BODIES holds the compressed
+# code once per sha256, MERMAID_REFS counts the history entries pointing at it.
+MERMAID_BODIES = "mermaid:bodies"
+MERMAID_REFS = "mermaid:refs"
+HISTORY_PAGE_SIZE = 20
+
+r = get_redis()
+# Binary client for the compressed bodies.
+rb = get_redis(decode_responses=False)
+ra = LazyAsyncRedis()
+
+def _legacy_key(email: str) -> str:
+    # Old format: one hash of full JSON maps per user, migrated on first read.
+    return f"user:{email}:mindmaps"
+
+def _migrating_key(email: str) -> str:
+    # Where an earlier version of the migration parked the legacy hash while copying it.
+    return f"{_legacy_key(email)}:migrating"
+
+def _history_keys(email: str):
+    # Entry ids scored by createdAt, and their metadata (without code) by id.
+    return f"user:{email}:history", f"user:{email}:history:meta"
+
+# Limit check, insert, counter bump and activity touch in a single atomic round-trip.
+# ARGV[10] == "0" skips the limit, counter and activity (used when migrating);
+# a non-empty ARGV[11] is the legacy field in KEYS[8] the entry is moved out of.
+_STORE_MIND_MAP = """
+local enforce = ARGV[10] == '1'
+if enforce then
+    local limit = tonumber(redis.call('HGET', KEYS[1], 'limit')) or tonumber(ARGV[6])
+    if redis.call('ZCARD', KEYS[2]) + redis.call('HLEN', KEYS[8]) >= limit then
+        return 0
+    end
+end
+if redis.call('HSETNX', KEYS[3], ARGV[1], ARGV[2]) == 1 then
+    redis.call('HSETNX', KEYS[6], ARGV[3], ARGV[4])
+    redis.call('HINCRBY', KEYS[7], ARGV[3], 1)
+end
+redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+if enforce then
+    redis.call('INCR', KEYS[4])
+    redis.call('HSET', KEYS[1], 'last_active', ARGV[7])
+    redis.call('ZADD', KEYS[5], 'XX', ARGV[8], ARGV[9])
+end
+if ARGV[11] ~= '' then
+    redis.call('HDEL', KEYS[8], ARGV[11])
+end
+return 1
+"""
+_store_mind_map = r.register_script(_STORE_MIND_MAP)
+_store_mind_map_async = ra.register_script(_STORE_MIND_MAP)
+
+# Drops a user's history, releasing shared bodies nobody else references.
+_RESET_HISTORY = """
+local removed = 0
+for _, meta in ipairs(redis.call('HVALS', KEYS[2])) do
+    local sha = cjson.decode(meta)['sha']
+    if redis.call('HINCRBY', KEYS[4], sha, -1) <= 0 then
+        redis.call('HDEL', KEYS[4], sha)
+        redis.call('HDEL', KEYS[5], sha)
+    end
+    removed = removed + 1
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+if removed > 0 then
+    redis.call('DECRBY', KEYS[3], removed)
+end
+return removed
+"""
+_reset_history = r.register_script(_RESET_HISTORY)
+
+def _mark_active(email: str):
+    if len(_last_active_writes) > _MAX_TRACKED_USERS:
+        _last_active_writes.clear()
+    _last_active_writes[email] = time.monotonic()
+
+def register_user(email: str, fields: dict):
+    pipe = r.pipeline(transaction=False)
+    pipe.hset(f"user:{email}", mapping={**fields, "last_active": datetime.utcnow().isoformat()})
+    pipe.zadd(USERS_INDEX, {email: time.time()})
+    pipe.zadd(USERS_BY_REGISTRATION, {email: time.time()}, nx=True)
+    pipe.execute()
+    _mark_active(email)
+
+def _touch_due(email: str) -> bool:
+    last_write = _last_active_writes.get(email)
+    if last_write is not None and time.monotonic() - last_write < LAST_ACTIVE_DEBOUNCE_SECONDS:
+        return False
+    _mark_active(email)
+    return True
+
+def _touch(pipe, email: str):
+    pipe.hset(f"user:{email}", "last_active", datetime.utcnow().isoformat())
+    pipe.zadd(USERS_INDEX, {email: time.time()}, xx=True)
+    return pipe
 
 def update_last_active(email: str):
-    now = datetime.utcnow().isoformat()
-    app.config["SESSION_REDIS"].hset(f"user:{email}", "last_active", now)
+    if _touch_due(email):
+        _touch(r.pipeline(transaction=False), email).execute()
+
+async def update_last_active_async(email: str):
+    if _touch_due(email):
+        await _touch(ra.pipeline(transaction=False), email).execute()
+
+def unregister_user(email: str):
+    pipe = r.pipeline(transaction=False)
+    pipe.zrem(USERS_INDEX, email)
+    pipe.zrem(USERS_BY_REGISTRATION, email)
+    pipe.execute()
 
 def get_user_limit(email: str) -> int:
     key = f"user:{email}"
-    val = app.config["SESSION_REDIS"].hget(key, "limit")
-    return int(val.decode()) if val else 5
+    val = r.hget(key, "limit")
+    return int(val) if val else DEFAULT_LIMIT
 
-def store_mind_map(email: str, map_id: str, topic: str, map_type: str, mermaid_code: str):
-    redis_key = f"user:{email}:mindmaps"
-    if app.config["SESSION_REDIS"].hlen(redis_key) >= get_user_limit(email):
-        raise ValueError("Limit reached.")
-    app.config["SESSION_REDIS"].hset(redis_key, map_id, json.dumps({
+def maps_remaining(email: str) -> int:
+    """How many more maps the user may store: their get_user_limit less their history, in one round-trip."""
+    pipe = r.pipeline(transaction=False)
+    pipe.hget(f"user:{email}", "limit")
+    pipe.zcard(_history_keys(email)[0])
+    pipe.hlen(_legacy_key(email))
+    limit, stored, legacy = pipe.execute()
+    return max((int(limit) if limit else DEFAULT_LIMIT) - stored - legacy, 0)
+
+def get_user_profile(email: str) -> dict:
+    """The user's hash with last_active refreshed, in at most one round-trip."""
+    update_last_active(email)
+    return r.hgetall(f"user:{email}")
+
+def _history_entry_call(email: str, entry: dict, enforce_limit: bool,
+                        source_key: str = None, source_field: str = "") -> dict:
+    code = entry.pop("mermaidCode")
+    sha = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    created_at = datetime.fromisoformat(entry["createdAt"]).replace(tzinfo=timezone.utc)
+    history_key, meta_key = _history_keys(email)
+    return dict(
+        keys=[f"user:{email}", history_key, meta_key, TOTAL_MAPS_KEY, USERS_INDEX,
+              MERMAID_BODIES, MERMAID_REFS, source_key or _legacy_key(email)],
+        args=[
+            entry["id"],
+            json.dumps({**entry, "sha": sha}),
+            sha,
+            zlib.compress(code.encode("utf-8")),
+            created_at.timestamp(),
+            DEFAULT_LIMIT,
+            datetime.utcnow().isoformat(),
+            time.time(),
+            email,
+            "1" if enforce_limit else "0",
+            source_field,
+        ],
+    )
+
+def _add_history_entry(email: str, entry: dict, enforce_limit: bool, client=None):
+    return _store_mind_map(**_history_entry_call(email, entry, enforce_limit), client=client)
+
+def _new_entry(map_id: str, topic: str, map_type: str, mermaid_code: str) -> dict:
+    return {
         "id": map_id,
         "createdAt": datetime.utcnow().isoformat(),
         "topic": topic,
         "type": map_type,
         "mermaidCode": mermaid_code
-    }))
+    }
+
+def store_mind_map(email: str, map_id: str, topic: str, map_type: str, mermaid_code: str):
+    entry = _new_entry(map_id, topic, map_type, mermaid_code)
+    if not _add_history_entry(email, entry, enforce_limit=True):
+        raise ValueError("Limit reached.")
+    _mark_active(email)
+
+def store_mind_maps(email: str, maps: list) -> list:
+    """store_mind_map for [(map_id, topic, map_type, mermaid_code)] in one round-trip.
+
+    Returns whether each map was stored; the limit is enforced per map, in order.
+    """
+    pipe = r.pipeline(transaction=False)
+    for map_id, topic, map_type, mermaid_code in maps:
+        _add_history_entry(email, _new_entry(map_id, topic, map_type, mermaid_code), enforce_limit=True, client=pipe)
+    stored = [bool(flag) for flag in pipe.execute()]
+    if any(stored):
+        _mark_active(email)
+    return stored
+
+async def store_mind_map_async(email: str, map_id: str, topic: str, map_type: str, mermaid_code: str):
+    entry = _new_entry(map_id, topic, map_type, mermaid_code)
+    if not await _store_mind_map_async(**_history_entry_call(email, entry, enforce_limit=True)):
+        raise ValueError("Limit reached.")
+    _mark_active(email)
+
+def _migrate_legacy_history(email: str):
+    """Move legacy entries into the history one by one, each removed from its hash as it is added.
+
+    Every step is atomic and idempotent, so a crash leaves the remaining
+    entries where readers still count them, and concurrent migrations of
+    the same user converge.
+    """
+    for source_key in (_legacy_key(email), _migrating_key(email)):
+        legacy = r.hgetall(source_key)
+        if not legacy:
+            continue
+        pipe = r.pipeline(transaction=False)
+        for field, value in legacy.items():
+            _store_mind_map(**_history_entry_call(email, json.loads(value), enforce_limit=False,
+                                                  source_key=source_key, source_field=field), client=pipe)
+        pipe.execute()
+
+def history_page(email: str, cursor: int = 0, limit: int = HISTORY_PAGE_SIZE, include_code: bool = True):
+    """Return ([maps], next cursor or None), newest first, reading only the requested page."""
+    if r.exists(_legacy_key(email), _migrating_key(email)):
+        _migrate_legacy_history(email)
+
+    history_key, meta_key = _history_keys(email)
+    ids = r.zrevrange(history_key, cursor, cursor + limit)
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    if not ids:
+        return [], None
+
+    entries = [json.loads(meta) for meta in r.hmget(meta_key, ids) if meta]
+    if include_code:
+        bodies = rb.hmget(MERMAID_BODIES, [entry["sha"] for entry in entries])
+        for entry, body in zip(entries, bodies):
+            entry["mermaidCode"] = zlib.decompress(body).decode("utf-8") if body else ""
+    for entry in entries:
+        del entry["sha"]
+    return entries, (cursor + limit if has_more else None)
+
+def history_memory(email: str) -> dict:
+    """MEMORY USAGE of a user's history in the old and the current format.
+
+    Shared bodies (their compressed length) are charged in proportion to
+    their references, so the numbers add up across users.
+    """
+    history_key, meta_key = _history_keys(email)
+    pipe = r.pipeline(transaction=False)
+    pipe.memory_usage(_legacy_key(email))
+    pipe.hlen(_legacy_key(email))
+    pipe.memory_usage(history_key)
+    pipe.memory_usage(meta_key)
+    pipe.hvals(meta_key)
+    legacy, legacy_entries, history, meta, metas = pipe.execute()
+
+    shas = [json.loads(value)["sha"] for value in metas]
+    shared = 0.0
+    if shas:
+        pipe = r.pipeline(transaction=False)
+        pipe.hmget(MERMAID_REFS, shas)
+        for sha in shas:
+            pipe.hstrlen(MERMAID_BODIES, sha)
+        refs, *sizes = pipe.execute()
+        shared = sum((size or 0) / max(int(count or 1), 1) for size, count in zip(sizes, refs))
+
+    current = (history or 0) + (meta or 0) + round(shared)
+    return {
+        "legacyEntries": legacy_entries,
+        "legacyBytes": legacy or 0,
+        "entries": len(shas),
+        "historyBytes": current,
+        "sharedBodyBytes": round(shared),
+    }
+
+def reset_mind_maps(email: str):
+    pipe = r.pipeline()
+    pipe.hlen(_legacy_key(email))
+    pipe.hlen(_migrating_key(email))
+    pipe.delete(_legacy_key(email), _migrating_key(email))
+    legacy, migrating, _ = pipe.execute()
+    legacy_removed = legacy + migrating
+    if legacy_removed:
+        r.decrby(TOTAL_MAPS_KEY, legacy_removed)
+    _reset_history(keys=[*_history_keys(email), TOTAL_MAPS_KEY, MERMAID_REFS, MERMAID_BODIES])
+
+def ensure_user_index():
+    """Build the registry and counters from the user keys if no process has yet.
+
+    One process rebuilds while the others keep answering from what is there.
+    """
+    global _index_ready
+    if _index_ready:
+        return
+    if not r.exists(USERS_INDEX_READY) and r.set(USERS_INDEX_REBUILD_LOCK, 1, nx=True, ex=600):
+        try:
+            rebuild_user_index()
+        finally:
+            r.delete(USERS_INDEX_REBUILD_LOCK)
+    _index_ready = bool(r.exists(USERS_INDEX_READY))
+
+def user_counts() -> dict:
+    ensure_user_index()
+    pipe = r.pipeline(transaction=False)
+    pipe.zcard(USERS_INDEX)
+    pipe.zcount(USERS_INDEX, time.time() - ONLINE_WINDOW_SECONDS, "+inf")
+    pipe.get(TOTAL_MAPS_KEY)
+    total_users, online_users, total_maps = pipe.execute()
+    return {"totalUsers": total_users, "onlineUsers": online_users, "totalMindMaps": int(total_maps or 0)}
+
+def users_page(cursor, limit: int):
+    """Return ([(email, user hash, map count)], next cursor or None), oldest registration first.
+
+    The cursor names the last user of the previous page, so pages neither
+    skip nor repeat users while their activity is updated; users who
+    register meanwhile show up on the last page.
+    """
+    ensure_user_index()
+    if cursor:
+        score, _, email = cursor.partition(":")
+        rank = r.zrank(USERS_BY_REGISTRATION, email)
+        if rank is None:
+            # Removed since the previous page: resume after its registration time.
+            entries = r.zrangebyscore(USERS_BY_REGISTRATION, f"({score}", "+inf", start=0, num=limit + 1,
+                                      withscores=True)
+        else:
+            entries = r.zrange(USERS_BY_REGISTRATION, rank + 1, rank + limit + 1, withscores=True)
+    else:
+        entries = r.zrange(USERS_BY_REGISTRATION, 0, limit, withscores=True)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    emails = [email for email, _ in entries]
+
+    pipe = r.pipeline(transaction=False)
+    for email in emails:
+        pipe.hgetall(f"user:{email}")
+        pipe.zcard(_history_keys(email)[0])
+        pipe.hlen(_legacy_key(email))
+    replies = pipe.execute()
+
+    rows = [(email, replies[3 * i], replies[3 * i + 1] + replies[3 * i + 2]) for i, email in enumerate(emails)]
+    next_cursor = f"{entries[-1][1]!r}:{entries[-1][0]}" if has_more else None
+    return rows, next_cursor
+
+def rebuild_user_index():
+    """Backfill the registry and counters from existing keys; a SCAN, run once by ensure_user_index()."""
+    users, registered, total_maps = {}, {}, 0
+    for key in r.scan_iter("user:*", count=500):
+        if key.endswith((":mindmaps", ":mindmaps:migrating")):
+            total_maps += r.hlen(key)
+            continue
+        if key.endswith(":history"):
+            total_maps += r.zcard(key)
+            continue
+        if key.endswith(":history:meta"):
+            continue
+        data = r.hmget(key, "google", "last_active", "login_time")
+        if data[0] != "true":
+            continue
+        last_active = datetime.fromisoformat(data[1]).replace(tzinfo=timezone.utc).timestamp() if data[1] else 0
+        users[key.split("user:", 1)[1]] = last_active
+        # login_time is the latest login; the earliest one is not recorded anywhere.
+        login_time = datetime.fromisoformat(data[2]).replace(tzinfo=timezone.utc).timestamp() if data[2] else 0
+        registered[key.split("user:", 1)[1]] = login_time or last_active
+
+    pipe = r.pipeline()
+    pipe.delete(USERS_INDEX, USERS_BY_REGISTRATION)
+    if users:
+        pipe.zadd(USERS_INDEX, users)
+        pipe.zadd(USERS_BY_REGISTRATION, registered)
+    pipe.set(TOTAL_MAPS_KEY, total_maps)
+    pipe.set(USERS_INDEX_READY, 1)
+    pipe.execute()
+    return {"users": len(users), "mindMaps": total_maps}
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app.utils.cache import r, ra
+from app.utils.llm import LLMUnavailable
+from app.utils.subscriptions import Subscription
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = int(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "30"))
+WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "90"))
+RESULT_TTL = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", "30"))
+# Followers hear about results from the shared subscription; this poll only
+# notices a leader that died, or a result published while it was reconnecting.
+POLL_SECONDS = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "5"))
+STATS_KEY = "singleflight:stats"
+
+_done = Subscription("singleflight:done:*")
+# Published on success; followers then read the result from its key, so the
+# subscription every worker shares never carries whole maps.
+DONE = "done"
+
+# Only the current lease holder may extend or release the lease.
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_release = r.register_script(_RELEASE)
+_renew = r.register_script(_RENEW)
+_release_async = ra.register_script(_RELEASE)
+_renew_async = ra.register_script(_RENEW)
+
+
+class SingleFlightError(RuntimeError):
+    pass
+
+
+def _error_payload(error: Exception) -> str:
+    # Followers re-raise what the leader did where callers handle it differently.
+    kind = "unavailable" if isinstance(error, LLMUnavailable) else "error"
+    return json.dumps({"error": str(error), "kind": kind})
+
+
+def _raise_for(outcome: dict):
+    if outcome.get("kind") == "unavailable":
+        raise LLMUnavailable(outcome["error"])
+    raise SingleFlightError(outcome["error"])
+
+
+class _LeaseKeeper(threading.Thread):
+    """Keeps extending a lease while the leader works, so only a dead leader lets it lapse."""
+
+    def __init__(self, lock_key: str, token: str):
+        super().__init__(daemon=True)
+        self.lock_key = lock_key
+        self.token = token
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(LEASE_SECONDS / 3):
+            try:
+                if not _renew(keys=[self.lock_key], args=[self.token, LEASE_SECONDS]):
+                    return
+            except Exception as e:
+                logger.warning(f"[SINGLEFLIGHT] lease renewal failed for {self.lock_key}: {e}")
+
+
+def single_flight(key: str, fn):
+    """Run fn once across all workers for key; concurrent callers wait for its JSON result."""
+    lock_key = f"singleflight:lock:{key}"
+    result_key = f"singleflight:result:{key}"
+    channel = f"singleflight:done:{key}"
+    deadline = time.monotonic() + WAIT_SECONDS
+    counted = False
+
+    while True:
+        token = uuid.uuid4().hex
+        if r.set(lock_key, token, nx=True, ex=LEASE_SECONDS):
+            return _lead(fn, lock_key, token, result_key, channel)
+
+        if not counted:
+            r.hincrby(STATS_KEY, "coalesced", 1)
+            counted = True
+        outcome = _follow(lock_key, result_key, channel, deadline)
+        if outcome is not None:
+            if "error" in outcome:
+                _raise_for(outcome)
+            return outcome["result"]
+        if time.monotonic() >= deadline:
+            r.hincrby(STATS_KEY, "timeouts", 1)
+            raise SingleFlightError(f"Timed out waiting for in-flight generation of {key}.")
+        # The lease lapsed without a result: the leader died, so try to take over.
+        logger.warning(f"[SINGLEFLIGHT] leader for {key} vanished, retrying")
+
+
+def _lead(fn, lock_key: str, token: str, result_key: str, channel: str):
+    r.hincrby(STATS_KEY, "leaders", 1)
+    keeper = _LeaseKeeper(lock_key, token)
+    keeper.start()
+    try:
+        result = fn()
+        # Publish before releasing, so followers never see a free lock without a result.
+        pipe = r.pipeline(transaction=False)
+        pipe.set(result_key, json.dumps({"result": result}), ex=RESULT_TTL)
+        pipe.publish(channel, DONE)
+        pipe.execute()
+        return result
+    except Exception as e:
+        try:
+            r.publish(channel, _error_payload(e))
+        except Exception as publish_error:
+            # Followers notice the released lease on their next poll.
+            logger.warning(f"[SINGLEFLIGHT] could not publish failure on {channel}: {publish_error}")
+        raise
+    finally:
+        keeper.stopped.set()
+        _release(keys=[lock_key], args=[token])
+
+
+def _follow(lock_key: str, result_key: str, channel: str, deadline: float):
+    with _done.wait_on(channel) as waiter:
+        # The leader may have finished before the waiter was registered.
+        payload = r.get(result_key)
+        while payload is None and time.monotonic() < deadline:
+            payload = waiter.get(min(POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+            if payload == DONE or (payload is None and not r.exists(lock_key)):
+                payload = r.get(result_key)
+                break
+        return json.loads(payload) if payload is not None else None
+
+
+async def single_flight_async(key: str, fn):
+    """single_flight for the event loop: fn is a coroutine function, and waiting
+    followers wait on the loop's shared subscription instead of a thread.
+
+    Shares keys and channels with single_flight, so sync and async workers
+    coalesce with each other.
+    """
+    lock_key = f"singleflight:lock:{key}"
+    result_key = f"singleflight:result:{key}"
+    channel = f"singleflight:done:{key}"
+    deadline = time.monotonic() + WAIT_SECONDS
+    counted = False
+
+    while True:
+        token = uuid.uuid4().hex
+        if await ra.set(lock_key, token, nx=True, ex=LEASE_SECONDS):
+            return await _lead_async(fn, lock_key, token, result_key, channel)
+
+        if not counted:
+            await ra.hincrby(STATS_KEY, "coalesced", 1)
+            counted = True
+        outcome = await _follow_async(lock_key, result_key, channel, deadline)
+        if outcome is not None:
+            if "error" in outcome:
+                _raise_for(outcome)
+            return outcome["result"]
+        if time.monotonic() >= deadline:
+            await ra.hincrby(STATS_KEY, "timeouts", 1)
+            raise SingleFlightError(f"Timed out waiting for in-flight generation of {key}.")
+        logger.warning(f"[SINGLEFLIGHT] leader for {key} vanished, retrying")
+
+
+async def _keep_lease(lock_key: str, token: str):
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        try:
+            if not await _renew_async(keys=[lock_key], args=[token, LEASE_SECONDS]):
+                return
+        except Exception as e:
+            logger.warning(f"[SINGLEFLIGHT] lease renewal failed for {lock_key}: {e}")
+
+
+async def _lead_async(fn, lock_key: str, token: str, result_key: str, channel: str):
+    await ra.hincrby(STATS_KEY, "leaders", 1)
+    keeper = asyncio.create_task(_keep_lease(lock_key, token))
+    try:
+        result = await fn()
+        pipe = ra.pipeline(transaction=False)
+        pipe.set(result_key, json.dumps({"result": result}), ex=RESULT_TTL)
+        pipe.publish(channel, DONE)
+        await pipe.execute()
+        return result
+    except Exception as e:
+        try:
+            await ra.publish(channel, _error_payload(e))
+        except Exception as publish_error:
+            logger.warning(f"[SINGLEFLIGHT] could not publish failure on {channel}: {publish_error}")
+        raise
+    finally:
+        keeper.cancel()
+        await _release_async(keys=[lock_key], args=[token])
+
+
+async def _follow_async(lock_key: str, result_key: str, channel: str, deadline: float):
+    async with _done.wait_on_async(channel) as waiter:
+        payload = await ra.get(result_key)
+        while payload is None and time.monotonic() < deadline:
+            payload = await waiter.get(min(POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+            if payload == DONE or (payload is None and not await ra.exists(lock_key)):
+                payload = await ra.get(result_key)
+                break
+        return json.loads(payload) if payload is not None else None
+
+
+def single_flight_stats() -> dict:
+    counters = r.hgetall(STATS_KEY)
+    return {name: int(counters.get(name, 0)) for name in ("leaders", "coalesced", "timeouts")}
@@ -0,0 +1,176 @@
+"""One Redis subscription per process for each channel pattern, shared by every waiter.
+
+A PubSub object holds a pool connection for as long as it is open, so one
+per waiting request would let a burst of waiters take the whole pool.
+A Subscription PSUBSCRIBEs to its pattern once per process (and once per
+event loop for async waiters) and hands each message to the waiters
+registered locally for its channel.
+
+Messages published while the listener reconnects are lost, so waiters
+keep an occasional poll of the state they are waiting on.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from app.utils.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 5.0
+RECONNECT_DELAY = 1.0
+
+_subscriptions = []
+
+
+class _Waiter:
+    def __init__(self):
+        self.messages = deque()
+        self.ready = threading.Condition()
+
+    def put(self, data):
+        with self.ready:
+            self.messages.append(data)
+            self.ready.notify()
+
+    def get(self, timeout: float):
+        """The next message for the channel, or None after timeout seconds."""
+        with self.ready:
+            if not self.messages:
+                self.ready.wait(timeout)
+            return self.messages.popleft() if self.messages else None
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.messages = asyncio.Queue()
+
+    def put(self, data):
+        self.messages.put_nowait(data)
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class _AsyncListener:
+    """The state behind async waiters, bound to the event loop that created it."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.waiters = {}
+        self.connected = asyncio.Event()
+        self.task = None
+
+
+class Subscription:
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        _subscriptions.append(self)
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._connected = threading.Event()
+        self._thread = None
+        self._async = None
+
+    def _dispatch(self, waiters: dict, message: dict):
+        for waiter in list(waiters.get(message["channel"], ())):
+            waiter.put(message["data"])
+
+    @contextmanager
+    def wait_on(self, channel: str):
+        """Register for messages on channel; everything published after this returns is seen."""
+        waiter = _Waiter()
+        with self._lock:
+            self._waiters.setdefault(channel, set()).add(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, daemon=True,
+                                                name=f"subscription {self.pattern}")
+                self._thread.start()
+        if not self._connected.wait(CONNECT_TIMEOUT):
+            logger.warning(f"[SUBSCRIPTION] {self.pattern} not connected yet; relying on polling")
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(channel)
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[channel]
+
+    def _listen(self):
+        while True:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(self.pattern)
+                # The confirmation: from here on no message for the pattern is missed.
+                pubsub.get_message(ignore_subscribe_messages=False, timeout=CONNECT_TIMEOUT)
+                self._connected.set()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        with self._lock:
+                            self._dispatch(self._waiters, message)
+            except Exception as e:
+                self._connected.clear()
+                logger.warning(f"[SUBSCRIPTION] {self.pattern} listener failed, reconnecting: {e}")
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                pubsub.close()
+
+    @asynccontextmanager
+    async def wait_on_async(self, channel: str):
+        """wait_on for the event loop: one listener task per loop instead of a thread."""
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async.loop is not loop:
+            self._async = _AsyncListener(loop)
+        listener = self._async
+        waiter = _AsyncWaiter()
+        listener.waiters.setdefault(channel, set()).add(waiter)
+        if listener.task is None:
+            listener.task = loop.create_task(self._listen_async(listener))
+        try:
+            await asyncio.wait_for(listener.connected.wait(), CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"[SUBSCRIPTION] {self.pattern} not connected yet; relying on polling")
+        try:
+            yield waiter
+        finally:
+            waiters = listener.waiters.get(channel)
+            waiters.discard(waiter)
+            if not waiters:
+                del listener.waiters[channel]
+
+    async def _listen_async(self, listener: _AsyncListener):
+        while True:
+            pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(self.pattern)
+                await pubsub.get_message(ignore_subscribe_messages=False, timeout=CONNECT_TIMEOUT)
+                listener.connected.set()
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._dispatch(listener.waiters, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                listener.connected.clear()
+                logger.warning(f"[SUBSCRIPTION] {self.pattern} listener failed, reconnecting: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await pubsub.aclose()
+
+
+def after_fork():
+    """Forget listeners inherited from the parent; their threads did not survive the fork."""
+    for subscription in _subscriptions:
+        subscription._reset()
@@ -2,7 +2,48 @@ import tempfile
 import subprocess
 import os
 
+from app.utils.metrics import RENDERS, SVG_BYTES, stage
+from app.utils.mindmap_svg import NATIVE_RENDER_VERSION, render_native
+from app.utils.renderer import get_renderer_pool
+from app.utils.svg_minify import MINIFY_VERSION, minify_svg
+
+# "pool" renders through the warm renderer workers, "cli" spawns mmdc per call.
+RENDERER = os.getenv("MERMAID_RENDERER", "pool").lower()
+# Plain mind maps are drawn in Python; the browser renderer handles everything else.
+MERMAID_NATIVE_RENDER = os.getenv("MERMAID_NATIVE_RENDER", "true").lower() == "true"
+SVG_MINIFY = os.getenv("SVG_MINIFY", "true").lower() == "true"
+RENDER_WIDTH = 1200
+RENDER_HEIGHT = 800
+THEME = None
+# Everything that changes the rendered output; part of the SVG cache key.
+RENDER_OPTIONS = {
+    "width": RENDER_WIDTH, "height": RENDER_HEIGHT, "theme": THEME,
+    "native": NATIVE_RENDER_VERSION if MERMAID_NATIVE_RENDER else None,
+    "minify": MINIFY_VERSION if SVG_MINIFY else None,
+}
+
 def convert_mermaid_to_svg(mermaid_code: str) -> str:
+    svg = _render(mermaid_code)
+    SVG_BYTES.inc(len(svg.encode("utf-8")), form="raw")
+    if SVG_MINIFY:
+        with stage("minify"):
+            svg = minify_svg(svg)
+        SVG_BYTES.inc(len(svg.encode("utf-8")), form="minified")
+    return svg
+
+def _render(mermaid_code: str) -> str:
+    with stage("render"):
+        if MERMAID_NATIVE_RENDER:
+            svg = render_native(mermaid_code)
+            if svg is not None:
+                RENDERS.inc(engine="native")
+                return svg
+        RENDERS.inc(engine=RENDERER)
+        if RENDERER == "cli":
+            return _convert_with_cli(mermaid_code)
+        return get_renderer_pool().render(mermaid_code, width=RENDER_WIDTH, height=RENDER_HEIGHT, theme=THEME)
+
+def _convert_with_cli(mermaid_code: str) -> str:
     # Write Mermaid code to a temporary .mmd file
     with tempfile.NamedTemporaryFile(suffix=".mmd", delete=False) as mmd_file:
         mmd_file.write(mermaid_code.encode())
@@ -16,13 +57,13 @@ def convert_mermaid_to_svg(mermaid_code: str) -> str:
             "mmdc",
             "-i", mmd_path,
             "-o", svg_path,
-            "-w", "1200",
-            "-H", "800",
+            "-w", str(RENDER_WIDTH),
+            "-H", str(RENDER_HEIGHT),
             "--puppeteerConfigFile", "puppeteer-config.json"
         ]
 
         subprocess.run(command, check=True)
-        
+
         # Read and return SVG content
         with open(svg_path, "r", encoding="utf-8") as f:
             svg = f.read()
@@ -0,0 +1,108 @@
+"""Size reduction for rendered SVGs before they are cached and served.
+
+Mermaid's output carries a stylesheet covering every diagram type, plus
+comments, indentation and coordinates with a dozen decimals. minify_svg
+drops style rules whose classes appear nowhere in the document, repeated
+rules, comments, the XML prolog, <metadata> and the whitespace between
+tags, and rounds geometry to two decimals (well under a pixel). Text and
+the whitespace inside labels are left alone.
+"""
+import re
+
+# Part of the SVG cache key: bump when the output changes.
+MINIFY_VERSION = "1"
+
+_COMMENT = re.compile(r"<!--.*?-->", re.S)
+_PROLOG = re.compile(r"<\?xml[^>]*\?>|<!DOCTYPE[^>]*>", re.I)
+_METADATA = re.compile(r"<metadata\b[^>]*/>|<metadata\b.*?</metadata>", re.S)
+# Only whitespace containing a line break: pretty-printing, never a space between inline labels.
+_INDENT = re.compile(r">\s*\n\s*<")
+_STYLE = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.S)
+_CLASS_ATTR = re.compile(r'\bclass="([^"]*)"')
+_GEOMETRY = re.compile(
+    r'(\s(?:d|points|transform|x|y|x1|x2|y1|y2|cx|cy|r|rx|ry|width|height|viewBox)=")([^"]*)"'
+)
+_LONG_NUMBER = re.compile(r"-?\d*\.\d{3,}")
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+_CSS_SPACE = re.compile(r"\s+")
+_CSS_BLOCK = re.compile(r"\{[^{}]*\}")
+_CSS_COLON = re.compile(r"\s*:\s*")
+_SELECTOR_CLASS = re.compile(r"\.(-?[_a-zA-Z][\w-]*)")
+_ATTRIBUTE_SELECTOR = re.compile(r"\[[^\]]*\]")
+
+
+def _round(match) -> str:
+    text = f"{float(match.group(0)):.2f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _minify_css(css: str) -> str:
+    css = _CSS_COMMENT.sub("", css)
+    css = _CSS_SPACE.sub(" ", css)
+    css = _CSS_PUNCTUATION.sub(r"\1", css).replace(";}", "}")
+    # Inside declaration blocks only: in a selector, "a :hover" and "a:hover" differ.
+    return _CSS_BLOCK.sub(lambda m: _CSS_COLON.sub(":", m.group(0)), css).strip()
+
+
+def _rules(css: str) -> list:
+    """Top-level rules and at-rules, each with its own braces or semicolon."""
+    rules, start, depth = [], 0, 0
+    for i, ch in enumerate(css):
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:i + 1])
+                start = i + 1
+        elif ch == ";" and depth == 0:
+            rules.append(css[start:i + 1])
+            start = i + 1
+    if css[start:].strip():
+        rules.append(css[start:])
+    return rules
+
+
+def _selector_used(selector: str, classes: set) -> bool:
+    if "(" in selector:
+        # :not(.x), :is(...) and friends can match without the class; keep them.
+        return True
+    return all(name in classes for name in _SELECTOR_CLASS.findall(_ATTRIBUTE_SELECTOR.sub("", selector)))
+
+
+def _prune_rules(css: str, classes: set) -> str:
+    kept = []
+    for rule in _rules(css):
+        if rule.startswith("@") or "{" not in rule:
+            kept.append(rule)
+            continue
+        selectors, _, body = rule.partition("{")
+        used = [s for s in selectors.split(",") if _selector_used(s, classes)]
+        if used:
+            kept.append(",".join(used) + "{" + body)
+    # An identical later rule has the same effect, so only the last copy is kept.
+    seen, unique = set(), []
+    for rule in reversed(kept):
+        if rule not in seen:
+            seen.add(rule)
+            unique.append(rule)
+    return "".join(reversed(unique))
+
+
+def minify_svg(svg: str) -> str:
+    svg = _PROLOG.sub("", _COMMENT.sub("", svg))
+    svg = _METADATA.sub("", svg)
+    svg = _INDENT.sub("><", svg).strip()
+
+    classes = set()
+    for value in _CLASS_ATTR.findall(_STYLE.sub("", svg)):
+        classes.update(value.split())
+
+    def style(match):
+        css = _prune_rules(_minify_css(match.group(2)), classes)
+        return f"{match.group(1)}{css}{match.group(3)}" if css else ""
+
+    svg = _STYLE.sub(style, svg)
+    return _GEOMETRY.sub(lambda m: m.group(1) + _LONG_NUMBER.sub(_round, m.group(2)) + '"', svg)
@@ -0,0 +1,139 @@
+import hashlib
+import re
+import threading
+import unicodedata
+
+_JOINERS = re.compile(r"[-_'‐-―‘’]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# Punctuation that carries meaning in topic names ("C++", "C#").
+_SYMBOLS = {"+": " plus ", "#": " sharp "}
+
+NUM_HASHES = 32
+# Two rows per band: a one-letter typo in a short topic still shares a band with the original.
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+_PRIME = (1 << 61) - 1
+# Words shorter than this must match exactly: "i"/"ii", "c"/"r" name different things.
+MIN_TYPO_WORD = 4
+# Fixed coefficients keep signatures stable across processes and restarts.
+_COEFFS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % _PRIME or 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _PRIME)
+    for i in range(NUM_HASHES)
+]
+
+
+def _stem(word: str) -> str:
+    # Deliberately light: plural folding only, so distinct concepts stay distinct.
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize_topic(topic: str, stem: bool = False) -> str:
+    """Canonical form of a topic: "Photo-Synthesis " and "photosynthesis" map to the same key."""
+    text = unicodedata.normalize("NFKD", topic)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = _JOINERS.sub("", text)
+    for symbol, word in _SYMBOLS.items():
+        text = text.replace(symbol, word)
+    text = _PUNCTUATION.sub(" ", text)
+    words = text.split()
+    if stem:
+        words = [_stem(word) for word in words]
+    return " ".join(words)
+
+
+def _shingles(topic: str) -> set:
+    padded = f"  {topic} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _signature(shingles: set) -> tuple:
+    values = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return tuple(min((a * v + b) % _PRIME for v in values) for a, b in _COEFFS)
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """One substitution, insertion, deletion or swap of adjacent letters apart (or equal)."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diffs) <= 1 or (
+            len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+        )
+    shorter, longer = sorted((a, b), key=len)
+    i = 0
+    while i < len(shorter) and shorter[i] == longer[i]:
+        i += 1
+    return shorter[i:] == longer[i + 1:]
+
+
+def typo_of(a: str, b: str) -> bool:
+    """Whether two canonical topics differ only by typos: the same words in order, each within one edit.
+
+    Similar shingles are not enough: "world war 1"/"world war 2" and
+    "organic chemistry"/"inorganic chemistry" score higher than a real typo,
+    so numbers and short words must match exactly, and a word whose first
+    letter changed ("atypical") is a different word.
+    """
+    words_a, words_b = a.split(), b.split()
+    if len(words_a) != len(words_b):
+        return False
+    for x, y in zip(words_a, words_b):
+        if x == y:
+            continue
+        if min(len(x), len(y)) < MIN_TYPO_WORD or any(ch.isdigit() for ch in x + y):
+            return False
+        if x[0] != y[0] or not _within_one_edit(x, y):
+            return False
+    return True
+
+
+class TopicIndex:
+    """MinHash/LSH index over canonical topics for near-duplicate lookups."""
+
+    def __init__(self):
+        self.shingles = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.shingles)
+
+    def add(self, topic: str):
+        shingles = _shingles(topic)
+        signature = _signature(shingles)
+        with self.lock:
+            if topic in self.shingles:
+                return
+            self.shingles[topic] = shingles
+            for band in range(BANDS):
+                key = (band, signature[band * ROWS:(band + 1) * ROWS])
+                self.buckets.setdefault(key, set()).add(topic)
+
+    def discard(self, topic: str):
+        with self.lock:
+            if self.shingles.pop(topic, None) is None:
+                return
+            for members in self.buckets.values():
+                members.discard(topic)
+
+    def closest(self, topic: str, threshold: float):
+        """Most similar indexed topic that is a typo_of() topic with Jaccard similarity >= threshold, or None."""
+        shingles = _shingles(topic)
+        signature = _signature(shingles)
+        with self.lock:
+            candidates = set()
+            for band in range(BANDS):
+                candidates |= self.buckets.get((band, signature[band * ROWS:(band + 1) * ROWS]), set())
+            scored = [(jaccard(shingles, self.shingles[c]), c) for c in candidates if c != topic and typo_of(topic, c)]
+        best = max(scored, default=None)
+        return best[1] if best and best[0] >= threshold else None
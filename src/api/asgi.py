@@ -0,0 +1,180 @@
+"""ASGI entry point: the hot mind-map and image routes on asyncio, everything else on Flask.
+
+    uvicorn asgi:app --app-dir src/api --host 0.0.0.0 --port 3000
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c src/api/gunicorn.conf.py asgi:app
+
+POST /api/generate-mindmap and GET /api/related-images are served by the
+coroutines below, on the asyncio Redis, aiohttp and async LLM clients, so a
+request waiting on Gemini or an image search holds no thread. They answer
+with the same JSON, status codes and headers as the Flask views in
+app/routes/mindmap.py. Every other path falls through to the Flask app,
+which runs in a thread pool as before; sessions are shared because both
+sides read the same Flask-Session cookie and Redis keys. CORS for the routes
+here is answered by Starlette with the Flask-CORS settings; every other path
+keeps Flask-CORS.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from app import create_app
+from app.routes.mindmap import IMAGE_MISS_WAIT_SECONDS, shape_result
+from app.utils.generation import generate_mind_map_async
+from app.utils.http_client import get_async_http_client
+from app.utils.image_scrapper import scrape_images_async
+from app.utils.llm import LLMUnavailable
+from app.utils.metrics import REDIS_ROUND_TRIPS, REQUEST_SECONDS
+from app.utils.redis_client import LazyAsyncRedis, count_round_trips, round_trips
+from app.utils.session import update_last_active_async
+
+logger = logging.getLogger(__name__)
+
+flask_app = create_app()
+# Session payloads are binary (msgpack), like the client Flask-Session was given.
+_session_redis = LazyAsyncRedis(decode_responses=False)
+# Strong references to fire-and-forget tasks, which asyncio only holds weakly.
+_background = set()
+
+
+async def _session_user(request):
+    """The logged-in email from the Flask-Session cookie, or None.
+
+    Flask-Session's public open_session() reads Redis synchronously, which
+    would hold a thread per request here, so this repeats its lookup on the
+    async client through the interface's own helpers. Those are internal:
+    Flask-Session is pinned in requirements.txt for this, and
+    tests/test_asgi.py checks a session Flask saved is read back.
+    """
+    interface = flask_app.session_interface
+    sid = request.cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if not sid:
+        return None
+    if interface.use_signer:
+        try:
+            sid = interface._unsign(flask_app, sid)
+        except BadSignature:
+            return None
+    data = await _session_redis.get(interface._get_store_id(sid))
+    return interface.serializer.decode(data).get("user") if data else None
+
+
+def _observe(request, endpoint: str, started: float, response):
+    # The same per-request headers and metrics as create_app()'s after_request hook.
+    trips = round_trips()
+    response.headers["X-Redis-Round-Trips"] = str(trips)
+    REDIS_ROUND_TRIPS.observe(trips, endpoint=endpoint)
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started, endpoint=endpoint, method=request.method, status=response.status_code
+    )
+    return response
+
+
+async def _prefetch_images(topic: str):
+    # The page asks for the topic's images right after the map; warm them meanwhile.
+    try:
+        await scrape_images_async(topic)
+    except Exception as e:
+        logger.info(f"[IMAGES] prefetch for '{topic}' failed: {e}")
+
+
+async def generate_mindmap(request):
+    started = time.perf_counter()
+    count_round_trips()
+    endpoint = "mindmap.generate_mindmap"
+    email = await _session_user(request)
+    if email is None:
+        return _observe(request, endpoint, started, JSONResponse({"error": "Not logged in"}, 401))
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        await update_last_active_async(email)
+        return _observe(request, endpoint, started, JSONResponse({"error": "Expected a JSON object"}, 400))
+    topic, map_type, text = data.get("topic"), data.get("type"), data.get("text")
+    touch = asyncio.create_task(update_last_active_async(email))
+    if not topic or not map_type:
+        await touch
+        return _observe(request, endpoint, started, JSONResponse({"error": "Missing fields"}, 400))
+
+    prefetch = asyncio.create_task(_prefetch_images(topic)) if map_type not in ("text", "text-to-mindmap") else None
+    try:
+        result = await generate_mind_map_async(email, topic, map_type, text)
+        response = JSONResponse(shape_result(result, data))
+    except LLMUnavailable as e:
+        logger.warning(f"[BUSY] generate_mindmap: {e}")
+        response = JSONResponse({"error": str(e)}, 503, headers={"Retry-After": "5"})
+    except Exception as e:
+        logger.error(f"[ERROR] generate_mindmap failed: {e}")
+        response = JSONResponse({"error": str(e)}, 500)
+    await touch
+    if prefetch is not None and not prefetch.done():
+        # Let it finish in the background; the image route joins the same fetch.
+        _background.add(prefetch)
+        prefetch.add_done_callback(_background.discard)
+    return _observe(request, endpoint, started, response)
+
+
+async def related_images(request):
+    started = time.perf_counter()
+    count_round_trips()
+    endpoint = "mindmap.related_images"
+    email = await _session_user(request)
+    touch = asyncio.create_task(update_last_active_async(email)) if email else None
+
+    topic = request.query_params.get("topic")
+    try:
+        if not topic:
+            return _observe(request, endpoint, started, JSONResponse({"error": "Missing topic"}, 400))
+        try:
+            images = await scrape_images_async(topic, wait=IMAGE_MISS_WAIT_SECONDS)
+        except Exception as e:
+            return _observe(request, endpoint, started, JSONResponse({"error": str(e)}, 500))
+        return _observe(request, endpoint, started, JSONResponse(images))
+    finally:
+        if touch is not None:
+            await touch
+
+
+class _CORSForRoutes:
+    """CORSMiddleware for the given paths only, so the mounted Flask app keeps Flask-CORS."""
+
+    def __init__(self, app, paths, **options):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.cors = CORSMiddleware(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        handler = self.cors if scope["type"] == "http" and scope["path"] in self.paths else self.app
+        await handler(scope, receive, send)
+
+
+async def _shutdown():
+    await get_async_http_client().close()
+
+
+_async_routes = [
+    Route("/api/generate-mindmap", generate_mindmap, methods=["POST"]),
+    Route("/api/related-images", related_images, methods=["GET"]),
+]
+
+app = Starlette(
+    routes=[*_async_routes, Mount("/", WSGIMiddleware(flask_app))],
+    # Mirrors the Flask-CORS setup in create_app() for the routes served here.
+    middleware=[
+        Middleware(_CORSForRoutes, paths=[route.path for route in _async_routes],
+                   allow_origins=[os.getenv("FRONTEND_URL")], allow_credentials=True,
+                   allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor"]),
+    ],
+    on_shutdown=[_shutdown],
+)
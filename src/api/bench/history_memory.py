@@ -0,0 +1,96 @@
+"""Memory per user of mind-map history: old JSON hash vs. shared compressed bodies.
+
+Needs a real Redis (MEMORY USAGE); point REDIS_URL at a scratch instance.
+Run from src/api:
+
+    python -m bench.history_memory
+    python -m bench.history_memory --users 200 --maps 20 --distinct 50 --json
+
+Writes --users synthetic users in the old user:<email>:mindmaps format, each
+with --maps maps drawn from --distinct different Mermaid bodies (popular
+topics are shared), measures them, migrates them by reading their first
+history page, measures again and deletes everything it created.
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+from app.utils.session import TOTAL_MAPS_KEY, history_memory, history_page, reset_mind_maps, r
+
+EMAIL = "bench-history-{}@example.invalid"
+
+
+def _body(i: int) -> str:
+    lines = ["mindmap", f"  root((Topic {i}))"]
+    for branch in range(6):
+        lines.append(f"    Branch {i}.{branch}")
+        lines.extend(f"      Detail {i}.{branch}.{leaf} with some descriptive text" for leaf in range(4))
+    return "\n".join(lines)
+
+
+def _seed_legacy(users: int, maps: int, distinct: int):
+    bodies = [_body(i) for i in range(distinct)]
+    start = datetime(2024, 1, 1)
+    for u in range(users):
+        entries = {}
+        for m in range(maps):
+            map_id = f"{u}-{m}"
+            entries[map_id] = json.dumps({
+                "id": map_id,
+                "createdAt": (start + timedelta(minutes=m)).isoformat(),
+                "topic": f"Topic {m}",
+                "type": "analogy" if m % 4 == 0 else "simple",
+                # Skewed choice: a few popular maps, a long tail of rare ones.
+                "mermaidCode": bodies[min(int(random.paretovariate(1.2)) - 1, distinct - 1)],
+            })
+        r.hset(f"user:{EMAIL.format(u)}:mindmaps", mapping=entries)
+    # Matches what store_mind_map counted, so the cleanup leaves the total as it was.
+    r.incrby(TOTAL_MAPS_KEY, users * maps)
+
+
+def _measure(users: int) -> dict:
+    reports = [history_memory(EMAIL.format(u)) for u in range(users)]
+    return {
+        "legacyBytesPerUser": round(sum(rep["legacyBytes"] for rep in reports) / users),
+        "historyBytesPerUser": round(sum(rep["historyBytes"] for rep in reports) / users),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--maps", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=100, help="number of different Mermaid bodies")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    random.seed(0)
+    _seed_legacy(args.users, args.maps, args.distinct)
+    try:
+        before = _measure(args.users)
+        for u in range(args.users):
+            history_page(EMAIL.format(u), 0, 1, include_code=False)
+        after = _measure(args.users)
+    finally:
+        for u in range(args.users):
+            reset_mind_maps(EMAIL.format(u))
+
+    results = {
+        "users": args.users,
+        "mapsPerUser": args.maps,
+        "distinctBodies": args.distinct,
+        "bytesPerUserBefore": before["legacyBytesPerUser"],
+        "bytesPerUserAfter": after["historyBytesPerUser"],
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.users} users x {args.maps} maps, {args.distinct} distinct bodies")
+    print(f"old hash format   {results['bytesPerUserBefore']:>10} bytes/user")
+    print(f"shared bodies     {results['bytesPerUserAfter']:>10} bytes/user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Micro-benchmark for the image scraper's HTML extraction backends.
+
+Run from src/api:
+
+    python -m bench.image_extract                       # bundled fixture
+    python -m bench.image_extract saved_page.html --json
+
+Each backend extracts the first max_images + 1 <img> tags from every fixture,
+fed in 16 KiB chunks the way the scraper streams a response. Reports
+pages/second and peak traced allocations per page.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+
+from app.utils.html_images import BACKENDS, extract_img_attrs
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "*.html")
+CHUNK_SIZE = 16384
+
+
+def _chunks(page: bytes):
+    for start in range(0, len(page), CHUNK_SIZE):
+        yield page[start:start + CHUNK_SIZE]
+
+
+def _available(backend: str) -> bool:
+    if backend != "lxml":
+        return True
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run(pages, backend: str, limit: int, iterations: int) -> dict:
+    found = [len(extract_img_attrs(_chunks(page), limit, "utf-8", backend)) for page in pages]
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for page in pages:
+            extract_img_attrs(_chunks(page), limit, "utf-8", backend)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    peaks = []
+    for page in pages:
+        tracemalloc.reset_peak()
+        extract_img_attrs(_chunks(page), limit, "utf-8", backend)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        "backend": backend,
+        "pagesPerSecond": round(iterations * len(pages) / elapsed, 1),
+        "msPerPage": round(1000 * elapsed / (iterations * len(pages)), 3),
+        "peakAllocKiBPerPage": round(sum(peaks) / len(peaks) / 1024, 1),
+        "imgTagsFound": found,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", help="saved HTML pages (default: bench/fixtures/*.html)")
+    parser.add_argument("--max-images", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    paths = args.fixtures or sorted(glob.glob(FIXTURES))
+    pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages.append(f.read())
+
+    results = [
+        run(pages, backend, args.max_images + 1, args.iterations)
+        for backend in BACKENDS if _available(backend)
+    ]
+
+    if args.json:
+        print(json.dumps({"fixtures": paths, "results": results}, indent=2))
+        return
+
+    print(f"{len(pages)} fixture page(s), {sum(map(len, pages)) // 1024} KiB total")
+    print(f"{'backend':<8} {'pages/s':>10} {'ms/page':>10} {'peak KiB':>10}")
+    for result in results:
+        print(f"{result['backend']:<8} {result['pagesPerSecond']:>10} {result['msPerPage']:>10} "
+              f"{result['peakAllocKiBPerPage']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Load benchmark for the mind-map API, with local stand-ins for every upstream.
+
+Run from src/api (the default in-process Redis needs `pip install 'fakeredis[lua]'`):
+
+    python -m bench.load                                   # in-process fake Redis
+    REDIS_URL=redis://localhost:6379/15 python -m bench.load --redis env
+    python -m bench.load --concurrency 1,8,32 --requests 400 \\
+        --mix hit=60,miss=10,admin=10,images=20 --json > run.json
+
+The app is built with create_app() and driven through Flask test clients,
+one per thread. Upstreams are replaced by (see bench/standins.py):
+
+- the fake LLM backend (LLM_BACKEND=fake, --llm-latency seconds per call),
+- a local HTTP server answering image searches with the bundled fixture page,
+- a fixed-latency stub renderer (--renderer stub, the default) or the real
+  Node renderer pool (--renderer pool).
+
+Scenarios: "hit" generates a map for an already cached topic, "miss" for a
+new one, "admin" lists /api/admin/sessions and "images" looks up related
+images. For each concurrency level this reports throughput, p50/p95/p99
+latency per scenario and process RSS. Client threads share the interpreter
+with the app, so compare runs with each other rather than reading the
+numbers as absolute capacity; bench.serve drives real servers over HTTP.
+Use --redis env with a scratch database: the run writes users, maps and
+cache entries.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.standins import ADMIN_EMAIL, configure_env, start_image_server, stub_renderer
+
+SCENARIOS = ("hit", "miss", "admin", "images")
+WARM_TOPICS = [f"Warm topic {i}" for i in range(20)]
+# The map types the frontend sends for topics, so prompts and cache keys match production.
+MAP_TYPES = ("simple", "analogy")
+IMAGE_TOPICS = [f"Image topic {i}" for i in range(50)]
+USER_FIELDS = {"google": "true", "name": "Bench user", "limit": str(10 ** 9)}
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {SCENARIOS}")
+        mix[name] = float(weight)
+    return mix
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", default="1,4,16",
+                        type=lambda v: [int(c) for c in v.split(",")], help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("hit=60,miss=10,admin=10,images=20"))
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--render-latency", type=float, default=0.05, help="seconds per stub render")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+
+
+def _rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except OSError:
+        # Peak rather than current RSS; KiB on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2 ** 20 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return round(sorted_values[index] * 1000, 2)
+
+
+class InProcessTransport:
+    """Flask test clients against an app built in this process."""
+
+    def __init__(self, args):
+        from app import create_app
+        from app.utils.session import register_user
+
+        if args.renderer == "stub":
+            stub_renderer(args.render_latency)
+        self.app = create_app()
+        # The test client speaks plain HTTP.
+        self.app.config["SESSION_COOKIE_SECURE"] = False
+        self.register_user = register_user
+
+    def login(self, email: str):
+        self.register_user(email, USER_FIELDS)
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["user"] = email
+        return client
+
+    def post(self, client, path: str, body: dict):
+        return client.post(path, json=body)
+
+    def get(self, client, path: str, params: dict = None):
+        return client.get(path, query_string=params)
+
+
+class HttpTransport:
+    """requests sessions against a running bench.serve_app server."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def login(self, email: str):
+        import requests
+
+        client = requests.Session()
+        client.post(f"{self.base_url}/bench/login", json={"email": email}, timeout=60).raise_for_status()
+        return client
+
+    def post(self, client, path: str, body: dict):
+        return client.post(self.base_url + path, json=body, timeout=60)
+
+    def get(self, client, path: str, params: dict = None):
+        return client.get(self.base_url + path, params=params, timeout=60)
+
+
+class Bench:
+    def __init__(self, args, transport, rss=_rss_mib):
+        self.args = args
+        self.transport = transport
+        self.rss = rss
+        self.local = threading.local()
+        self.user_ids = itertools.count()
+
+    def _clients(self):
+        if not hasattr(self.local, "user"):
+            user_id = next(self.user_ids)
+            self.local.user = self.transport.login(f"bench-{user_id}@example.invalid")
+            self.local.admin = self.transport.login(ADMIN_EMAIL)
+            self.local.random = random.Random(self.args.seed * 100003 + user_id)
+        return self.local
+
+    def request(self, scenario: str):
+        clients = self._clients()
+        if scenario == "admin":
+            return self.transport.get(clients.admin, "/api/admin/sessions", {"limit": 100})
+        if scenario == "images":
+            topic = clients.random.choice(IMAGE_TOPICS)
+            return self.transport.get(clients.user, "/api/related-images", {"topic": topic})
+        topic = clients.random.choice(WARM_TOPICS) if scenario == "hit" else f"Cold topic {uuid.uuid4().hex[:12]}"
+        map_type = clients.random.choice(MAP_TYPES)
+        return self.transport.post(clients.user, "/api/generate-mindmap", {"topic": topic, "type": map_type})
+
+    def warm_up(self):
+        user = self._clients().user
+        for topic in WARM_TOPICS:
+            for map_type in MAP_TYPES:
+                self.transport.post(user, "/api/generate-mindmap", {"topic": topic, "type": map_type})
+
+    def run_level(self, concurrency: int) -> dict:
+        mix = self.args.mix
+        names, weights = list(mix), list(mix.values())
+        chooser = random.Random(self.args.seed + concurrency)
+        plan = chooser.choices(names, weights, k=self.args.requests)
+        tasks = iter(plan)
+        tasks_lock = threading.Lock()
+        samples = {name: [] for name in names}
+        errors = {name: 0 for name in names}
+        samples_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with tasks_lock:
+                    scenario = next(tasks, None)
+                if scenario is None:
+                    return
+                start = time.perf_counter()
+                response = self.request(scenario)
+                elapsed = time.perf_counter() - start
+                with samples_lock:
+                    samples[scenario].append(elapsed)
+                    if response.status_code >= 400:
+                        errors[scenario] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+        scenarios = {}
+        for name in names:
+            values = sorted(samples[name])
+            scenarios[name] = {
+                "count": len(values),
+                "errors": errors[name],
+                "meanMs": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+                "p50Ms": _percentile(values, 50),
+                "p95Ms": _percentile(values, 95),
+                "p99Ms": _percentile(values, 99),
+            }
+        return {
+            "concurrency": concurrency,
+            "requests": len(plan),
+            "seconds": round(elapsed, 3),
+            "throughput": round(len(plan) / elapsed, 1),
+            "errors": sum(errors.values()),
+            "rssMiB": self.rss(),
+            "scenarios": scenarios,
+        }
+
+
+def print_levels(levels: list):
+    print(f"{'conc':>5} {'req/s':>8} {'errors':>7} {'rss MiB':>8}  "
+          f"{'scenario':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for level in levels:
+        prefix = f"{level['concurrency']:>5} {level['throughput']:>8} {level['errors']:>7} {level['rssMiB']:>8}"
+        for name, stats in level["scenarios"].items():
+            print(f"{prefix}  {name:<8} {stats['p50Ms']:>8} {stats['p95Ms']:>8} {stats['p99Ms']:>8}")
+            prefix = " " * len(prefix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_load_arguments(parser)
+    parser.add_argument("--redis", choices=("fake", "env"), default="fake",
+                        help="in-process fakeredis, or the REDIS_URL from the environment")
+    parser.add_argument("--renderer", choices=("stub", "pool"), default="stub")
+    args = parser.parse_args()
+
+    image_server = start_image_server()
+    configure_env(image_server.server_port, args.llm_latency, max(args.concurrency) * 2,
+                  redis_url="fakeredis://" if args.redis == "fake" else None)
+    if args.redis == "fake":
+        # Without lupa every generation fails on EVALSHA and the run stalls instead of failing.
+        from app.utils.redis_client import require_fakeredis_lua
+        require_fakeredis_lua()
+    logging.disable(logging.INFO)
+
+    bench = Bench(args, InProcessTransport(args))
+    bench.warm_up()
+    results = {
+        "config": {
+            "requests": args.requests,
+            "mix": args.mix,
+            "redis": args.redis,
+            "renderer": args.renderer,
+            "llmLatency": args.llm_latency,
+            "renderLatency": args.render_latency,
+            "seed": args.seed,
+        },
+        "levels": [bench.run_level(c) for c in args.concurrency],
+    }
+    image_server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"mix {args.mix}, {args.requests} requests per level")
+        print_levels(results["levels"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Compare serving modes under the same load: the Flask dev server, gunicorn and uvicorn (asgi.py).
+
+Run from src/api:
+
+    python -m bench.serve                                  # all modes, fake Redis over TCP
+    python -m bench.serve --modes gunicorn,asgi --llm-latency 1 --concurrency 64,256
+    python -m bench.serve --modes gunicorn --concurrency 8,32,64 --json > gunicorn.json
+    GUNICORN_WORKER_CLASS=gevent python -m bench.serve --modes gunicorn
+
+Each mode starts bench.serve_app (the real app with the stand-ins from
+bench/standins.py) in a subprocess on a free port, warms the map cache, then
+runs the bench.load scenarios over HTTP at each concurrency level. RSS is
+summed over the server's whole process tree (Linux only), so gunicorn's
+master and workers are all counted. gunicorn reads gunicorn.conf.py plus the
+usual GUNICORN_* / WEB_CONCURRENCY variables from the environment. "asgi"
+runs a single uvicorn process serving the async mind-map and image routes,
+with everything else (login, admin) on Flask in its thread pool.
+
+--redis fake (the default) runs a fakeredis TCP server in this process and
+flushes it between modes; --redis env uses REDIS_URL, which should point
+at a scratch database because it is never flushed.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from bench.load import Bench, HttpTransport, add_load_arguments, print_levels
+from bench.standins import configure_env, start_image_server
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("flask", "gunicorn", "asgi")
+STARTUP_TIMEOUT = 60
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_fake_redis():
+    from app.utils.redis_client import require_fakeredis_lua
+    require_fakeredis_lua()
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", _free_port()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{server.server_address[1]}"
+
+
+def _command(mode: str, port: int) -> list:
+    if mode == "flask":
+        # What the Dockerfile used to run: the threaded development server.
+        return [sys.executable, "-m", "flask", "--app", "bench.serve_app:app", "run",
+                "--host", "127.0.0.1", "--port", str(port), "--no-reload", "--no-debugger", "--with-threads"]
+    if mode == "asgi":
+        return [sys.executable, "-m", "uvicorn", "bench.serve_app:app", "--host", "127.0.0.1",
+                "--port", str(port), "--no-access-log"]
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}", "bench.serve_app:app"]
+
+
+def _wait_until_up(base_url: str, process: subprocess.Popen):
+    import requests
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode} during startup")
+        try:
+            requests.get(f"{base_url}/metrics", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not answer within {STARTUP_TIMEOUT}s")
+
+
+def _tree_rss_mib(pid: int) -> float:
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return round(total / 2 ** 20, 1)
+
+
+def run_mode(mode: str, args) -> dict:
+    port = _free_port()
+    env = {**os.environ, "BENCH_RENDER_LATENCY": str(args.render_latency), "GUNICORN_ACCESS_LOG": "",
+           "BENCH_SERVER": "asgi" if mode == "asgi" else "wsgi"}
+    process = subprocess.Popen(_command(mode, port), cwd=API_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(base_url, process)
+        bench = Bench(args, HttpTransport(base_url), rss=lambda: _tree_rss_mib(process.pid))
+        bench.warm_up()
+        return {"levels": [bench.run_level(c) for c in args.concurrency]}
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_load_arguments(parser)
+    parser.add_argument("--modes", default=",".join(MODES), type=lambda v: v.split(","),
+                        help=f"comma-separated, from {MODES}")
+    parser.add_argument("--redis", choices=("fake", "env"), default="fake",
+                        help="fakeredis TCP server in this process, or the REDIS_URL from the environment")
+    args = parser.parse_args()
+
+    image_server = start_image_server()
+    redis_server, redis_url = _start_fake_redis() if args.redis == "fake" else (None, None)
+    # The servers inherit these; the upstream stand-ins stay in this process.
+    configure_env(image_server.server_port, args.llm_latency, 1000, redis_url=redis_url)
+    logging.disable(logging.INFO)
+
+    results = {
+        "config": {
+            "requests": args.requests,
+            "mix": args.mix,
+            "redis": args.redis,
+            "llmLatency": args.llm_latency,
+            "renderLatency": args.render_latency,
+            "seed": args.seed,
+            "gunicorn": {k: v for k, v in os.environ.items() if k.startswith("GUNICORN_") or k == "WEB_CONCURRENCY"},
+        },
+        "modes": {},
+    }
+    for mode in args.modes:
+        if redis_server is not None:
+            import redis
+            redis.Redis.from_url(redis_url).flushall()
+        results["modes"][mode] = run_mode(mode, args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"mix {args.mix}, {args.requests} requests per level")
+    for mode, result in results["modes"].items():
+        print(f"\n[{mode}]")
+        print_levels(result["levels"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""The app as bench.serve runs it: stub renderer plus a bench-only login route.
+
+Never deploy this module: /bench/login signs anyone in as anyone.
+"""
+import os
+
+from flask import jsonify, request, session
+
+from app.utils.session import register_user
+from bench.load import USER_FIELDS
+from bench.standins import stub_renderer
+
+if os.getenv("BENCH_RENDERER", "stub") == "stub":
+    stub_renderer(float(os.getenv("BENCH_RENDER_LATENCY", "0.05")))
+
+
+def prepare(flask_app):
+    # The benchmark client speaks plain HTTP.
+    flask_app.config["SESSION_COOKIE_SECURE"] = False
+
+    @flask_app.route("/bench/login", methods=["POST"])
+    def bench_login():
+        email = request.json["email"]
+        register_user(email, USER_FIELDS)
+        session["user"] = email
+        return jsonify({"user": email})
+
+    return flask_app
+
+
+if os.getenv("BENCH_SERVER") == "asgi":
+    import asgi
+
+    prepare(asgi.flask_app)
+    app = asgi.app
+else:
+    from app import create_app
+
+    app = prepare(create_app())
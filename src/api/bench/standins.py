@@ -0,0 +1,63 @@
+"""Local stand-ins for the app's upstreams, shared by the benchmarks.
+
+configure_env() must run before anything under app is imported: most
+settings are read from the environment at import time.
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "image_search_synthetic.html")
+ADMIN_EMAIL = "bench-admin@example.invalid"
+
+
+def start_image_server(port: int = 0) -> ThreadingHTTPServer:
+    """Serve the bundled image-search fixture for every GET, in a daemon thread."""
+    with open(FIXTURE, "rb") as f:
+        page = f.read()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure_env(image_port: int, llm_latency: float, max_in_flight: int, redis_url: str = None):
+    if redis_url:
+        os.environ["REDIS_URL"] = redis_url
+    os.environ.update(
+        LLM_BACKEND="fake",
+        FAKE_LLM_LATENCY=str(llm_latency),
+        # The fake backend must not be the bottleneck being measured.
+        LLM_RATE_PER_SECOND="100000",
+        LLM_BURST="100000",
+        LLM_MAX_IN_FLIGHT=str(max_in_flight),
+        IMAGE_SEARCH_URL=f"http://127.0.0.1:{image_port}/search?q={{}}",
+        ADMIN_EMAIL=ADMIN_EMAIL,
+        SECRET_KEY=os.getenv("SECRET_KEY", "bench"),
+        FRONTEND_URL=os.getenv("FRONTEND_URL", "http://localhost"),
+    )
+
+
+def stub_renderer(latency: float):
+    """Replace Mermaid rendering with a fixed delay and a placeholder SVG."""
+    import app.utils.generation as generation
+    from app.utils.metrics import stage
+
+    def render(code: str) -> str:
+        with stage("render"):
+            time.sleep(latency)
+            return f'<svg xmlns="http://www.w3.org/2000/svg"><!-- {len(code)} chars --></svg>'
+
+    generation.convert_mermaid_to_svg = render
@@ -0,0 +1,133 @@
+"""Startup cost: what importing the app loads, and how long a fresh server takes to answer.
+
+Run from src/api:
+
+    python -m bench.startup                          # server and asgi imports, all serving modes
+    python -m bench.startup --modules server --modes gunicorn --runs 5
+    python -m bench.startup --json > startup.json
+
+Imports: `python -X importtime -c "import <module>"` in a fresh interpreter,
+--runs times, keeping the fastest run. Self times are summed per top-level
+package, so "redis" includes redis.asyncio and "app" only the app's own
+modules. Nothing connects at import, so REDIS_URL may point nowhere.
+
+First request: each mode from bench.serve is started on a free port with
+the stand-ins (fake LLM, stub renderer, fakeredis over TCP). "boot" is the
+time until /metrics answers, "first" the first mind-map generation after
+that (a cache miss, which builds the LLM client, the Redis pools and the
+Lua scripts on first use), and "second" another miss for comparison. RSS
+is summed over the server's process tree once both have been served.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from bench.serve import API_DIR, MODES, _command, _free_port, _start_fake_redis, _tree_rss_mib, _wait_until_up
+from bench.standins import configure_env, start_image_server
+
+MODULES = ("server", "asgi")
+
+
+def import_times(module: str, runs: int) -> dict:
+    """Microseconds of self time per top-level package, plus the cumulative total, fastest run."""
+    env = {**os.environ, "REDIS_URL": os.getenv("REDIS_URL", "redis://127.0.0.1:1")}
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=API_DIR, env=env, capture_output=True, text=True, check=True)
+        packages, total = defaultdict(int), 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            packages[name.strip().split(".")[0]] += int(self_us)
+            # The module asked for is the last, outermost entry.
+            total = int(cumulative_us)
+        if best is None or total < best["totalUs"]:
+            best = {"totalUs": total, "packages": dict(packages)}
+    return best
+
+
+def first_requests(mode: str, runs: int) -> dict:
+    import requests
+
+    samples = defaultdict(list)
+    for run in range(runs):
+        port = _free_port()
+        env = {**os.environ, "GUNICORN_ACCESS_LOG": "", "BENCH_SERVER": "asgi" if mode == "asgi" else "wsgi"}
+        started = time.perf_counter()
+        process = subprocess.Popen(_command(mode, port), cwd=API_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_until_up(base_url, process)
+            samples["boot"].append(time.perf_counter() - started)
+            client = requests.Session()
+            client.post(f"{base_url}/bench/login", json={"email": f"startup-{mode}-{run}@bench.local"}).raise_for_status()
+            for label in ("first", "second"):
+                begun = time.perf_counter()
+                # Distinct topics per mode and run: every request is a cache miss.
+                response = client.post(f"{base_url}/api/generate-mindmap",
+                                       json={"topic": f"startup {mode} {run} {label}", "type": "simple"})
+                response.raise_for_status()
+                samples[label].append(time.perf_counter() - begun)
+            samples["rssMiB"].append(_tree_rss_mib(process.pid))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return {name: round(statistics.median(values), 4) for name, values in samples.items()}
+
+
+def print_imports(module: str, result: dict, top: int):
+    print(f"\nimport {module}: {result['totalUs'] / 1000:.1f} ms")
+    ranked = sorted(result["packages"].items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in ranked[:top]:
+        print(f"  {package:<24}{self_us / 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(MODULES), type=lambda v: [m for m in v.split(",") if m],
+                        help="comma-separated modules to import; '' skips the import breakdown")
+    parser.add_argument("--modes", default=",".join(MODES), type=lambda v: [m for m in v.split(",") if m],
+                        help=f"comma-separated, from {MODES}; '' skips the first-request timings")
+    parser.add_argument("--runs", type=int, default=3, help="imports keep the fastest run, requests the median")
+    parser.add_argument("--top", type=int, default=15, help="packages listed per module")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {"imports": {module: import_times(module, args.runs) for module in args.modules}, "modes": {}}
+
+    if args.modes:
+        image_server = start_image_server()
+        _, redis_url = _start_fake_redis()
+        configure_env(image_server.server_port, args.llm_latency, 1000, redis_url=redis_url)
+        logging.disable(logging.INFO)
+        for mode in args.modes:
+            results["modes"][mode] = first_requests(mode, args.runs)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for module, result in results["imports"].items():
+        print_imports(module, result, args.top)
+    if results["modes"]:
+        print(f"\n{'mode':<10}{'boot s':>9}{'first s':>9}{'second s':>10}{'RSS MiB':>9}")
+        for mode, result in results["modes"].items():
+            print(f"{mode:<10}{result['boot']:>9.3f}{result['first']:>9.3f}{result['second']:>10.3f}"
+                  f"{result['rssMiB']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
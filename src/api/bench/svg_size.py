@@ -0,0 +1,85 @@
+"""SVG payload sizes: as rendered, minified, and gzip/brotli-encoded as GET /api/svg stores them.
+
+Run from src/api:
+
+    python -m bench.svg_size                     # maps from the fake LLM, current renderer
+    python -m bench.svg_size --topics 50 --json
+    python -m bench.svg_size saved/*.svg         # SVGs saved from mmdc or the browser
+
+Without files, each topic's map comes from the fake LLM backend and is
+rendered with the configured renderer (MERMAID_NATIVE_RENDER, and
+MERMAID_RENDERER for everything the native renderer leaves to Chrome).
+The inline JSON payload of /api/generate-mindmap carries the "minified"
+size; a GET /api/svg response carries the gzip or brotli one, and a
+revalidated repeat view carries none.
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY", "0")
+
+from app.utils import precompress
+from app.utils.svg_minify import minify_svg
+
+
+def _rendered(topics: int) -> list:
+    from app.utils.gemini import query_gemini
+    from app.utils.svg import _render
+
+    return [(f"topic {i}", _render(query_gemini(f"Sample topic {i}", "simple"))) for i in range(topics)]
+
+
+def measure(name: str, svg: str) -> dict:
+    raw = svg.encode("utf-8")
+    started = time.perf_counter()
+    minified = minify_svg(svg).encode("utf-8")
+    minify_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    encoded = precompress.encodings(precompress.encode(minified))
+    encode_seconds = time.perf_counter() - started
+    return {
+        "name": name,
+        "raw": len(raw),
+        "minified": len(minified),
+        "gzip": len(encoded["gzip"]),
+        "br": len(encoded["br"]) if "br" in encoded else None,
+        "minifyMs": round(minify_seconds * 1000, 2),
+        "encodeMs": round(encode_seconds * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="SVG files; default renders --topics maps")
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.files:
+        inputs = []
+        for path in args.files:
+            with open(path, encoding="utf-8") as f:
+                inputs.append((os.path.basename(path), f.read()))
+    else:
+        inputs = _rendered(args.topics)
+    rows = [measure(name, svg) for name, svg in inputs]
+
+    totals = {key: sum(row[key] or 0 for row in rows) for key in ("raw", "minified", "gzip", "br")}
+    if args.json:
+        print(json.dumps({"items": rows, "totals": totals}, indent=2))
+        return
+    print(f"{'svg':<28}{'raw':>9}{'minified':>10}{'gzip':>8}{'br':>8}{'minify ms':>11}{'encode ms':>11}")
+    for row in rows:
+        br = row["br"] if row["br"] is not None else "-"
+        print(f"{row['name'][:27]:<28}{row['raw']:>9}{row['minified']:>10}{row['gzip']:>8}{br:>8}"
+              f"{row['minifyMs']:>11}{row['encodeMs']:>11}")
+    raw = totals["raw"] or 1
+    print(f"\n{len(rows)} SVGs: minified {totals['minified'] / raw:.1%} of raw, gzip {totals['gzip'] / raw:.1%}"
+          + (f", brotli {totals['br'] / raw:.1%}" if totals["br"] else " (brotli not installed)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""Test settings: everything runs against the in-process fake Redis and the fake LLM.
+
+Set before app is imported, since its settings are read at import time.
+"""
+import os
+
+os.environ.setdefault("REDIS_URL", "fakeredis://")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY", "0")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("FRONTEND_URL", "http://localhost:5173")
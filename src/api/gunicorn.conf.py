@@ -0,0 +1,60 @@
+"""Gunicorn settings for production, all overridable through the environment.
+
+    gunicorn -c src/api/gunicorn.conf.py server:app     # from the repository root
+
+Requests spend most of their time waiting on Gemini, image search and the
+renderer, so the default is a few processes with many threads each
+(gthread). GUNICORN_WORKER_CLASS=gevent swaps threads for greenlets; it
+needs `pip install gevent`. For the asyncio routes in asgi.py, run
+`GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker ... asgi:app`.
+
+Reloads: `kill -HUP <master>` starts fresh workers and retires the old ones
+after their in-flight requests. With preloading on, workers are forked from
+the already-imported app, so new code needs a binary upgrade instead:
+`kill -USR2 <master>` then `kill -QUIT <old master>`.
+"""
+import multiprocessing
+import os
+
+# The working directory stays at the repository root (puppeteer-config.json
+# is resolved from there); only the import path points at src/api.
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+# gevent workers handle this many concurrent connections each.
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+
+# Import the app once in the master so workers fork with it loaded and share
+# its memory pages. Redis pools, executors and renderer processes are all
+# created lazily, so each worker builds its own after the fork; post_fork
+# below makes sure nothing the master did create is shared.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Recycle workers (and the Node renderer processes they own) after this many
+# requests; the jitter keeps them from all restarting at once.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# Generations and SSE streams can legitimately run for a while.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# An empty GUNICORN_ACCESS_LOG turns access logging off.
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    from app import after_fork
+    after_fork()
+
+
+def worker_exit(server, worker):
+    # Shut the Node renderer processes down with the worker instead of leaving them to notice EOF.
+    from app.utils.renderer import close_renderer_pool
+    close_renderer_pool()
@@ -0,0 +1,216 @@
+"""Pre-warm the mind-map cache for popular topics, e.g. after a Redis flush.
+
+Run from src/api:
+
+    python prewarm.py --top 200                          # most looked-up topics
+    python prewarm.py --topics-file topics.txt --type analogy
+    python prewarm.py --top 50 --standins --llm-latency 0.2   # fake LLM, in-process Redis
+
+Topics come from a file (one per line, optionally "map type<TAB>topic") or
+from the lookup counts recorded by the cache (--top N). Maps already cached
+are skipped unless --force. Generation goes through query_gemini, and so
+through the LLM client's rate limit, with at most --concurrency calls in
+flight. SVGs are rendered in parallel in a process pool of
+--render-processes workers, and finished maps are written --batch at a
+time in one pipelined round-trip each. Each map gets its own TTL, spread
+over --ttl-spread of MIND_MAP_CACHE_TTL, so a warmed batch does not expire
+at once and cause the next stampede.
+
+Progress goes to stderr. Completed topics are recorded in --checkpoint
+after every batch; rerunning with the same checkpoint resumes where the
+last run stopped and retries the topics that failed. A run that finishes
+without failures removes the checkpoint. Topics are skipped only while
+their map is still cached, so the checkpoint matters for --force, where
+it keeps a resumed run from regenerating what the interrupted one did.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+logger = logging.getLogger("prewarm")
+
+# The topic map types clients request ("text" maps are keyed by their input text instead).
+MAP_TYPES = ("simple", "analogy")
+DEFAULT_TYPE = "simple"
+
+
+def read_topics(path: str, default_type: str) -> list:
+    topics = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            map_type, tab, topic = line.partition("\t")
+            topics.append((topic, map_type) if tab else (line, default_type))
+    return topics
+
+
+class Checkpoint:
+    """Cache keys done so far and the last error per failed key, saved atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done, self.failed = set(), {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.done = set(state.get("done", []))
+            self.failed = state.get("failed", {})
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"done": sorted(self.done), "failed": self.failed}, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.done = self.failed = 0
+        self.started = time.monotonic()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        finished = self.done + self.failed
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (self.total - finished) / rate if rate else 0.0
+        logger.info(f"[PREWARM] {finished}/{self.total} ({self.done} cached, {self.failed} failed), "
+                    f"{rate:.1f} maps/s, eta {eta:.0f}s")
+
+
+def _ttls(count: int, spread: float, base: int) -> list:
+    # Uniform over [base * (1 - spread), base]: never longer than a normal cache write.
+    return [max(int(base * (1 - spread * random.random())), 1) for _ in range(count)]
+
+
+def prewarm(todo: list, args, checkpoint: Checkpoint) -> Progress:
+    from app.utils.cache import MIND_MAP_TTL, bulk_cache_mind_maps, mind_map_key
+    from app.utils.gemini import query_gemini
+    from app.utils.svg import RENDER_OPTIONS, convert_mermaid_to_svg
+
+    progress = Progress(len(todo))
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        bulk_cache_mind_maps([entry for _, entry in batch], RENDER_OPTIONS,
+                             _ttls(len(batch), args.ttl_spread, MIND_MAP_TTL))
+        for key, _ in batch:
+            checkpoint.done.add(key)
+            checkpoint.failed.pop(key, None)
+        progress.done += len(batch)
+        batch.clear()
+        checkpoint.save()
+        progress.report()
+
+    def fail(key: str, stage: str, error: Exception):
+        logger.warning(f"[PREWARM] {stage} failed for {key}: {error}")
+        checkpoint.failed[key] = f"{stage}: {error}"
+        progress.failed += 1
+
+    # Spawned, not forked: this process has threads and open Redis connections.
+    renderers = ProcessPoolExecutor(args.render_processes, mp_context=multiprocessing.get_context("spawn"))
+    with ThreadPoolExecutor(args.concurrency, thread_name_prefix="prewarm-llm") as generators, renderers:
+        pending = {}
+        for topic, map_type in todo:
+            pending[generators.submit(query_gemini, topic, map_type)] = ("generate", topic, map_type, None)
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, topic, map_type, code = pending.pop(future)
+                key = mind_map_key(topic, map_type)
+                if future.exception() is not None:
+                    fail(key, stage, future.exception())
+                elif stage == "generate":
+                    code = future.result()
+                    pending[renderers.submit(convert_mermaid_to_svg, code)] = ("render", topic, map_type, code)
+                else:
+                    batch.append((key, (topic, map_type, code, future.result())))
+                    if len(batch) >= args.batch:
+                        flush()
+        flush()
+    checkpoint.save()
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--topics-file", help="one topic per line, or 'map type<TAB>topic'")
+    source.add_argument("--top", type=int, help="the N most looked-up topics")
+    parser.add_argument("--type", default=DEFAULT_TYPE, choices=MAP_TYPES,
+                        help="map type for --topics-file lines without one")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM calls in flight")
+    parser.add_argument("--render-processes", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--batch", type=int, default=50, help="maps per pipelined cache write")
+    parser.add_argument("--ttl-spread", type=float, default=0.25,
+                        help="fraction of MIND_MAP_CACHE_TTL over which expiries are spread")
+    parser.add_argument("--checkpoint", default="prewarm.checkpoint.json", help="'' disables resuming")
+    parser.add_argument("--force", action="store_true", help="regenerate maps that are already cached")
+    parser.add_argument("--standins", action="store_true",
+                        help="fake LLM and, unless REDIS_URL is set, an in-process fake Redis")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call with --standins")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    if args.standins:
+        # Before anything under app is imported: settings are read at import time.
+        from bench.standins import configure_env
+        configure_env(0, args.llm_latency, args.concurrency, redis_url=os.getenv("REDIS_URL") or "fakeredis://")
+
+    from app.utils.cache import TEXT_MAP_TYPES, cached_topics, mind_map_key, popular_topics
+
+    if args.top:
+        topics = [(topic, map_type) for topic, map_type, _ in popular_topics(args.top)]
+    else:
+        topics = read_topics(args.topics_file, args.type)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    todo, seen = [], set()
+    for topic, map_type in topics:
+        if map_type in TEXT_MAP_TYPES:
+            logger.warning(f"[PREWARM] skipping '{topic}': {map_type} maps are keyed by their input text")
+            continue
+        if map_type.strip().lower() not in MAP_TYPES:
+            logger.warning(f"[PREWARM] skipping '{topic}': no client requests {map_type!r} maps")
+            continue
+        key = mind_map_key(topic, map_type)
+        if key not in seen:
+            seen.add(key)
+            todo.append((topic, map_type))
+    cached = cached_topics(todo) if todo else []
+    # Checkpointed keys whose map has since been evicted or flushed are generated again.
+    resumed = sum(1 for pair, hit in zip(todo, cached) if hit and mind_map_key(*pair) in checkpoint.done)
+    if args.force:
+        todo = [pair for pair, hit in zip(todo, cached) if not (hit and mind_map_key(*pair) in checkpoint.done)]
+    else:
+        todo = [pair for pair, hit in zip(todo, cached) if not hit]
+
+    logger.info(f"[PREWARM] {len(topics)} topics, {len(todo)} to generate "
+                f"({resumed} done in an earlier run)")
+    progress = prewarm(todo, args, checkpoint)
+    logger.info(f"[PREWARM] finished: {progress.done} cached, {progress.failed} failed "
+                f"in {time.monotonic() - progress.started:.1f}s")
+    if not progress.failed:
+        checkpoint.remove()
+    sys.exit(1 if progress.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
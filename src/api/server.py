@@ -3,6 +3,7 @@ import os
 
 app = create_app()
 
+# Development server only; production runs gunicorn with gunicorn.conf.py.
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     debug_mode = os.getenv("FLASK_DEBUG", "false").lower() == "true"
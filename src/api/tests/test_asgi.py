@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+import asgi
+
+ORIGIN = os.environ["FRONTEND_URL"]
+
+
+def _request(cookie: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"cookie", cookie.encode())]})
+
+
+def _login(email: str) -> str:
+    """A session cookie for email, saved the way the Flask views save it."""
+    client = asgi.flask_app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = email
+    return client.get_cookie(asgi.flask_app.config["SESSION_COOKIE_NAME"]).value
+
+
+def test_session_user_reads_what_flask_saved():
+    cookie = _login("asgi@example.com")
+    name = asgi.flask_app.config["SESSION_COOKIE_NAME"]
+    assert asyncio.run(asgi._session_user(_request(f"{name}={cookie}"))) == "asgi@example.com"
+    assert asyncio.run(asgi._session_user(_request(f"{name}={cookie}x"))) is None
+    assert asyncio.run(asgi._session_user(_request(""))) is None
+
+
+@pytest.fixture
+def client():
+    with TestClient(asgi.app, base_url="https://testserver") as client:
+        yield client
+
+
+def test_async_routes_set_the_flask_headers(client):
+    response = client.get("/api/related-images", headers={"Origin": ORIGIN})
+    assert response.status_code == 400
+    assert "X-Redis-Round-Trips" in response.headers
+    assert response.headers["Access-Control-Allow-Origin"] == ORIGIN
+    assert response.headers["Access-Control-Allow-Credentials"] == "true"
+
+
+def test_flask_routes_keep_flask_cors(client):
+    preflight = client.options("/api/admin/sessions", headers={
+        "Origin": ORIGIN, "Access-Control-Request-Method": "GET",
+    })
+    assert preflight.headers["Access-Control-Allow-Origin"] == ORIGIN
+    # Starlette's preflight answer carries a Max-Age; Flask-CORS's (as configured) does not.
+    assert "Access-Control-Max-Age" not in preflight.headers
+    assert "Access-Control-Max-Age" in client.options("/api/generate-mindmap", headers={
+        "Origin": ORIGIN, "Access-Control-Request-Method": "POST",
+    }).headers
+
+    response = client.get("/api/mindmaps", headers={"Origin": ORIGIN})
+    assert response.headers["Access-Control-Expose-Headers"] == "X-Next-Cursor"
+    assert response.headers["Access-Control-Allow-Origin"] == ORIGIN
+
+
+@pytest.mark.parametrize("body", [["Photosynthesis", "simple"], "Photosynthesis", 3])
+def test_generate_rejects_non_object_body(client, body):
+    name = asgi.flask_app.config["SESSION_COOKIE_NAME"]
+    client.cookies.set(name, _login("asgi@example.com"))
+    response = client.post("/api/generate-mindmap", json=body)
+    assert response.status_code == 400
+    assert response.json() == {"error": "Expected a JSON object"}
@@ -0,0 +1,31 @@
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def client():
+    app = create_app()
+    with app.test_client() as client:
+        with client.session_transaction() as session:
+            session["user"] = "generate@example.com"
+        yield client
+
+
+@pytest.mark.parametrize("path", [
+    "/api/generate-mindmap",
+    "/api/generate-mindmap/async",
+    "/api/generate-mindmap/stream",
+    "/api/generate-mindmap/batch",
+])
+@pytest.mark.parametrize("body", [["Photosynthesis", "simple"], "Photosynthesis", 3, None])
+def test_non_object_body_is_a_bad_request(client, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Expected a JSON object"}
+
+
+def test_missing_fields_are_still_reported(client):
+    response = client.post("/api/generate-mindmap", json={"topic": "Photosynthesis"})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Missing fields"}
@@ -0,0 +1,139 @@
+import gzip
+import xml.etree.ElementTree as ET
+
+import pytest
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from app import create_app
+from app.utils import cache, precompress
+from app.utils.gemini import query_gemini
+from app.utils.svg import _render
+from app.utils.svg_minify import minify_svg
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg"><text>map</text></svg>'.encode()
+
+MERMAID_LIKE = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" viewBox="0.123456 -0.0001 100.98765 50.5">
+  <!-- generated -->
+  <metadata><rdf>x</rdf></metadata>
+  <style>
+    #m .node rect { fill : #fff ; }
+    #m .unused { stroke: red; }
+    #m .node rect { fill : #fff ; }
+    @media (min-width: 10px) { #m .node { opacity: 1; } }
+  </style>
+  <g class="node" transform="translate(10.5555, 20.4444)">
+    <rect width="30.33333" height="10.1"/>
+    <text x="1.23456"><tspan>A &amp; B</tspan> <tspan>&lt;C&gt;</tspan></text>
+  </g>
+  <g class="edge"><path d="M0.11111,0.22222 L10.33333,10.44444"/></g>
+</svg>
+"""
+
+
+def _accept(header):
+    return parse_accept_header(header, Accept)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("br, gzip", "br"),
+    ("gzip", "gzip"),
+    ("gzip;q=0, br", "br"),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_picks_accepted_encoding(header, expected):
+    found = {"gzip": gzip.compress(SVG), "br": b"brotli bytes"}
+    encoding, body = precompress.negotiate(found, _accept(header))
+    assert encoding == expected
+    assert body == {"br": b"brotli bytes", "gzip": found["gzip"], None: SVG}[expected]
+
+
+def test_negotiate_without_brotli_or_compression():
+    assert precompress.negotiate({"gzip": gzip.compress(SVG)}, _accept("br")) == (None, SVG)
+    assert precompress.negotiate({"identity": SVG}, _accept("gzip, br")) == (None, SVG)
+
+
+def test_encode_round_trips_at_both_levels():
+    for inline in (True, False):
+        blob = precompress.encode(SVG, inline)
+        assert precompress.decode(blob) == SVG
+        assert gzip.decompress(precompress.encodings(blob)["gzip"]) == SVG
+
+
+def _labels(svg: str) -> list:
+    """The text of every label, parsing svg as XML (so it fails on malformed output)."""
+    root = ET.fromstring(svg)
+    return ["".join(text.itertext()) for text in root.iter("{http://www.w3.org/2000/svg}text")]
+
+
+@pytest.mark.parametrize("svg", [MERMAID_LIKE] + [
+    _render(query_gemini(f"Sample topic {i}", "simple")) for i in range(3)
+], ids=["mermaid-like", "native-0", "native-1", "native-2"])
+def test_minified_svg_is_well_formed_and_keeps_text(svg):
+    minified = minify_svg(svg)
+    assert _labels(minified) == _labels(svg)
+    assert len(minified) < len(svg)
+
+
+def test_minify_keeps_used_rules_and_drops_the_rest():
+    minified = minify_svg(MERMAID_LIKE)
+    assert ".unused" not in minified and "<!--" not in minified and "<metadata" not in minified
+    assert minified.count("#m .node rect{fill:#fff}") == 1
+    assert "@media" in minified
+
+
+@pytest.fixture
+def client():
+    cache.rb.flushall()
+    app = create_app()
+    with app.test_client() as client:
+        yield client
+
+
+def _login(client):
+    with client.session_transaction() as session:
+        session["user"] = "svg@example.com"
+
+
+def _generate(client) -> dict:
+    _login(client)
+    response = client.post("/api/generate-mindmap", json={"topic": "Photosynthesis", "type": "simple"})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.mark.parametrize("etag", ['W/"{}"', '"{}"', '"other", W/"{}"'])
+def test_revalidation_answers_304_without_a_lookup(client, etag):
+    svg_id = "a" * 64
+    response = client.get(f"/api/svg/{svg_id}", headers={"If-None-Match": etag.format(svg_id)})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == f'W/"{svg_id}"'
+
+
+def test_svg_served_in_accepted_encoding(client):
+    result = _generate(client)
+    response = client.get(f"/api/svg/{result['svgId']}", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.data).decode() == result["svg"]
+
+    response = client.get(f"/api/svg/{result['svgId']}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_evicted_svg_is_rerendered_for_logged_in_users_only(client):
+    result = _generate(client)
+    cache.rb.hdel(cache.svg_tier.blobs_key, result["svgId"])
+
+    with client.session_transaction() as session:
+        session.clear()
+    assert client.get(f"/api/svg/{result['svgId']}").status_code == 404
+
+    _login(client)
+    response = client.get(f"/api/svg/{result['svgId']}")
+    assert response.status_code == 200
+    assert response.data.decode() == result["svg"]
+    assert cache.get_svg_encodings(result["svgId"]) is not None
@@ -0,0 +1,48 @@
+import pytest
+
+from app.utils.cache import TOPIC_FUZZY_THRESHOLD
+from app.utils.topics import TopicIndex, normalize_topic, typo_of
+
+
+def _index(*topics):
+    index = TopicIndex()
+    for topic in topics:
+        index.add(normalize_topic(topic))
+    return index
+
+
+@pytest.mark.parametrize("typed, cached", [
+    ("photosynthesys", "photosynthesis"),
+    ("mitochondira", "mitochondria"),
+    ("machine lerning", "machine learning"),
+])
+def test_typo_finds_cached_topic(typed, cached):
+    assert _index(cached).closest(normalize_topic(typed), TOPIC_FUZZY_THRESHOLD) == cached
+
+
+@pytest.mark.parametrize("typed, cached", [
+    ("world war 1", "world war 2"),
+    ("organic chemistry", "inorganic chemistry"),
+    ("typical", "atypical"),
+    ("world war i", "world war ii"),
+    ("pythagorean theorem", "pythagoras theorem"),
+])
+def test_different_topic_is_not_served(typed, cached):
+    assert _index(cached).closest(normalize_topic(typed), TOPIC_FUZZY_THRESHOLD) is None
+
+
+def test_typo_prefers_closest_match():
+    index = _index("photosynthesis", "photosynthesis in plants")
+    assert index.closest("photosynthesys", TOPIC_FUZZY_THRESHOLD) == "photosynthesis"
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("photosynthesis", "photosynthesys", True),
+    ("mitochondria", "mitochondira", True),
+    ("french revolution", "french revolutions", True),
+    ("world war 1", "world war 2", False),
+    ("organic chemistry", "inorganic chemistry", False),
+    ("linear algebra", "algebra", False),
+])
+def test_typo_of(a, b, expected):
+    assert typo_of(a, b) is expected
@@ -0,0 +1,31 @@
+from app.utils import session
+
+
+def _reset():
+    session.r.flushall()
+    session._index_ready = False
+
+
+def test_indexes_are_backfilled_on_first_read():
+    _reset()
+    for i in range(3):
+        session.r.hset(f"user:u{i}@example.com", mapping={
+            "google": "true",
+            "login_time": f"2026-01-0{i + 1}T10:00:00",
+            "last_active": f"2026-02-0{i + 1}T10:00:00",
+        })
+        session.r.hset(f"user:u{i}@example.com:mindmaps", mapping={"a": "{}", "b": "{}"})
+
+    assert session.user_counts() == {"totalUsers": 3, "onlineUsers": 0, "totalMindMaps": 6}
+    rows, cursor = session.users_page(None, 2)
+    assert [email for email, _, _ in rows] == ["u0@example.com", "u1@example.com"]
+    rows, cursor = session.users_page(cursor, 2)
+    assert [email for email, _, _ in rows] == ["u2@example.com"] and cursor is None
+
+
+def test_backfill_runs_once():
+    _reset()
+    session.user_counts()
+    session.r.hset("user:late@example.com", mapping={"google": "true"})
+    session._index_ready = False
+    assert session.user_counts()["totalUsers"] == 0
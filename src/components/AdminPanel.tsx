@@ -8,18 +8,35 @@ interface Session {
   ip: string;
   agent: string;
   login_time: string;
+  last_active: string;
   mindMapsUsed: number;
   mindMapLimit: number;
   status: string;
 }
 
+interface UserStats {
+  totalUsers: number;
+  onlineUsers: number;
+  totalMindMaps: number;
+}
+
 interface CacheKey {
   topic: string;
   map_type: string;
 }
 
+const SESSIONS_PAGE_SIZE = 100;
+
+const matchesSearch = (session: Session, term: string) =>
+  session.email.toLowerCase().includes(term) ||
+  session.name?.toLowerCase().includes(term) ||
+  session.ip.toLowerCase().includes(term);
+
 const AdminPanel: React.FC = () => {
   const [sessions, setSessions] = useState<Session[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
+  const [stats, setStats] = useState<UserStats | null>(null);
   const [filtered, setFiltered] = useState<Session[]>([]);
   const [error, setError] = useState<string | null>(null);
   const [loading, setLoading] = useState<boolean>(false);
@@ -35,14 +52,30 @@ const AdminPanel: React.FC = () => {
     fetchCacheKeys();
   }, []);
 
+  // One page at a time, oldest registration first; X-Next-Cursor is absent on the last page.
+  const fetchSessionsPage = async (cursor?: string) => {
+    const res = await axios.get<Session[]>(`${API_BASE}/admin/sessions`, {
+      params: { limit: SESSIONS_PAGE_SIZE, cursor },
+      withCredentials: true,
+    });
+    setNextCursor(res.headers['x-next-cursor'] ?? null);
+    return res.data;
+  };
+
+  const showSessions = (loaded: Session[]) => {
+    setSessions(loaded);
+    setFiltered(loaded.filter(session => matchesSearch(session, searchTerm)));
+  };
+
   const fetchSessions = async () => {
     setLoading(true);
     try {
-      const res = await axios.get(`${API_BASE}/admin/sessions`, {
-        withCredentials: true,
-      });
-      setSessions(res.data);
-      setFiltered(res.data);
+      const [page, counts] = await Promise.all([
+        fetchSessionsPage(),
+        axios.get<UserStats>(`${API_BASE}/admin/stats`, { withCredentials: true }),
+      ]);
+      showSessions(page);
+      setStats(counts.data);
       setError(null);
     } catch {
       setError('Failed to fetch sessions');
@@ -51,6 +84,20 @@ const AdminPanel: React.FC = () => {
     }
   };
 
+  const loadMoreSessions = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchSessionsPage(nextCursor);
+      showSessions([...sessions, ...page]);
+      setError(null);
+    } catch {
+      setError('Failed to fetch more sessions');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchCacheKeys = async () => {
     setCacheLoading(true);
     try {
@@ -113,11 +160,7 @@ const AdminPanel: React.FC = () => {
   const handleSearch = (e: React.ChangeEvent<HTMLInputElement>) => {
     const term = e.target.value.toLowerCase();
     setSearchTerm(term);
-    setFiltered(sessions.filter(session =>
-      session.email.toLowerCase().includes(term) ||
-      session.name?.toLowerCase().includes(term) ||
-      session.ip.toLowerCase().includes(term)
-    ));
+    setFiltered(sessions.filter(session => matchesSearch(session, term)));
   };
 
   return (
@@ -142,11 +185,16 @@ const AdminPanel: React.FC = () => {
             <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M17 20h5v-2a3 3 0 00-5.356-1.857M17 20H7m10 0v-2c0-.656-.126-1.283-.356-1.857M7 20H2v-2a3 3 0 015.356-1.857M7 20v-2c0-.656.126-1.283.356-1.857m0 0a5.002 5.002 0 019.288 0M15 7a3 3 0 11-6 0 3 3 0 016 0zm6 3a2 2 0 11-4 0 2 2 0 014 0zM7 10a2 2 0 11-4 0 2 2 0 014 0z" />
           </svg>
           <span className="text-blue-800 font-medium">Active Users:</span>
-          <span className="text-blue-900 font-bold">{filtered.length}</span>
-          <span className="text-blue-800 ml-3">
-            (🟢 {filtered.filter(u => u.status === 'online').length} online /
-            ⚪ {filtered.filter(u => u.status !== 'online').length} offline)
-          </span>
+          <span className="text-blue-900 font-bold">{stats ? stats.totalUsers : filtered.length}</span>
+          {stats && (
+            <span className="text-blue-800 ml-3">
+              (🟢 {stats.onlineUsers} online /
+              ⚪ {stats.totalUsers - stats.onlineUsers} offline)
+            </span>
+          )}
+          {nextCursor && (
+            <span className="text-blue-700 ml-3">showing {sessions.length}</span>
+          )}
       </div>
 
       {/* Search */}
@@ -235,6 +283,18 @@ const AdminPanel: React.FC = () => {
         </div>
       )}
 
+      {nextCursor && !loading && (
+        <div className="text-center mt-4">
+          <button
+            onClick={loadMoreSessions}
+            disabled={loadingMore}
+            className="bg-gray-100 hover:bg-gray-200 text-gray-800 px-4 py-2 rounded-md text-sm border border-gray-300 transition disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more users'}
+          </button>
+        </div>
+      )}
+
       {/* Cached Maps */}
       <div className="mt-10 p-6 rounded-lg shadow-md border border-gray-200">
         <div className="flex flex-col sm:flex-row justify-between items-start sm:items-center mb-4 gap-3">
@@ -6,12 +6,14 @@ export interface ImageResult {
 export interface MindMapResponse {
   mermaidCode: string;
   svg?: string;
+  svgId?: string;
 }
 
 export interface MindMapRequest {
   topic: string;
   type: 'simple' | 'analogy' | 'text';
   text?: string;
+  inlineSvg?: boolean;
 }
 
 export interface ApiError {